@@ -0,0 +1,173 @@
+"""Admission control for expensive requests
+
+Work is split into pools by its estimated cost: `light` for interactive
+requests with small bodies, `heavy` for large uploads, raw transcript
+streams and batches. Each pool has a number of slots; a request takes
+one slot per COST_UNIT_BYTES of body (at least one, at most the whole
+pool), so a 200 MB upload runs alone in the heavy pool while small
+analyses keep their own slots and never wait behind it.
+
+A request that does not fit waits in its pool's queue, which is bounded
+and served round-robin across clients, so one client queuing many
+requests cannot hold back the others. A request is turned away at once,
+with a Retry-After estimated from recent hold times, when its client
+already has too many requests queued (429), when the queue is full
+(503), or after waiting for a slot longer than the pool's deadline (503).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+LIGHT = 'light'
+HEAVY = 'heavy'
+
+# Bodies up to this size are interactive work
+LIGHT_MAX_BYTES = 1024 * 1024
+# A heavy request takes one slot per this many bytes of body
+COST_UNIT_BYTES = 32 * 1024 * 1024
+
+def estimate(size, heavy=False):
+    """Return (pool, slots) for a request from its body size (None if unknown)
+
+    heavy marks work that is expensive whatever its size (batches, streams);
+    bodies of unknown length, such as a chunked raw transcript, count as heavy.
+    """
+    if heavy or size is None or size > LIGHT_MAX_BYTES:
+        return HEAVY, 1 + (size or 0) // COST_UNIT_BYTES
+    return LIGHT, 1
+
+class Rejected(Exception):
+    """A request was not admitted to a pool; status is 429 or 503"""
+
+    def __init__(self, pool, status, message, retry_after):
+        super().__init__(message)
+        self.pool = pool
+        self.status = status
+        self.retry_after = retry_after
+
+class Ticket:
+    """Slots held by an admitted request until release()"""
+
+    def __init__(self, pool, slots, waited):
+        self.pool = pool
+        self.slots = slots
+        self.waited = waited
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        """Give the slots back (only the first call counts)"""
+        if not self.released:
+            self.released = True
+            self.pool.release(self.slots, time.monotonic() - self.started)
+
+class _Waiter:
+    def __init__(self, slots):
+        self.slots = slots
+        self.event = threading.Event()
+        self.granted = False
+
+class Pool:
+    """Weighted slots for one class of work, with a bounded wait queue served round-robin by client"""
+
+    def __init__(self, name, slots, max_queue=64, max_wait=10.0, client_queue=8):
+        self.name = name
+        self.slots = slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.client_queue = client_queue
+        self.used = 0
+        self.queued = 0
+        # client -> its waiters, in the order clients take turns
+        self.waiting = OrderedDict()
+        self.lock = threading.Lock()
+        self.hold_time = 0.1
+        self.counts = {'admitted': 0, 'queued': 0, 'client_limit': 0, 'queue_full': 0, 'timeout': 0}
+
+    def acquire(self, client, slots=1):
+        """Take slots for client, waiting up to max_wait; return a Ticket or raise Rejected"""
+        slots = min(max(1, slots), self.slots)
+        started = time.monotonic()
+        with self.lock:
+            if not self.waiting and self.used + slots <= self.slots:
+                self.used += slots
+                self.counts['admitted'] += 1
+                return Ticket(self, slots, 0.0)
+            if len(self.waiting.get(client, ())) >= self.client_queue:
+                self.counts['client_limit'] += 1
+                raise Rejected(self.name, 429, "Too many requests from this client are waiting", self._retry_after())
+            if self.queued >= self.max_queue:
+                self.counts['queue_full'] += 1
+                raise Rejected(self.name, 503, "Server is busy", self._retry_after())
+            waiter = _Waiter(slots)
+            self.waiting.setdefault(client, deque()).append(waiter)
+            self.queued += 1
+            self.counts['queued'] += 1
+
+        waiter.event.wait(self.max_wait)
+        with self.lock:
+            if not waiter.granted:
+                queue = self.waiting[client]
+                queue.remove(waiter)
+                if not queue:
+                    del self.waiting[client]
+                self.queued -= 1
+                self.counts['timeout'] += 1
+                # A large request giving up may let smaller ones behind it in
+                self._grant()
+                raise Rejected(self.name, 503, "Timed out waiting for capacity", self._retry_after())
+            self.counts['admitted'] += 1
+        return Ticket(self, slots, time.monotonic() - started)
+
+    def release(self, slots, held):
+        with self.lock:
+            self.used -= slots
+            self.hold_time += 0.2 * (held - self.hold_time)
+            self._grant()
+
+    def stats(self):
+        """Return slots in use, queued requests and admission outcomes"""
+        with self.lock:
+            return dict(self.counts, slots=self.slots, used=self.used, waiting=self.queued,
+                        clients=len(self.waiting))
+
+    def _grant(self):
+        # Clients take turns; a waiter that does not fit yet holds its turn
+        # so large requests are not starved by a stream of small ones
+        while self.waiting:
+            client, queue = next(iter(self.waiting.items()))
+            waiter = queue[0]
+            if self.used + waiter.slots > self.slots:
+                return
+            queue.popleft()
+            if queue:
+                self.waiting.move_to_end(client)
+            else:
+                del self.waiting[client]
+            self.queued -= 1
+            self.used += waiter.slots
+            waiter.granted = True
+            waiter.event.set()
+
+    def _retry_after(self):
+        """Seconds until the queue ahead has likely drained, from the average hold time"""
+        return max(1, min(60, math.ceil(self.hold_time * (self.queued + 1) / self.slots)))
+
+class AdmissionController:
+    """The light and heavy pools"""
+
+    def __init__(self, light_slots=16, heavy_slots=2, max_queue=64, max_wait=10.0, client_queue=8):
+        self.pools = {
+            LIGHT: Pool(LIGHT, light_slots, max_queue, max_wait, client_queue),
+            HEAVY: Pool(HEAVY, heavy_slots, max_queue, max_wait, client_queue),
+        }
+
+    def admit(self, client, size, heavy=False):
+        """Admit a request by its estimated cost; return a Ticket or raise Rejected"""
+        pool, slots = estimate(size, heavy)
+        return self.pools[pool].acquire(client, slots)
+
+    def stats(self):
+        """Return the state of each pool"""
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -1,117 +1,232 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Request, render_template, request, jsonify, Response, g, stream_with_context
 import re
 import json
 import os
 from datetime import datetime
 import random
+import codecs
+import gzip
+import io
+import threading
+import time
+import uuid
+import shutil
+import tempfile
+from array import array
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+import admission
+from cache import AnalysisCache
+import metrics
+from metrics import span
+import responses
+from rules import RulePacks
+from transcripts import TranscriptHandles
+from jobs import JobQueue
+
+# Subsystems only some requests need (batch, JSON extraction, vCon parsing,
+# media transcription, YouTube, the search store, the similarity index) are
+# imported on first use, so a cold start only pays for the analyzers.
 
 app = Flask(__name__)
-
-# Ensure the uploads directory exists
-os.makedirs('uploads', exist_ok=True)
-
-def detect_tech_conversation(text):
+# orjson encodes jsonify() output when it is installed
+app.json = responses.json_provider_class()(app)
+
+# Largest accepted request body; Flask answers bigger requests with 413
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 512 * 1024 * 1024))
+
+# Largest raw transcript body /analyze streams (0: same as MAX_CONTENT_LENGTH)
+MAX_STREAM_BYTES = int(os.environ.get('MAX_STREAM_BYTES', 0))
+
+# Directory for uploads that have to be spilled to disk (created when first needed)
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'uploads')
+
+# Keyword tables and decision rules live in rule packs (rulepacks/*.json);
+# each request uses the default pack unless it names another one.
+RULE_PACK_DIR = os.environ.get('RULE_PACK_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rulepacks'))
+DEFAULT_RULE_PACK = os.environ.get('RULE_PACK', 'default')
+
+rule_packs = RulePacks(RULE_PACK_DIR, default=DEFAULT_RULE_PACK)
+if rule_packs.get() is None:
+    raise RuntimeError(f"Rule pack {DEFAULT_RULE_PACK!r} not found in {RULE_PACK_DIR}")
+
+# One non-blank line: optional "[timestamp]", optional "speaker:" and the rest
+TURN_REGEX = re.compile(r'^\s*((?:\[([^\]\n]*)\])?(?:([^:\n]*):)?(?:[^\n]*\S)?)', re.M)
+TIMELINE_REGEX = re.compile(r'(\d+)\s*(week|month|day)s?', re.IGNORECASE)
+TIMELINE_TAIL_REGEX = re.compile(r'\d+\s*\Z')
+
+def scan_keywords(text, text_lower=None, pack=None):
+    """Return the keyword hits of text for all decision tables of a rule pack"""
+    pack = pack or rule_packs.get()
+    with span('keywords'):
+        return pack.scan(text.lower() if text_lower is None else text_lower)
+
+def _first_rule(hits, rules, default):
+    """Return the label of the first rule with a keyword hit"""
+    for keywords, label in rules:
+        if any(keyword in hits for keyword in keywords):
+            return label
+    return default
+
+def _all_rules(hits, rules):
+    """Return the labels of every rule with a keyword hit"""
+    return [label for keywords, label in rules if any(keyword in hits for keyword in keywords)]
+
+def _step_value(count, steps, default):
+    """Return the value of the highest (threshold, value) step count exceeds"""
+    for threshold, value in steps:
+        if count > threshold:
+            return value
+    return default
+
+def detect_tech_conversation(text, hits=None, pack=None):
     """Detect if the conversation is tech/SDLC related"""
-    tech_keywords = [
-        'app', 'application', 'software', 'development', 'code', 'programming',
-        'database', 'api', 'website', 'web', 'mobile', 'ios', 'android',
-        'system', 'platform', 'server', 'cloud', 'deployment', 'testing',
-        'ui', 'ux', 'frontend', 'backend', 'framework', 'integration',
-        'authentication', 'security', 'scalable', 'architecture', 'design',
-        'requirements', 'specifications', 'sprint', 'agile', 'scrum',
-        'repository', 'git', 'version', 'build', 'deploy', 'devops',
-        'bug', 'feature', 'functionality', 'performance', 'optimization'
-    ]
+    pack = pack or rule_packs.get()
+    if hits is None and pack.classifier is None:
+        hits = scan_keywords(text, pack=pack)
+    return classify_conversation(text.lower() if pack.classifier else None, hits, pack)[0]
+
+def classify_conversation(text_lower, hits, pack, features=None):
+    """Return (is_tech, confidence) for a conversation
+
+    With a classifier in the rule pack the decision comes from the model's
+    probability (computed from features, the hashed n-gram counts, when
+    given) and confidence is the probability of the chosen type; otherwise
+    the keyword rules decide and confidence is None.
+    """
+    if pack.classifier is None:
+        return pack.is_tech(hits), None
+    with span('classify'):
+        if features is None:
+            probability = pack.classifier.score(text_lower)
+        else:
+            probability = pack.classifier.score_counts(features)
+    tech = probability >= pack.classifier_threshold
+    return tech, round(probability if tech else 1 - probability, 4)
+
+Turn = namedtuple('Turn', 'speaker timestamp start body end')
+
+class TranscriptIndex:
+    """A transcript parsed once into speaker turns, shared by every extractor
+
+    Each non-blank line is a turn, stored column-wise: `turn_speakers` holds
+    an index into the interned `speakers` table (in order of first
+    appearance) or -1, `timestamps` the text of a leading "[...]" prefix
+    such as "[00:00:15]" or None, and `starts`, `bodies` and `ends` offsets
+    into `text` of the stripped line and of the text after the speaker's
+    colon. Iterating yields Turn tuples.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.speakers = []
+        self.speaker_index = {}
+        self.turn_speakers = array('l')
+        self.timestamps = []
+        self.starts = array('l')
+        self.bodies = array('l')
+        self.ends = array('l')
+        self._lower = None
+        for match in TURN_REGEX.finditer(text):
+            start, end = match.span(1)
+            if start == end:
+                continue
+            timestamp, speaker = match.group(2, 3)
+            body = start
+            speaker_id = -1
+            if speaker is not None:
+                body = match.end(3) + 1
+                # A line starting with ":" has no speaker
+                if timestamp is not None or speaker:
+                    speaker = speaker.strip()
+                    if len(speaker) < 50:
+                        speaker_id = self.speaker_index.get(speaker)
+                        if speaker_id is None:
+                            speaker_id = self.speaker_index[speaker] = len(self.speakers)
+                            self.speakers.append(speaker)
+            self.turn_speakers.append(speaker_id)
+            self.timestamps.append(timestamp)
+            self.starts.append(start)
+            self.bodies.append(body)
+            self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return map(Turn, self.turn_speakers, self.timestamps, self.starts, self.bodies, self.ends)
+
+    def lower(self):
+        """Return the lowercased text, computed once"""
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    def action_items(self, pattern):
+        """Return the action items (turns matching pattern) in order"""
+        text = self.text
+        lower = self.lower()
+        # Offsets only carry over to the lowercased text if no character changed length
+        aligned = len(lower) == len(text)
+        actions = []
+        for start, body, end in zip(self.starts, self.bodies, self.ends):
+            if aligned:
+                found = pattern.search(lower, start, end)
+            else:
+                found = pattern.search(text[start:end].lower())
+            if found:
+                action = text[body:end].strip()
+                if len(action) > 10 and len(action) < 200:
+                    actions.append(action)
+        return actions
+
+def find_timeline_mention(text):
+    """Return the first (value, unit) duration mentioned in text, or None"""
+    match = TIMELINE_REGEX.search(text)
+    return match.groups() if match else None
+
+def generate_tech_analysis(text, hits=None, index=None, pack=None):
+    """Generate tech project analysis"""
+    pack = pack or rule_packs.get()
+    if index is None:
+        with span('turns'):
+            index = TranscriptIndex(text)
+    if hits is None:
+        hits = scan_keywords(text, index.lower(), pack)
 
-    text_lower = text.lower()
-    tech_count = sum(1 for keyword in tech_keywords if keyword in text_lower)
+    # Identify stakeholders
+    stakeholders = list(index.speakers)
 
-    return tech_count >= 3
+    with span('timeline'):
+        timeline_mention = find_timeline_mention(text)
 
-def generate_tech_analysis(text):
-    """Generate tech project analysis"""
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    with span('build'):
+        return build_tech_analysis(stakeholders, hits, timeline_mention, pack)
 
-    # Identify stakeholders
-    stakeholders = []
-    stakeholder_regex = r'^([^:]+):'
-    for line in lines:
-        match = re.search(stakeholder_regex, line)
-        if match:
-            stakeholder = match.group(1).strip()
-            stakeholder = re.sub(r'^\[.*?\]\s*', '', stakeholder)
-            if stakeholder not in stakeholders and len(stakeholder) < 50:
-                stakeholders.append(stakeholder)
+def build_tech_analysis(stakeholders, hits, timeline_mention=None, pack=None):
+    """Build the tech project analysis from the facts extracted from a transcript"""
+    pack = pack or rule_packs.get()
 
     # Extract project type and generate title
-    project_title = "Digital Project"
-    text_lower = text.lower()
-
-    if any(keyword in text_lower for keyword in ['mobile app', 'ios', 'android']):
-        project_title = "Mobile Application Development"
-    elif any(keyword in text_lower for keyword in ['website', 'web app', 'e-commerce']):
-        project_title = "Web Platform Development"
-    elif any(keyword in text_lower for keyword in ['crm', 'customer relationship']):
-        project_title = "CRM System Implementation"
-    elif any(keyword in text_lower for keyword in ['dashboard', 'analytics']):
-        project_title = "Analytics Dashboard Development"
-    elif any(keyword in text_lower for keyword in ['api', 'integration']):
-        project_title = "System Integration Project"
-    elif any(keyword in text_lower for keyword in ['database', 'data']):
-        project_title = "Data Management System"
+    project_title = _first_rule(hits, pack.project_title_rules, pack.default_project_title)
 
     # Extract requirements using keyword detection
     requirements = []
-    requirement_keywords = {
-        'mobile': 'Mobile application development',
-        'ios': 'iOS platform support',
-        'android': 'Android platform support',
-        'web': 'Web platform development',
-        'database': 'Database design and implementation',
-        'api': 'API development and integration',
-        'authentication': 'User authentication system',
-        'payment': 'Payment processing integration',
-        'dashboard': 'Administrative dashboard',
-        'reporting': 'Reporting and analytics features',
-        'user management': 'User management system',
-        'notification': 'Notification system',
-        'search': 'Search functionality',
-        'integration': 'Third-party system integration',
-        'security': 'Security implementation',
-        'responsive': 'Responsive design',
-        'real-time': 'Real-time data processing',
-        'cloud': 'Cloud infrastructure setup',
-        'backup': 'Data backup and recovery',
-        'scalable': 'Scalable architecture design'
-    }
-
-    for keyword, requirement in requirement_keywords.items():
-        if keyword in text_lower and requirement not in requirements:
+    for keyword, requirement in pack.requirements:
+        if keyword in hits and requirement not in requirements:
             requirements.append(requirement)
 
     if not requirements:
-        requirements = [
-            'System architecture design',
-            'User interface development',
-            'Database implementation',
-            'Testing and quality assurance',
-        ]
+        requirements = list(pack.default_requirements)
 
     # Generate timeline based on project complexity
     complexity = len(requirements)
-    total_weeks = 8
-
-    if complexity > 10:
-        total_weeks = 16
-    elif complexity > 7:
-        total_weeks = 12
-    elif complexity > 5:
-        total_weeks = 10
-
-    # Extract timeline mentions from text
-    timeline_matches = re.findall(r'(\d+)\s*(week|month|day)s?', text, re.IGNORECASE)
-    if timeline_matches:
-        time_value, time_unit = timeline_matches[0]
+    total_weeks = _step_value(complexity, pack.week_steps, pack.default_weeks)
+
+    # Use the first timeline mention from the text
+    if timeline_mention:
+        time_value, time_unit = timeline_mention
         time_value = int(time_value)
         if 'month' in time_unit.lower():
             total_weeks = time_value * 4
@@ -121,211 +236,94 @@ def generate_tech_analysis(text):
     # Generate phase-specific tasks
     phases = [
         {
-            "phase": "Requirements Gathering",
-            "tasks": [
-                "Conduct stakeholder interviews",
-                "Document functional requirements",
-                "Create user stories and acceptance criteria",
-                "Define technical specifications",
-                "Establish project scope and constraints"
-            ],
-            "duration": f"{max(1, round(total_weeks * 0.15))} weeks",
-            "priority": "High",
-            "color": "blue"
-        },
-        {
-            "phase": "Design & Planning",
-            "tasks": [
-                "Create system architecture design",
-                "Develop UI/UX wireframes and mockups",
-                "Design database schema",
-                "Plan development sprints",
-                "Set up project infrastructure"
-            ],
-            "duration": f"{max(1, round(total_weeks * 0.2))} weeks",
-            "priority": "High",
-            "color": "purple"
-        },
-        {
-            "phase": "Development",
-            "tasks": [
-                "Set up development environment",
-                "Implement core functionality",
-                "Develop user interface components",
-                "Build backend services and APIs",
-                "Integrate third-party services"
-            ],
-            "duration": f"{max(1, round(total_weeks * 0.45))} weeks",
-            "priority": "Critical",
-            "color": "green"
-        },
-        {
-            "phase": "Testing",
-            "tasks": [
-                "Unit testing implementation",
-                "Integration testing",
-                "User acceptance testing",
-                "Performance and load testing",
-                "Security testing and validation"
-            ],
-            "duration": f"{max(1, round(total_weeks * 0.15))} weeks",
-            "priority": "High",
-            "color": "orange"
-        },
-        {
-            "phase": "Deployment",
-            "tasks": [
-                "Production environment setup",
-                "Deployment automation",
-                "Go-live support and monitoring",
-                "User training and documentation",
-                "Post-launch support planning"
-            ],
-            "duration": f"{max(1, round(total_weeks * 0.05))} weeks",
-            "priority": "High",
-            "color": "red"
+            "phase": phase["phase"],
+            "tasks": list(phase["tasks"]),
+            "duration": f"{max(1, round(total_weeks * phase['share']))} weeks",
+            "priority": phase["priority"],
+            "color": phase["color"]
         }
+        for phase in pack.phases
     ]
 
     # Generate risk factors
     risk_factors = []
 
-    if any(keyword in text_lower for keyword in ['tight', 'urgent', 'asap']):
-        risk_factors.append("Aggressive timeline may require additional resources or scope reduction")
+    for groups, risk in pack.risk_rules:
+        if all(any(keyword in hits for keyword in group) for group in groups):
+            risk_factors.append(risk)
 
-    if 'budget' in text_lower and 'limited' in text_lower:
-        risk_factors.append("Budget constraints may impact feature scope or timeline")
-
-    if 'integration' in text_lower or 'legacy' in text_lower:
-        risk_factors.append("Legacy system integration complexity may cause delays")
-
-    if 'compliance' in text_lower or 'regulation' in text_lower:
-        risk_factors.append("Regulatory compliance requirements need careful validation")
-
-    if len(stakeholders) > 5:
-        risk_factors.append("Multiple stakeholders may require additional coordination and communication")
+    if pack.stakeholder_risk and len(stakeholders) > pack.stakeholder_risk[0]:
+        risk_factors.append(pack.stakeholder_risk[1])
 
     if not risk_factors:
-        risk_factors = [
-            "Scope creep during development phase",
-            "Third-party service dependencies may cause integration challenges",
-            "User acceptance testing may reveal additional requirements"
-        ]
+        risk_factors = list(pack.default_risks)
 
     return {
         "type": "tech",
         "projectTitle": project_title,
-        "stakeholders": stakeholders if stakeholders else ["Client", "Project Team"],
+        "stakeholders": stakeholders if stakeholders else list(pack.default_stakeholders),
         "requirements": requirements,
         "todos": phases,
         "timeline": f"{total_weeks} weeks total",
         "riskFactors": risk_factors
     }
 
-def generate_general_analysis(text):
+def generate_general_analysis(text, hits=None, index=None, pack=None):
     """Generate general todo list analysis"""
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    pack = pack or rule_packs.get()
+    if index is None:
+        with span('turns'):
+            index = TranscriptIndex(text)
+    if hits is None:
+        hits = scan_keywords(text, index.lower(), pack)
 
     # Identify participants
-    participants = []
-    participant_regex = r'^([^:]+):'
-    for line in lines:
-        match = re.search(participant_regex, line)
-        if match:
-            participant = match.group(1).strip()
-            participant = re.sub(r'^\[.*?\]\s*', '', participant)
-            if participant not in participants and len(participant) < 50:
-                participants.append(participant)
-
-    # Determine conversation type
-    text_lower = text.lower()
-    conversation_title = "General Discussion"
-
-    if any(keyword in text_lower for keyword in ['meeting', 'agenda', 'minutes']):
-        conversation_title = "Team Meeting"
-    elif any(keyword in text_lower for keyword in ['event', 'party', 'celebration', 'wedding']):
-        conversation_title = "Event Planning"
-    elif any(keyword in text_lower for keyword in ['business', 'strategy', 'plan', 'goals']):
-        conversation_title = "Business Planning"
-    elif any(keyword in text_lower for keyword in ['project', 'task', 'deadline']):
-        conversation_title = "Project Discussion"
-    elif any(keyword in text_lower for keyword in ['budget', 'finance', 'cost', 'money']):
-        conversation_title = "Financial Planning"
-    elif any(keyword in text_lower for keyword in ['travel', 'trip', 'vacation']):
-        conversation_title = "Travel Planning"
+    participants = list(index.speakers)
 
     # Extract action items
-    action_items = []
-    action_keywords = ['need to', 'should', 'must', 'have to', 'will', 'going to', 'plan to', 'decide', 'contact', 'call', 'email', 'schedule', 'book', 'order', 'buy', 'prepare', 'organize', 'arrange']
+    with span('actions'):
+        action_items = index.action_items(pack.action_regex)
 
-    for line in lines:
-        line_lower = line.lower()
-        if any(keyword in line_lower for keyword in action_keywords):
-            # Clean up the line and extract the action
-            action = re.sub(r'^[^:]*:', '', line).strip()
-            if len(action) > 10 and len(action) < 200:
-                action_items.append(action)
+    with span('build'):
+        return build_general_analysis(participants, hits, action_items[:10], len(action_items), pack)
+
+def build_general_analysis(participants, hits, action_items, action_count=None, pack=None):
+    """Build the general todo list analysis from the facts extracted from a transcript"""
+    pack = pack or rule_packs.get()
+
+    # Determine conversation type
+    conversation_title = _first_rule(hits, pack.conversation_title_rules, pack.default_conversation_title)
+
+    if action_count is None:
+        action_count = len(action_items)
 
     # If no specific actions found, generate generic ones
     if not action_items:
-        action_items = [
-            "Follow up on discussed topics",
-            "Schedule next meeting or check-in",
-            "Review and confirm decisions made",
-            "Prepare materials for next steps",
-            "Communicate updates to relevant parties"
-        ]
+        action_items = list(pack.default_action_items)
+        action_count = len(action_items)
 
     # Categorize items
-    categories = []
-    if any(keyword in text_lower for keyword in ['meeting', 'call', 'discuss']):
-        categories.append("Communication")
-    if any(keyword in text_lower for keyword in ['plan', 'organize', 'schedule']):
-        categories.append("Planning")
-    if any(keyword in text_lower for keyword in ['research', 'find', 'look up']):
-        categories.append("Research")
-    if any(keyword in text_lower for keyword in ['buy', 'order', 'purchase']):
-        categories.append("Procurement")
-    if any(keyword in text_lower for keyword in ['prepare', 'create', 'make']):
-        categories.append("Preparation")
-    if any(keyword in text_lower for keyword in ['review', 'check', 'verify']):
-        categories.append("Review")
+    categories = _all_rules(hits, pack.category_rules)
 
     if not categories:
-        categories = ["General Tasks", "Follow-up"]
+        categories = list(pack.default_categories)
 
     # Determine priorities
-    priorities = []
-    if any(keyword in text_lower for keyword in ['urgent', 'asap', 'immediately', 'critical']):
-        priorities.append("High Priority - Urgent items requiring immediate attention")
-    if any(keyword in text_lower for keyword in ['important', 'key', 'crucial', 'essential']):
-        priorities.append("Important - Key items for project success")
-    if any(keyword in text_lower for keyword in ['later', 'eventually', 'when possible']):
-        priorities.append("Low Priority - Items to address when time permits")
+    priorities = _all_rules(hits, pack.priority_rules)
 
     if not priorities:
-        priorities = ["Normal Priority - Standard follow-up items"]
+        priorities = list(pack.default_priorities)
 
     # Generate next steps
-    next_steps = [
-        "Review all action items and assign responsibilities",
-        "Set deadlines for each identified task",
-        "Schedule follow-up meeting or check-in",
-        "Begin work on highest priority items",
-        "Communicate progress to all stakeholders"
-    ]
+    next_steps = list(pack.next_steps)
 
     # Estimate timeline
-    timeline = "1-2 weeks"
-    if len(action_items) > 10:
-        timeline = "3-4 weeks"
-    elif len(action_items) > 5:
-        timeline = "2-3 weeks"
+    timeline = _step_value(action_count, pack.timeline_steps, pack.default_timeline)
 
     return {
         "type": "general",
         "conversationTitle": conversation_title,
-        "participants": participants if participants else ["Participant 1", "Participant 2"],
+        "participants": participants if participants else list(pack.default_participants),
         "actionItems": action_items[:10],  # Limit to 10 items
         "categories": categories,
         "priorities": priorities,
@@ -333,106 +331,395 @@ def generate_general_analysis(text):
         "timeline": timeline
     }
 
-def generate_analysis_from_transcript(text):
+def generate_analysis_from_transcript(text, index=None, pack=None):
     """Main analysis function that routes to tech or general analysis"""
-    if detect_tech_conversation(text):
-        return generate_tech_analysis(text)
+    pack = pack or rule_packs.get()
+    if index is None:
+        with span('turns'):
+            index = TranscriptIndex(text)
+    hits = scan_keywords(text, index.lower(), pack)
+    tech, confidence = classify_conversation(index.lower(), hits, pack)
+    if tech:
+        analysis = generate_tech_analysis(text, hits, index, pack)
+    else:
+        analysis = generate_general_analysis(text, hits, index, pack)
+    if confidence is not None:
+        analysis["confidence"] = confidence
+    return analysis
+
+def analyze_with_rule_pack(name, text):
+    """Analyze text with the rule pack called name (picklable for worker processes)"""
+    return generate_analysis_from_transcript(text, pack=rule_packs.get(name))
+
+# Bump whenever analysis output changes so cached results are invalidated
+ANALYZER_VERSION = '3'
+
+analysis_cache = AnalysisCache(
+    ANALYZER_VERSION,
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('ANALYSIS_CACHE_TTL', 3600)),
+    path=os.environ.get('ANALYSIS_CACHE_PATH'),
+)
+
+# Searchable store of every analysis made by /analyze (off unless a path is set)
+ANALYSIS_STORE_PATH = os.environ.get('ANALYSIS_STORE_PATH')
+analysis_store = None
+if ANALYSIS_STORE_PATH:
+    from store import AnalysisStore
+
+    analysis_store = AnalysisStore(ANALYSIS_STORE_PATH)
+
+# MinHash index of analyzed transcripts and their action items (off unless a directory is set)
+SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH')
+MAX_SIMILAR = 50
+conversation_index = None
+conversation_index_lock = threading.Lock()
+# Why this worker has no index, reported to clients that ask for similar=k
+conversation_index_error = None if SIMILARITY_INDEX_PATH else "Similar-conversation lookups are not enabled"
+
+def get_conversation_index():
+    """Return the similarity index, opening it on first use; None if it is off or cannot be opened here
+
+    Not opened at import: under a preloading server (serve.py) that would
+    happen in the master, and every forked worker would inherit its lock
+    and files. Each worker opens it itself, and only the first one gets it.
+    """
+    global conversation_index, conversation_index_error
+    if conversation_index is not None or conversation_index_error is not None:
+        return conversation_index
+    with conversation_index_lock:
+        if conversation_index is None and conversation_index_error is None:
+            from similarity import ConversationIndex, IndexLocked
+
+            try:
+                conversation_index = ConversationIndex(SIMILARITY_INDEX_PATH)
+            except IndexLocked as e:
+                conversation_index_error = "The similarity index is open in another worker process"
+                app.logger.warning("%s; similar-conversation lookups are off in this worker", e)
+            except ValueError as e:
+                conversation_index_error = "The similarity index could not be opened"
+                app.logger.error("%s; similar-conversation lookups are off", e)
+    return conversation_index
+
+def extracted_action_items(analysis, pack):
+    """Return the action items found in a transcript, leaving out a general analysis's placeholders"""
+    return [item for item in analysis.get('actionItems') or () if item not in pack.default_action_items]
+
+def store_analysis(analysis, transcript=None, key=None, pack=None):
+    """Queue an analysis for the search store and the similarity index, if there are any"""
+    if analysis_store is not None:
+        analysis_store.add(analysis, transcript, key, pack.name if pack else None)
+    index = get_conversation_index()
+    if index is not None:
+        pack = pack or rule_packs.get()
+        title = analysis.get('projectTitle') or analysis.get('conversationTitle')
+        index.add(key, transcript, extracted_action_items(analysis, pack), title, pack.name)
+
+def similar_conversations(analysis, transcript, key, pack, k):
+    """Return the k most similar past conversations of the same rule pack and the action items seen before"""
+    with span('similar'):
+        result = {'similarConversations': conversation_index.similar(transcript, k, pack.name, exclude_key=key)}
+        if 'actionItems' in analysis:
+            result['recurringActionItems'] = conversation_index.recurring_actions(
+                extracted_action_items(analysis, pack), pack.name)
+    return result
+
+# Uploads keep their transcript server-side and return an id plus a preview
+transcript_handles = TranscriptHandles(
+    max_bytes=int(os.environ.get('TRANSCRIPT_HANDLE_BYTES', 256 * 1024 * 1024)),
+    ttl=float(os.environ.get('TRANSCRIPT_HANDLE_TTL', 3600)),
+    directory=os.environ.get('TRANSCRIPT_HANDLE_DIR') or None,
+)
+TRANSCRIPT_PREVIEW_CHARS = int(os.environ.get('TRANSCRIPT_PREVIEW_CHARS', 8192))
+
+def transcript_result(transcript):
+    """Return the response fields for an extracted transcript: its handle and the text, or a preview if long"""
+    with span('handle'):
+        transcript_id = transcript_handles.put(transcript)
+    if transcript_id is None or len(transcript) <= TRANSCRIPT_PREVIEW_CHARS:
+        result = {'transcript': transcript}
     else:
-        return generate_general_analysis(text)
+        result = {'preview': transcript[:TRANSCRIPT_PREVIEW_CHARS]}
+    if transcript_id is not None:
+        result.update(transcriptId=transcript_id, length=len(transcript))
+    return result
+
+class AnalysisSession:
+    """Incrementally analyze a transcript that arrives in chunks (e.g. a live call)
+
+    Only complete lines are analyzed; a trailing partial line is held back
+    until its newline arrives or the session is closed. Each chunk costs time
+    proportional to its own size, not to the transcript received so far, and
+    the session keeps only the state the analysis needs (keyword hits,
+    speakers, the first ten action items and counts), so memory stays flat
+    however long the transcript gets. A line longer than MAX_LINE_LENGTH is
+    analyzed in pieces split at whitespace.
+    """
+
+    def __init__(self, pack=None):
+        self.pack = pack or rule_packs.get()
+        self.lock = threading.Lock()
+        self.last_active = time.time()
+        self.length = 0
+        self.pending = ''
+        self.hits = {}
+        self.speakers = []
+        self.speaker_set = set()
+        self.action_items = []
+        self.action_count = 0
+        self.timeline_mention = None
+        self.timeline_tail = ''
+        # Hashed n-gram counts for the rule pack's classifier, if it has one
+        self.features = {} if self.pack.classifier is not None else None
+        self.analysis = {}
+
+    def feed(self, chunk):
+        """Append a transcript chunk and return the changes to the analysis"""
+        self.append(chunk)
+        return self._delta()
+
+    def append(self, chunk):
+        """Append a transcript chunk without computing the changes"""
+        text = self.pending + chunk
+        cut = text.rfind('\n') + 1
+        if not cut and len(text) > MAX_LINE_LENGTH:
+            cut = max(text.rfind(' '), text.rfind('\t')) + 1 or len(text)
+        self.pending = text[cut:]
+        if cut:
+            self._consume(text[:cut])
+
+    def close(self):
+        """Analyze the held-back partial line and return the final changes"""
+        if self.pending:
+            self._consume(self.pending)
+            self.pending = ''
+        return self._delta()
+
+    def current_analysis(self):
+        """Return the analysis of every complete line received so far"""
+        tech, confidence = classify_conversation(None, self.hits, self.pack, self.features)
+        if tech:
+            analysis = build_tech_analysis(list(self.speakers), self.hits, self.timeline_mention, self.pack)
+        else:
+            analysis = build_general_analysis(list(self.speakers), self.hits, list(self.action_items),
+                                              self.action_count, self.pack)
+        if confidence is not None:
+            analysis["confidence"] = confidence
+        return analysis
+
+    def _consume(self, text):
+        index = TranscriptIndex(text)
+        for keyword, offset in scan_keywords(text, index.lower(), self.pack).items():
+            self.hits.setdefault(keyword, self.length + offset)
+        if self.features is not None:
+            self.pack.classifier.count_features(index.lower(), self.features)
+
+        if self.timeline_mention is None:
+            # A mention may straddle chunks ("3" then "\nweeks"), so keep the
+            # trailing digits and whitespace of what has been seen so far.
+            text_with_tail = self.timeline_tail + text
+            self.timeline_mention = find_timeline_mention(text_with_tail)
+            tail = TIMELINE_TAIL_REGEX.search(text_with_tail)
+            self.timeline_tail = tail.group() if tail else ''
+
+        for speaker in index.speakers:
+            if speaker not in self.speaker_set:
+                self.speaker_set.add(speaker)
+                self.speakers.append(speaker)
+        actions = index.action_items(self.pack.action_regex)
+        self.action_count += len(actions)
+        self.action_items.extend(actions[:10 - len(self.action_items)])
+
+        self.length += len(text)
+
+    def _delta(self):
+        self.last_active = time.time()
+        analysis = self.current_analysis()
+        # A switch between tech and general analysis replaces every field
+        replace = analysis["type"] != self.analysis.get("type")
+        changes = {key: value for key, value in analysis.items() if replace or self.analysis.get(key) != value}
+        self.analysis = analysis
+        return {"length": self.length, "replace": replace, "changes": changes}
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+MAX_SESSIONS = 1000
+SESSION_IDLE_SECONDS = 3600
+STREAM_READ_SIZE = 64 * 1024
+MAX_LINE_LENGTH = 1024 * 1024
+
+def analyze_transcript_stream(f, block_size=STREAM_READ_SIZE, pack=None):
+    """Analyze a transcript read from a text or binary file object in bounded memory"""
+    session = AnalysisSession(pack)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        session.append(decoder.decode(block) if isinstance(block, bytes) else block)
+    session.append(decoder.decode(b'', final=True))
+    session.close()
+    return session.current_analysis()
+
+def create_session(pack=None):
+    """Register a new analysis session and return its id"""
+    now = time.time()
+    with SESSIONS_LOCK:
+        for session_id, session in list(SESSIONS.items()):
+            if now - session.last_active > SESSION_IDLE_SECONDS:
+                del SESSIONS[session_id]
+        if len(SESSIONS) >= MAX_SESSIONS:
+            oldest = min(SESSIONS, key=lambda session_id: SESSIONS[session_id].last_active)
+            del SESSIONS[oldest]
+        session_id = uuid.uuid4().hex
+        SESSIONS[session_id] = AnalysisSession(pack)
+    return session_id
 
 # ... (rest of the helper functions remain the same)
 
-def extract_youtube_video_id(url):
-    """Extract YouTube video ID from URL"""
-    pattern = r'(?:youtube\.com\/(?:[^\/]+\/.+\/|(?:v|e(?:mbed)?)\/|.*[?&]v=)|youtu\.be\/)([^"&?\/\s]{11})'
-    match = re.search(pattern, url)
-    return match.group(1) if match else None
+def placeholder_youtube_fetcher():
+    """Return the fetcher of demonstration transcripts"""
+    from youtube import PlaceholderFetcher
+
+    return PlaceholderFetcher()
+
+def http_youtube_fetcher():
+    """Return a pooled fetcher for the transcript service at YOUTUBE_FETCH_URL"""
+    from youtube import HttpFetcher
+
+    return HttpFetcher(os.environ['YOUTUBE_FETCH_URL'],
+                       max_connections=int(os.environ.get('YOUTUBE_FETCH_CONCURRENCY', 8)))
+
+# Fetcher factories by name; YOUTUBE_FETCHER selects the one in use
+YOUTUBE_FETCHERS = {
+    'placeholder': placeholder_youtube_fetcher,
+    'http': http_youtube_fetcher,
+}
+
+youtube_transcripts = None
+youtube_transcripts_lock = threading.Lock()
+
+def get_youtube_transcripts():
+    """Return the YouTube transcript cache and fetcher, creating them on first use"""
+    global youtube_transcripts
+    with youtube_transcripts_lock:
+        if youtube_transcripts is None:
+            from youtube import YouTubeTranscripts
+
+            # Transcripts are cached by video id, so a link pasted again is not fetched again
+            youtube_transcripts = YouTubeTranscripts(
+                YOUTUBE_FETCHERS[os.environ.get('YOUTUBE_FETCHER', 'placeholder')](),
+                AnalysisCache(
+                    'youtube',
+                    max_entries=int(os.environ.get('YOUTUBE_CACHE_SIZE', 1024)),
+                    ttl=float(os.environ.get('YOUTUBE_CACHE_TTL', 7 * 24 * 3600)),
+                    path=os.environ.get('YOUTUBE_CACHE_PATH'),
+                ),
+                workers=int(os.environ.get('YOUTUBE_FETCH_CONCURRENCY', 8)),
+            )
+        return youtube_transcripts
 
 def process_youtube_url(url):
-    """Process YouTube URL and return simulated transcript"""
-    video_id = extract_youtube_video_id(url) or "unknown"
-
-    return f"""[Processed from YouTube Video: {video_id}]
-
-Meeting Transcript - {datetime.now().strftime('%Y-%m-%d')}
-
-Note: This is a demonstration of YouTube processing. In production, this would:
-1. Use YouTube Data API to fetch video metadata
-2. Extract audio using youtube-dl or similar
-3. Process audio through speech-to-text service (Google Cloud Speech, AWS Transcribe, etc.)
-4. Return the actual transcript
-
-For now, here's a sample of what the processed content might look like:
-
-Project Manager: Welcome to our project discussion. We're reviewing the requirements for the new system.
-
-Client: Thank you for having us. We need a comprehensive solution that can handle our growing business needs.
-
-Developer: What are the main challenges you're facing with your current setup?
-
-Client: Our current system is outdated and doesn't scale well. We need something modern and efficient.
-
-Project Manager: What's your target timeline for this project?
+    """Return the transcript of a YouTube video, fetched at most once per video id"""
+    with span('youtube'):
+        return get_youtube_transcripts().get(url)[1]
+
+def youtube_result(transcript):
+    """Return the response fields of a fetched YouTube transcript, flagging demonstration transcripts"""
+    result = transcript_result(transcript)
+    if get_youtube_transcripts().placeholder:
+        result['placeholder'] = True
+    return result
+
+# Budgets for pulling text out of uploaded JSON (0: the defaults in extract.py)
+JSON_MAX_DEPTH = int(os.environ.get('JSON_MAX_DEPTH', 0))
+JSON_MAX_NODES = int(os.environ.get('JSON_MAX_NODES', 0))
+JSON_MAX_TEXT_CHARS = int(os.environ.get('JSON_MAX_TEXT_CHARS', 0))
+
+def json_budget():
+    """Return a fresh extraction budget for one JSON document"""
+    import extract
+
+    return extract.Budget(JSON_MAX_DEPTH or extract.MAX_DEPTH, JSON_MAX_NODES or extract.MAX_NODES,
+                          JSON_MAX_TEXT_CHARS or extract.MAX_CHARS)
+
+def process_json_file(content, report=None):
+    """Process JSON file content and extract transcript"""
+    try:
+        return transcript_from_json(json.loads(content), report)
+    except Exception as e:
+        return f"Error processing JSON: {str(e)}"
 
-Client: We're hoping to have everything ready within 6 months.
+def process_json_stream(f, report=None, size=None):
+    """Process a JSON file object and extract transcript without loading embedded media
 
-[End of processed transcript]"""
+    A body of known size up to vcon.MAX_STRING cannot hold a string worth
+    skipping, so it goes through the C parser; only larger bodies and those
+    of unknown length are streamed.
+    """
+    import vcon
 
-def process_json_file(content):
-    """Process JSON file content and extract transcript"""
     try:
-        json_data = json.loads(content)
-        extracted_transcript = ""
-
-        if "transcript" in json_data:
-            extracted_transcript = json_data["transcript"]
-        elif "conversation" in json_data:
-            if isinstance(json_data["conversation"], list):
-                extracted_transcript = "\n\n".join([
-                    f"{msg.get('speaker', 'Speaker')}: {msg.get('text', msg.get('message', ''))}"
-                    for msg in json_data["conversation"]
-                ])
-            else:
-                extracted_transcript = json_data["conversation"]
-        elif "messages" in json_data:
-            extracted_transcript = "\n\n".join([
-                f"{msg.get('sender', msg.get('user', 'Speaker'))}: {msg.get('text', msg.get('content', msg.get('message', '')))}"
-                for msg in json_data["messages"]
-            ])
-        elif isinstance(json_data, list):
-            extracted_transcript = "\n\n".join([
-                f"{item.get('speaker', item.get('name', f'Speaker {i+1}'))}: {item.get('text', item.get('message', item.get('content', item)))}"
-                if isinstance(item, dict) else f"Speaker {i+1}: {item}"
-                for i, item in enumerate(json_data)
-            ])
+        if size is not None and size <= vcon.MAX_STRING:
+            return transcript_from_json(json.loads(f.read().decode('utf-8-sig', errors='replace')), report)
+        return transcript_from_json(vcon.load(f), report)
+    except Exception as e:
+        return f"Error processing JSON: {str(e)}"
+
+def transcript_from_json(json_data, report=None):
+    """Extract a transcript from decoded JSON (vCon or ad-hoc conversation formats)
+
+    The output is limited to JSON_MAX_TEXT_CHARS; report, if given, is
+    filled with what the extraction budgets cut.
+    """
+    import extract
+    import vcon
+
+    extracted_transcript = ""
+    budget = json_budget()
+
+    if vcon.is_vcon(json_data):
+        extracted_transcript = budget.take(vcon.transcript_from_vcon(json_data))
+    elif "transcript" in json_data:
+        extracted_transcript = json_data["transcript"]
+        if isinstance(extracted_transcript, str):
+            extracted_transcript = budget.take(extracted_transcript)
+    elif "conversation" in json_data:
+        if isinstance(json_data["conversation"], list):
+            extracted_transcript = extract.join_lines((
+                f"{msg.get('speaker', 'Speaker')}: {msg.get('text', msg.get('message', ''))}"
+                for msg in json_data["conversation"]
+            ), budget)
         else:
-            text_content = extract_text_from_object(json_data)
-            extracted_transcript = text_content or "Unable to automatically extract conversation format."
+            extracted_transcript = json_data["conversation"]
+    elif "messages" in json_data:
+        extracted_transcript = extract.join_lines((
+            f"{msg.get('sender', msg.get('user', 'Speaker'))}: {msg.get('text', msg.get('content', msg.get('message', '')))}"
+            for msg in json_data["messages"]
+        ), budget)
+    elif isinstance(json_data, list):
+        # Lines are formatted lazily, so a huge list stops at the output budget
+        extracted_transcript = extract.join_lines((
+            f"{item.get('speaker', item.get('name', f'Speaker {i+1}'))}: {item.get('text', item.get('message', item.get('content', item)))}"
+            if isinstance(item, dict) else f"Speaker {i+1}: {item}"
+            for i, item in enumerate(json_data)
+        ), budget)
+    else:
+        text_content = extract.selected_transcript(json_data, budget=budget) or extract_text_from_object(json_data, budget)
+        extracted_transcript = text_content or "Unable to automatically extract conversation format."
 
-        if not extracted_transcript.strip():
-            extracted_transcript = "No conversation data found in the expected format."
+    if not extracted_transcript.strip():
+        extracted_transcript = "No conversation data found in the expected format."
 
-        return extracted_transcript
-    except Exception as e:
-        return f"Error processing JSON: {str(e)}"
+    if report is not None:
+        report.update(budget.report())
+    return extracted_transcript
 
-def extract_text_from_object(obj, max_depth=3, current_depth=0):
+def extract_text_from_object(obj, budget=None):
     """Extract text content from nested JSON object"""
-    if current_depth > max_depth:
-        return ""
-
-    text = ""
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            if isinstance(value, str) and len(value) > 10:
-                text += f"{key}: {value}\n\n"
-            elif isinstance(value, (dict, list)):
-                text += extract_text_from_object(value, max_depth, current_depth + 1)
-    elif isinstance(obj, list):
-        for item in obj:
-            text += extract_text_from_object(item, max_depth, current_depth + 1)
-
-    return text
+    import extract
+
+    return extract.extract_text(obj, budget or json_budget())
 
 def process_audio_file(filename, file_type, file_size):
     """Process audio file and return simulated transcript"""
@@ -501,6 +788,379 @@ File Details:
 - Size: {round(file_size / 1024 / 1024, 2)} MB
 - Format: {file_type}"""
 
+class PlaceholderTranscriber:
+    """Offline transcriber backend returning the demonstration transcripts"""
+
+    placeholder = True
+
+    def transcribe(self, path, filename, file_type, file_size, progress):
+        """Return the transcript of the media file at path, reporting progress (0..1)"""
+        progress(0.5)
+        if file_type.startswith('video/'):
+            return process_video_file(filename, file_type, file_size)
+        return process_audio_file(filename, file_type, file_size)
+
+def chunked_transcriber(backend):
+    """Wrap a window backend in the parallel, overlapping-window pipeline"""
+    from transcription import ChunkedTranscriber
+
+    return ChunkedTranscriber(
+        backend,
+        window_seconds=float(os.environ.get('TRANSCRIBE_WINDOW_SECONDS', 120)),
+        overlap_seconds=float(os.environ.get('TRANSCRIBE_OVERLAP_SECONDS', 4)),
+        workers=int(os.environ.get('TRANSCRIBE_WORKERS', os.cpu_count() or 4)),
+    )
+
+def fake_transcriber():
+    """Return the chunked pipeline over the deterministic offline window backend"""
+    from transcription import FakeWindowTranscriber
+
+    return chunked_transcriber(FakeWindowTranscriber())
+
+# Transcriber factories by name; TRANSCRIBER selects the one in use
+TRANSCRIBERS = {
+    'placeholder': PlaceholderTranscriber,
+    'fake': fake_transcriber,
+}
+
+transcriber = None
+transcriber_lock = threading.Lock()
+
+def get_transcriber():
+    """Return the transcriber selected by TRANSCRIBER, creating it on first use
+
+    There is no default: without a backend, media jobs fail instead of
+    returning a made-up transcript.
+    """
+    global transcriber
+    with transcriber_lock:
+        if transcriber is None:
+            name = os.environ.get('TRANSCRIBER', '')
+            if not name:
+                raise RuntimeError("No transcriber configured: set TRANSCRIBER to a speech-to-text backend")
+            if name not in TRANSCRIBERS:
+                raise RuntimeError(f"Unknown transcriber {name!r} in TRANSCRIBER (known: {', '.join(TRANSCRIBERS)})")
+            transcriber = TRANSCRIBERS[name]()
+        return transcriber
+
+job_queue = JobQueue(workers=int(os.environ.get('JOB_WORKERS', 2)))
+
+def run_media_job(job, path, filename, file_type, file_size):
+    """Transcribe and analyze an uploaded media file in a background job"""
+    try:
+        job.update(0.0, 'transcribing')
+        backend = get_transcriber()
+        transcript = backend.transcribe(path, filename, file_type, file_size,
+                                        lambda fraction: job.update(0.9 * fraction))
+        job.update(0.9, 'analyzing')
+        analysis = generate_analysis_from_transcript(transcript)
+        result = dict(transcript_result(transcript), analysis=analysis)
+        if getattr(backend, 'placeholder', False):
+            result['placeholder'] = True
+        return result
+    finally:
+        os.remove(path)
+
+def run_analysis_job(job, transcript, pack):
+    """Analyze a transcript in a background job and cache the result"""
+    job.update(0.0, 'analyzing')
+    key, analysis = analysis_cache.get_or_compute(
+        transcript, lambda text: generate_analysis_from_transcript(text, pack=pack), pack.fingerprint)
+    store_analysis(analysis, transcript, key, pack)
+    return {'analysis': analysis}
+
+def run_youtube_job(job, url):
+    """Fetch a YouTube transcript in a background job"""
+    job.update(0.0, 'fetching')
+    return youtube_result(process_youtube_url(url))
+
+def run_youtube_batch_job(job, urls):
+    """Fetch the transcripts of many YouTube videos in a background job"""
+    job.update(0.0, 'fetching')
+    return {'videos': youtube_batch_result(urls)}
+
+def youtube_batch_result(urls):
+    """Return a result per URL: its video id and transcript fields, or an error"""
+    results = []
+    for url, (video_id, transcript, error) in zip(urls, get_youtube_transcripts().get_many(urls)):
+        if error is not None:
+            results.append({'url': url, 'videoId': video_id, 'error': error})
+        else:
+            results.append(dict(youtube_result(transcript), url=url, videoId=video_id))
+    return results
+
+def run_json_job(job, path, filename):
+    """Extract the transcript of a spilled JSON upload in a background job"""
+    try:
+        job.update(0.0, 'parsing')
+        report = {}
+        with open(path, 'rb') as f:
+            transcript = (f"[Processed from JSON file: {filename}]\n\n"
+                          f"{process_json_stream(f, report, os.path.getsize(path))}")
+        return json_upload_result(transcript, report)
+    finally:
+        os.remove(path)
+
+def json_upload_result(transcript, report):
+    """Return the response body of a JSON upload, noting what extraction skipped if anything"""
+    result = transcript_result(transcript)
+    if report.get('truncated') or report.get('nodeLimitReached') or report.get('deepContainersSkipped'):
+        result['extraction'] = report
+    return result
+
+def wants_async():
+    """Return True if the client asked for a 202 + job instead of waiting (Prefer: respond-async or ?async=1)"""
+    return 'respond-async' in request.headers.get('Prefer', '') or request.args.get('async') in ('1', 'true')
+
+def request_pack():
+    """Return the rule pack a request selected (X-Rule-Pack header or ?pack=), or None if unknown"""
+    return rule_packs.get(request.headers.get('X-Rule-Pack') or request.args.get('pack') or None)
+
+def unknown_pack():
+    return jsonify({'error': 'Unknown rule pack'}), 400
+
+def accepted(job):
+    """Return the 202 response pointing the client at a background job"""
+    return jsonify(job.to_dict()), 202, {'Location': f'/jobs/{job.id}'}
+
+def upload_size(file):
+    """Return the size in bytes of an uploaded file without reading it"""
+    if file.content_length:
+        return file.content_length
+    stream = file.stream
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return size
+
+class UploadRequest(Request):
+    """Request whose audio and video file parts the form parser writes straight into UPLOAD_DIR
+
+    A transcription job needs its media on disk after the request is gone,
+    so writing the part there while the body is parsed saves copying it a
+    second time. Parts no handler claims are removed when the request ends.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spooled_uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not (content_type or '').startswith(('audio/', 'video/')):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        spooled = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix='upload-', suffix=os.path.splitext(filename or '')[1],
+                                              delete=False)
+        self.spooled_uploads.append(spooled.name)
+        return spooled
+
+app.request_class = UploadRequest
+
+def claim_upload(file):
+    """Take over an upload the form parser wrote into UPLOAD_DIR and return its path, or None if it is not on disk"""
+    path = getattr(file.stream, 'name', None)
+    if path not in getattr(request, 'spooled_uploads', ()):
+        return None
+    request.spooled_uploads.remove(path)
+    file.stream.close()
+    return path
+
+@app.teardown_request
+def remove_spooled_uploads(error=None):
+    """Delete the media parts of a finished request that no job took over"""
+    for path in getattr(request, 'spooled_uploads', ()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def spill_upload(file):
+    """Copy an upload to a uniquely named file in UPLOAD_DIR and return its path"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    file.stream.seek(0)
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix='upload-', suffix=os.path.splitext(file.filename or '')[1],
+                                     delete=False) as spilled:
+        shutil.copyfileobj(file.stream, spilled, 1024 * 1024)
+    return spilled.name
+
+# METRICS=0 turns off all instrumentation; SERVER_TIMING is 'request'
+# (only when the client sends X-Server-Timing or ?timing), 'always' or 'off'
+metrics.enabled = os.environ.get('METRICS', '1') != '0'
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'request')
+
+request_count = metrics.registry.add(metrics.Counter(
+    'vcon_sdlc_requests_total', 'HTTP requests by endpoint, method and status.',
+    labelnames=('endpoint', 'method', 'status')))
+request_seconds = metrics.registry.add(metrics.Histogram(
+    'vcon_sdlc_request_duration_seconds', 'HTTP request latency by endpoint.', labelnames=('endpoint',)))
+request_bytes = metrics.registry.add(metrics.Histogram(
+    'vcon_sdlc_request_size_bytes', 'HTTP request body size by endpoint.', metrics.SIZE_BUCKETS,
+    labelnames=('endpoint',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_analysis_cache_entries', 'Analyses held in the in-memory cache.',
+    lambda: analysis_cache.stats()['entries']))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_analysis_cache_requests_total', 'Analysis cache lookups by outcome.',
+    lambda: {(outcome,): analysis_cache.stats()[key]
+             for outcome, key in (('hit', 'hits'), ('disk_hit', 'diskHits'), ('miss', 'misses'))},
+    kind='counter', labelnames=('outcome',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_analysis_cache_evictions_total', 'Analyses evicted from the in-memory cache.',
+    lambda: analysis_cache.stats()['evictions'], kind='counter'))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_jobs', 'Background jobs by status.',
+    lambda: {(status,): count for status, count in job_queue.stats().items()}, labelnames=('status',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_sessions', 'Open incremental analysis sessions.', lambda: len(SESSIONS)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_transcript_handle_bytes', 'Compressed size of the transcripts kept for uploads.',
+    lambda: transcript_handles.stats()['bytes']))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_youtube_requests_total', 'YouTube transcript lookups by outcome (hit, shared, fetch, error).',
+    lambda: {(outcome,): count for outcome, count in youtube_transcripts.stats().items() if outcome != 'inflight'}
+    if youtube_transcripts is not None else {},
+    kind='counter', labelnames=('outcome',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_similarity_documents', 'Documents in the similarity indexes (distinct conversations and action items).',
+    lambda: {(name,): stats['documents'] for name, stats in conversation_index.stats().items()
+             if isinstance(stats, dict)} if conversation_index is not None else {},
+    labelnames=('index',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_store_pending', 'Analyses queued for the search store.',
+    lambda: analysis_store.pending.qsize() if analysis_store is not None else 0))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_store_dropped_total', 'Analyses not stored because the search store queue was full.',
+    lambda: analysis_store.dropped if analysis_store is not None else 0, kind='counter'))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_store_failed_total', 'Analyses lost because writing their batch to the search store failed.',
+    lambda: analysis_store.failed if analysis_store is not None else 0, kind='counter'))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_similarity_dropped_total', 'Conversations not indexed because the similarity index queue was full.',
+    lambda: conversation_index.dropped if conversation_index is not None else 0, kind='counter'))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_similarity_failed_total', 'Conversations lost because indexing them failed.',
+    lambda: conversation_index.failed if conversation_index is not None else 0, kind='counter'))
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request and decide whether it gets a Server-Timing header"""
+    if not metrics.enabled:
+        return
+    wants_timing = SERVER_TIMING == 'always' or (
+        SERVER_TIMING == 'request' and ('X-Server-Timing' in request.headers or 'timing' in request.args))
+    metrics.start_request(collect_timings=wants_timing)
+
+@app.after_request
+def finish_request_metrics(response):
+    """Record request metrics and attach the stage breakdown when requested"""
+    if not metrics.enabled:
+        return response
+    elapsed, timings = metrics.finish_request()
+    endpoint = request.endpoint or 'unknown'
+    request_count.inc(endpoint, request.method, response.status_code)
+    request_seconds.observe(elapsed, endpoint)
+    request_bytes.observe(request.content_length or 0, endpoint)
+    if timings is not None:
+        response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+    return response
+
+# COMPRESSION=0 turns off response compression (e.g. behind a proxy that compresses)
+COMPRESSION = os.environ.get('COMPRESSION', '1') != '0'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', responses.MIN_SIZE))
+
+@app.after_request
+def compress_response(response):
+    """Compress buffered responses with gzip or brotli when the client accepts it"""
+    # Registered after the metrics hook so it runs first and shows up as a stage
+    if not COMPRESSION:
+        return response
+    with span('compress'):
+        return responses.compress(response, request.accept_encodings, COMPRESS_MIN_BYTES)
+
+# ADMISSION=0 turns off admission control; the slots bound concurrent work
+# per pool, ADMISSION_QUEUE and ADMISSION_WAIT bound the requests waiting
+admission_controller = admission.AdmissionController(
+    light_slots=int(os.environ.get('ADMISSION_LIGHT_SLOTS', 16)),
+    heavy_slots=int(os.environ.get('ADMISSION_HEAVY_SLOTS', 2)),
+    max_queue=int(os.environ.get('ADMISSION_QUEUE', 64)),
+    max_wait=float(os.environ.get('ADMISSION_WAIT', 10)),
+    client_queue=int(os.environ.get('ADMISSION_CLIENT_QUEUE', 8)),
+) if os.environ.get('ADMISSION', '1') != '0' else None
+# Header naming the client behind a proxy (e.g. X-Forwarded-For); the peer address otherwise
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER')
+# Endpoints whose cost is estimated from the body size
+ADMITTED_ENDPOINTS = ('analyze', 'upload_file')
+# Endpoints that are expensive whatever the body size
+HEAVY_ENDPOINTS = ('analyze_batch', 'analyze_stream', 'process_youtube_batch')
+
+admission_rejections = metrics.registry.add(metrics.Counter(
+    'vcon_sdlc_admission_rejections_total', 'Requests turned away by admission control, by pool and status.',
+    labelnames=('pool', 'status')))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_admission_slots_used', 'Admission slots held by running requests, by pool.',
+    lambda: {(name,): pool['used'] for name, pool in admission_controller.stats().items()}
+    if admission_controller is not None else {},
+    labelnames=('pool',)))
+metrics.registry.add(metrics.Callback(
+    'vcon_sdlc_admission_waiting', 'Requests waiting for admission, by pool.',
+    lambda: {(name,): pool['waiting'] for name, pool in admission_controller.stats().items()}
+    if admission_controller is not None else {},
+    labelnames=('pool',)))
+
+def admission_client():
+    """Return the identity requests are queued fairly by"""
+    if ADMISSION_CLIENT_HEADER:
+        value = request.headers.get(ADMISSION_CLIENT_HEADER, '').split(',')[0].strip()
+        if value:
+            return value
+    return request.remote_addr or 'unknown'
+
+@app.before_request
+def admit_request():
+    """Hold expensive requests until their pool has room, or turn them away with Retry-After"""
+    # Registered after the metrics hook so the wait counts towards latency and shows up as a stage
+    heavy = request.endpoint in HEAVY_ENDPOINTS
+    if admission_controller is None or not (heavy or request.endpoint in ADMITTED_ENDPOINTS):
+        return None
+    try:
+        with span('admission'):
+            g.admission_ticket = admission_controller.admit(admission_client(), request.content_length, heavy)
+    except admission.Rejected as e:
+        admission_rejections.inc(e.pool, e.status)
+        response = jsonify({'error': str(e)})
+        response.status_code = e.status
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+@app.after_request
+def hold_admission_while_streaming(response):
+    """Keep the slots of a streamed response until it has been sent"""
+    ticket = g.get('admission_ticket')
+    if ticket is not None and response.is_streamed:
+        g.admission_streaming = True
+        response.call_on_close(ticket.release)
+    return response
+
+@app.teardown_request
+def release_admission(error=None):
+    """Give back the slots of a finished request"""
+    ticket = g.get('admission_ticket')
+    # Teardown runs before a streamed body is sent; its slots go on close
+    if ticket is not None and (error is not None or not g.get('admission_streaming')):
+        ticket.release()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose metrics in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.errorhandler(413)
+def payload_too_large(error):
+    """Return a JSON error for request bodies over MAX_CONTENT_LENGTH"""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Upload exceeds the {limit} byte limit'}), 413
+
 @app.route('/')
 def index():
     """Render the main page"""
@@ -509,14 +1169,204 @@ def index():
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """Analyze transcript and return results"""
+    pack = request_pack()
+    if pack is None:
+        return unknown_pack()
+
+    if request.mimetype == 'text/plain':
+        # A raw transcript body is analyzed as it arrives, in bounded memory
+        if MAX_STREAM_BYTES:
+            request.max_content_length = MAX_STREAM_BYTES
+        with span('stream'):
+            analysis = analyze_transcript_stream(request.stream, pack=pack)
+        # The streamed transcript is not kept, so only its analysis is searchable
+        store_analysis(analysis, pack=pack)
+        with span('serialize'):
+            return jsonify(analysis)
+
     data = request.form
     transcript = data.get('transcript', '')
+    if not transcript and data.get('transcript_id'):
+        # A transcript kept by /upload-file, so it does not have to be sent again
+        transcript = transcript_handles.get(data['transcript_id'])
+        if transcript is None:
+            return jsonify({'error': 'Unknown or expired transcript'}), 404
 
     if not transcript.strip():
         return jsonify({'error': 'No transcript provided'}), 400
 
-    analysis = generate_analysis_from_transcript(transcript)
-    return jsonify(analysis)
+    # similar=k adds the k most similar past conversations, which change as more are indexed
+    similar = max(0, min(request.values.get('similar', 0, type=int), MAX_SIMILAR))
+
+    key = analysis_cache.key(transcript, pack.fingerprint)
+    if not similar and request.if_none_match.contains_weak(key):
+        response = Response(status=304)
+    else:
+        with span('cache'):
+            analysis = analysis_cache.get(key)
+        if analysis is None and wants_async():
+            return accepted(job_queue.submit(run_analysis_job, transcript, pack, kind='analysis'))
+        fresh = analysis is None
+        if fresh:
+            analysis = generate_analysis_from_transcript(transcript, pack=pack)
+            with span('cache'):
+                analysis_cache.put(key, analysis)
+        result = analysis
+        if similar and get_conversation_index() is not None:
+            # Looked up before this conversation is queued for indexing, so it does not find itself
+            result = dict(analysis, **similar_conversations(analysis, transcript, key, pack, similar))
+        elif similar:
+            # Said explicitly, so a client can tell a lookup that found nothing from none at all
+            result = dict(analysis, similarConversations=None, similarError=conversation_index_error)
+        if fresh:
+            store_analysis(analysis, transcript, key, pack)
+        with span('serialize'):
+            response = jsonify(result)
+    if not similar:
+        # Weak: the same analysis may be sent compressed or not
+        response.set_etag(key, weak=True)
+    return response
+
+@app.route('/cache-stats')
+def cache_stats():
+    """Return analysis cache counters"""
+    return jsonify(analysis_cache.stats())
+
+SEARCH_FACETS = ('requirement', 'stakeholder', 'risk', 'action', 'category', 'priority')
+
+def parse_time(value):
+    """Parse a Unix timestamp or an ISO 8601 date/time"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/search')
+def search():
+    """Search stored analyses by text, type, rule pack, date, timeline and facts, newest first"""
+    if analysis_store is None:
+        return jsonify({'error': 'Search is not enabled (set ANALYSIS_STORE_PATH)'}), 503
+    args = request.args
+    try:
+        return jsonify(analysis_store.search(
+            q=args.get('q'),
+            type=args.get('type'),
+            pack=args.get('pack'),
+            since=parse_time(args['since']) if args.get('since') else None,
+            until=parse_time(args['until']) if args.get('until') else None,
+            min_weeks=args.get('min_weeks', type=int),
+            max_weeks=args.get('max_weeks', type=int),
+            facets=[(kind, value) for kind in SEARCH_FACETS for value in args.getlist(kind)],
+            limit=args.get('limit', 20, type=int),
+            cursor=args.get('cursor'),
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/conversations/<int:conversation_id>')
+def stored_conversation(conversation_id):
+    """Return a stored analysis by id"""
+    conversation = analysis_store.get(conversation_id) if analysis_store is not None else None
+    if conversation is None:
+        return jsonify({'error': 'Unknown conversation'}), 404
+    return jsonify(conversation)
+
+@app.route('/rule-packs')
+def list_rule_packs():
+    """Return the name, version and fingerprint of every loaded rule pack"""
+    return jsonify({'default': rule_packs.default,
+                    'packs': [pack.describe() for pack in rule_packs.all()]})
+
+@app.route('/sessions', methods=['POST'])
+def start_session():
+    """Start an incremental analysis session for a live transcript"""
+    pack = request_pack()
+    if pack is None:
+        return unknown_pack()
+    return jsonify({'sessionId': create_session(pack)}), 201
+
+@app.route('/sessions/<session_id>', methods=['GET', 'POST', 'DELETE'])
+def session_chunk(session_id):
+    """Append a chunk to a session (POST), read it (GET) or close it (DELETE)"""
+    with SESSIONS_LOCK:
+        session = SESSIONS.get(session_id)
+        if session is not None and request.method == 'DELETE':
+            del SESSIONS[session_id]
+    if session is None:
+        return jsonify({'error': 'Unknown session'}), 404
+
+    with session.lock:
+        if request.method == 'POST':
+            chunk = request.form.get('transcript') if request.form else request.get_data(as_text=True)
+            return jsonify(session.feed(chunk or ''))
+        if request.method == 'DELETE':
+            return jsonify(session.close())
+        return jsonify({'length': session.length, 'analysis': session.current_analysis()})
+
+@app.route('/analyze-stream', methods=['POST'])
+def analyze_stream():
+    """Analyze a transcript streamed in the request body, emitting SSE deltas"""
+    pack = request_pack()
+    if pack is None:
+        return unknown_pack()
+    session = AnalysisSession(pack)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def events():
+        while True:
+            block = request.stream.read(STREAM_READ_SIZE)
+            if not block:
+                break
+            delta = session.feed(decoder.decode(block))
+            if delta['changes']:
+                yield f"data: {json.dumps(delta)}\n\n"
+        session.feed(decoder.decode(b'', final=True))
+        yield f"event: done\ndata: {json.dumps(session.close())}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream')
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 0)) or None
+batch_executor = None
+batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Return the process pool shared by batch requests, creating it on first use"""
+    global batch_executor
+    with batch_executor_lock:
+        if batch_executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            batch_executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return batch_executor
+
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many transcripts in parallel and stream NDJSON results"""
+    import batch
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = batch.read_ndjson(request.stream)
+    elif 'file' in request.files:
+        # Uploaded files are closed with the request, before the response streams
+        items = list(batch.read_ndjson(request.files['file'].stream))
+    elif request.is_json:
+        data = request.get_json(silent=True)
+        items = data.get('transcripts') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({'error': 'Expected a list of transcripts'}), 400
+    else:
+        return jsonify({'error': 'No transcripts provided'}), 400
+
+    pack = request_pack()
+    if pack is None:
+        return unknown_pack()
+
+    chunk_size = request.args.get('chunk_size', batch.DEFAULT_CHUNK_SIZE, type=int)
+    # Worker processes look the pack up by name in their own registry
+    results = batch.run_batch(items, partial(analyze_with_rule_pack, pack.name), workers=BATCH_WORKERS,
+                              chunksize=chunk_size, executor=get_batch_executor())
+    lines = (json.dumps(result) + '\n' for result in results)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
 
 @app.route('/process-youtube', methods=['POST'])
 def process_youtube():
@@ -527,52 +1377,197 @@ def process_youtube():
     if not youtube_url.strip():
         return jsonify({'error': 'No YouTube URL provided'}), 400
 
-    transcript = process_youtube_url(youtube_url)
-    return jsonify({'transcript': transcript})
+    import youtube
+
+    if youtube.video_id(youtube_url) is None:
+        return jsonify({'error': 'Not a YouTube video URL'}), 400
+
+    if wants_async():
+        return accepted(job_queue.submit(run_youtube_job, youtube_url, kind='youtube'))
+
+    try:
+        transcript = process_youtube_url(youtube_url)
+    except youtube.FetchError as e:
+        return jsonify({'error': str(e)}), 502
+    return jsonify(youtube_result(transcript))
+
+@app.route('/process-youtube-batch', methods=['POST'])
+def process_youtube_batch():
+    """Fetch the transcripts of a list of YouTube videos (e.g. a playlist) concurrently"""
+    if request.is_json:
+        data = request.get_json(silent=True)
+        urls = data.get('urls') if isinstance(data, dict) else data
+    else:
+        urls = request.form.getlist('youtube_url')
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+        return jsonify({'error': 'Expected a list of YouTube URLs'}), 400
+
+    if wants_async():
+        return accepted(job_queue.submit(run_youtube_batch_job, urls, kind='youtube'))
+    return jsonify({'videos': youtube_batch_result(urls)})
 
 @app.route('/upload-file', methods=['POST'])
 def upload_file():
     """Process uploaded file and return transcript"""
-    if 'file' not in request.files:
+    # Reading the form receives and parses the multipart body
+    with span('upload'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'error': 'No file part'}), 400
 
-    file = request.files['file']
+    file = files['file']
 
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
     filename = file.filename
     file_type = file.content_type
-    file_size = 0
-
-    temp_path = os.path.join('uploads', filename)
-    file.save(temp_path)
-    file_size = os.path.getsize(temp_path)
+    file_size = upload_size(file)
 
     transcript = ""
-
-    if file_type == 'application/json':
-        with open(temp_path, 'r') as f:
-            content = f.read()
-        transcript = f"[Processed from JSON file: {filename}]\n\n{process_json_file(content)}"
-    elif file_type.startswith('audio/'):
-        transcript = process_audio_file(filename, file_type, file_size)
-    elif file_type.startswith('video/'):
-        transcript = process_video_file(filename, file_type, file_size)
+    report = {}
+
+    if file_type == 'application/json' and wants_async():
+        with span('spill'):
+            path = spill_upload(file)
+        return accepted(job_queue.submit(run_json_job, path, filename, kind='json'))
+    elif file_type == 'application/json':
+        file.stream.seek(0)
+        with span('json'):
+            transcript = (f"[Processed from JSON file: {filename}]\n\n"
+                          f"{process_json_stream(file.stream, report, file_size)}")
+    elif file_type.startswith(('audio/', 'video/')):
+        # The job outlives the request, so it takes over the file the parser
+        # wrote, or gets its own copy of a part that was not written to disk
+        with span('spill'):
+            path = claim_upload(file) or spill_upload(file)
+        return accepted(job_queue.submit(run_media_job, path, filename, file_type, file_size,
+                                         kind='transcription'))
     else:
         transcript = f"Unsupported file type: {file_type}"
 
+    with span('serialize'):
+        return jsonify(json_upload_result(transcript, report))
+
+@app.route('/transcripts/<transcript_id>')
+def stored_transcript(transcript_id):
+    """Return the full text of a transcript kept by an upload"""
+    data = transcript_handles.get_compressed(transcript_id)
+    if data is None:
+        return jsonify({'error': 'Unknown or expired transcript'}), 404
+    if request.accept_encodings['gzip']:
+        # Stored compressed, so it goes out without recompressing
+        response = Response(data, mimetype='text/plain')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(gzip.decompress(data), mimetype='text/plain')
+    response.vary.add('Accept-Encoding')
+    # A handle's transcript never changes
+    response.set_etag(transcript_id, weak=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = int(transcript_handles.ttl)
+    return response.make_conditional(request)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Return the status, progress and (when done) result of a background job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+# PROFILING_TOKEN turns on the profiling endpoints and the X-Profile request
+# flag; without it nothing below is registered and requests pay nothing
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+PROFILE_KEEP = 16
+profiles = OrderedDict()
+profiles_lock = threading.Lock()
+profile_capture_lock = threading.Lock()
+
+def profiling_authorized(token):
+    """Whether token is the configured profiling token"""
+    import hmac
+
+    return hmac.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8'))
+
+def bearer_token():
+    """Return the token of the request's Authorization: Bearer header, or ''"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else ''
+
+def profile_response(report):
+    """Return a profile report as JSON, or its collapsed stacks as text with ?format=collapsed"""
+    if request.args.get('format') == 'collapsed':
+        return Response(report['collapsed'], mimetype='text/plain')
+    return jsonify(report)
+
+def start_request_profile():
+    """Trace a request flagged with X-Profile: <token>"""
+    token = request.headers.get('X-Profile')
+    if token and profiling_authorized(token):
+        import profiler
+
+        g.profile_tracer = profiler.Tracer()
+        g.profile_tracer.start()
+
+def finish_request_profile(response):
+    """Keep the profile of a traced request and name it in X-Profile-Id"""
+    tracer = g.pop('profile_tracer', None)
+    if tracer is None:
+        return response
+    tracer.stop()
+    profile_id = uuid.uuid4().hex
+    report = dict(tracer.report(), endpoint=request.endpoint, status=response.status_code)
+    with profiles_lock:
+        profiles[profile_id] = report
+        while len(profiles) > PROFILE_KEEP:
+            profiles.popitem(last=False)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+def stop_request_profile(error=None):
+    """Stop tracing a request that failed before its response"""
+    tracer = g.pop('profile_tracer', None)
+    if tracer is not None:
+        tracer.stop()
+
+def capture_profile():
+    """Sample the stacks of the worker's threads for a few seconds"""
+    if not profiling_authorized(bearer_token()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    import profiler
+
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), PROFILE_MAX_SECONDS)
+    interval = min(max(request.args.get('interval', 0.005, type=float), 0.001), 1.0)
+    # One capture at a time; overlapping ones would sample each other
+    if not profile_capture_lock.acquire(blocking=False):
+        return jsonify({'error': 'A profile is already being captured'}), 409
     try:
-        os.remove(temp_path)
-    except:
-        pass
-
-    return jsonify({'transcript': transcript})
-
-@app.route('/sample-transcript')
-def sample_transcript():
-    """Return a sample transcript"""
-    tech_sample = """Client: We need a mobile app for our restaurant chain. Customers should be able to browse our menu, place orders, and track delivery. We have 15 locations across the city.
+        stacks, samples = profiler.sample(seconds, interval, idle=request.args.get('idle') == '1')
+    finally:
+        profile_capture_lock.release()
+    return profile_response(profiler.sample_report(stacks, samples, seconds, interval))
+
+def request_profile(profile_id):
+    """Return the profile of a request traced with X-Profile"""
+    if not profiling_authorized(bearer_token()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    with profiles_lock:
+        report = profiles.get(profile_id)
+    if report is None:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return profile_response(report)
+
+if PROFILING_TOKEN:
+    # Registered last: tracing starts after admission and stops before compression
+    app.before_request(start_request_profile)
+    app.after_request(finish_request_profile)
+    app.teardown_request(stop_request_profile)
+    app.add_url_rule('/debug/profile', view_func=capture_profile, methods=['POST'])
+    app.add_url_rule('/debug/profile/<profile_id>', view_func=request_profile)
+
+TECH_SAMPLE = """Client: We need a mobile app for our restaurant chain. Customers should be able to browse our menu, place orders, and track delivery. We have 15 locations across the city.
 
 PM: What payment methods do you want to support?
 
@@ -588,7 +1583,7 @@ PM: Any specific design requirements?
 
 Client: Nothing too fancy, but it should match our brand colors - red and yellow. Easy to use for all ages."""
 
-    general_sample = """Sarah: Thanks everyone for joining today's meeting. We need to plan the company retreat for next month.
+GENERAL_SAMPLE = """Sarah: Thanks everyone for joining today's meeting. We need to plan the company retreat for next month.
 
 Mike: What's our budget looking like for this event?
 
@@ -604,10 +1599,51 @@ Lisa: I have some contacts for outdoor activities like rope courses and scavenge
 
 Sarah: Great! Let's also send out a survey to see what the team prefers. We need to finalize everything by the end of next week."""
 
+@app.route('/sample-transcript')
+def sample_transcript():
+    """Return a sample transcript"""
     # Randomly choose between tech and general sample
-    sample = tech_sample if random.choice([True, False]) else general_sample
+    sample = TECH_SAMPLE if random.choice([True, False]) else GENERAL_SAMPLE
 
     return jsonify({'transcript': sample})
 
+def warm_up():
+    """Exercise the analyzers and parsers once so the first real request pays no setup cost"""
+    # Keep the warm-up runs out of the stage metrics
+    enabled, metrics.enabled = metrics.enabled, False
+    try:
+        for sample in (TECH_SAMPLE, GENERAL_SAMPLE):
+            generate_analysis_from_transcript(sample)
+            AnalysisSession().feed(sample)
+        process_json_file(json.dumps({"vcon": "0.0.1", "parties": [{"name": "A"}],
+                                      "dialog": [{"type": "text", "originator": 0, "body": GENERAL_SAMPLE}]}))
+        process_json_stream(io.BytesIO(json.dumps({"transcript": TECH_SAMPLE}).encode('utf-8')))
+        with app.test_request_context():
+            jsonify({})
+    finally:
+        metrics.enabled = enabled
+
+# WARM_UP=0 skips the warm-up for the fastest cold start (e.g. scale-to-zero);
+# the first request then loads what it needs
+WARM_UP = os.environ.get('WARM_UP', '1') != '0'
+
+app_warmed_up = False
+
+def create_app(config=None):
+    """Return the application configured for serving, with its caches warmed up
+
+    Production servers load `app:create_app()`; config overrides Flask
+    settings. There is one app per process: every call returns (and
+    configures) this module's app, and only the first one warms it up.
+    """
+    global app_warmed_up
+    if config:
+        app.config.update(config)
+    if WARM_UP and not app_warmed_up:
+        warm_up()
+        app_warmed_up = True
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # The Werkzeug debugger runs arbitrary code for whoever reaches it: opt-in only
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
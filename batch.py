@@ -0,0 +1,128 @@
+"""Batch analysis of many transcripts on a process pool
+
+Used by the /analyze-batch endpoint and as a command line tool for
+backfills:
+
+    python batch.py transcripts.jsonl --workers 8 --chunk-size 16 -o results.ndjson
+
+Each input item is a transcript string or an object with a "transcript"
+field and an optional "id". Results are NDJSON lines in completion order,
+one per item, carrying either "analysis" or "error".
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from itertools import islice
+
+DEFAULT_CHUNK_SIZE = 8
+
+def read_ndjson(lines):
+    """Yield batch items from NDJSON/JSONL lines, skipping blank lines"""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON on line {number}: {e}")
+
+def read_items(path):
+    """Yield batch items from a JSON list or an NDJSON/JSONL file ('-' for stdin)"""
+    if path == '-':
+        yield from read_ndjson(sys.stdin)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            yield from (data.get('transcripts', []) if isinstance(data, dict) else data)
+        else:
+            yield from read_ndjson(f)
+
+def analyze_item(analyze, index, item):
+    """Analyze one batch item and return its result line"""
+    item_id = None
+    try:
+        if isinstance(item, Exception):
+            raise item
+        if isinstance(item, dict):
+            item_id = item.get('id')
+            item = item.get('transcript')
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError('No transcript provided')
+        return {"index": index, "id": item_id, "analysis": analyze(item)}
+    except Exception as e:
+        return {"index": index, "id": item_id, "error": str(e)}
+
+def analyze_chunk(analyze, chunk, process_item=analyze_item):
+    """Analyze a chunk of (index, item) pairs in a worker process"""
+    return [process_item(analyze, index, item) for index, item in chunk]
+
+def run_batch(items, analyze, workers=None, chunksize=DEFAULT_CHUNK_SIZE, executor=None, process_item=analyze_item):
+    """Analyze items on a process pool, yielding result lines in completion order
+
+    At most two chunks per worker are in flight, so items can be a lazy
+    iterator over an arbitrarily large input. process_item(analyze, index,
+    item) turns one item into its result line (analyze_item by default).
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    chunks = _chunks(enumerate(items), max(1, chunksize))
+    work = partial(analyze_chunk, analyze, process_item=process_item)
+    pending = set()
+    try:
+        while True:
+            for chunk in islice(chunks, max_in_flight - len(pending)):
+                pending.add(executor.submit(work, chunk))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a batch of transcripts in parallel.")
+    parser.add_argument('input', help="JSON list or NDJSON/JSONL file of transcripts ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="NDJSON output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="transcripts per task")
+    args = parser.parse_args(argv)
+
+    from app import generate_analysis_from_transcript
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    count = errors = 0
+    try:
+        for result in run_batch(read_items(args.input), generate_analysis_from_transcript,
+                                workers=args.workers, chunksize=args.chunk_size):
+            count += 1
+            errors += 'error' in result
+            out.write(json.dumps(result) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Analyzed {count} transcripts ({errors} errors)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Benchmarks for the analysis engine and endpoints
+
+Generates a seeded synthetic corpus (tech and general transcripts, deeply
+nested JSON and vCon payloads) and reports throughput, p50/p99 latency and
+peak memory per function and per endpoint (via the Flask test client).
+
+    python bench.py --sizes 1k,100k,1m -o results.json
+    python bench.py --sizes 1k,100k,1m --compare results.json
+
+Results are written as JSON so runs can be compared with --compare.
+"""
+import argparse
+import base64
+import gc
+import io
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+DEFAULT_SIZES = '1k,100k,1m,10m,50m'
+
+SPEAKERS = ['Client', 'PM', 'Developer', 'Designer', 'QA Lead', 'Sarah', 'Mike', 'Lisa', 'Tom', 'Priya']
+
+TECH_WORDS = ['mobile app', 'api', 'database', 'dashboard', 'integration', 'authentication', 'cloud',
+              'deployment', 'sprint', 'backend', 'frontend', 'payment', 'security', 'real-time', 'scalable']
+GENERAL_WORDS = ['meeting', 'budget', 'venue', 'catering', 'schedule', 'party', 'travel', 'review',
+                 'prepare', 'order', 'contact', 'plan', 'important', 'later', 'deadline']
+FILLER_WORDS = ['we', 'the', 'a', 'think', 'that', 'is', 'good', 'for', 'our', 'team', 'next', 'week',
+                'maybe', 'and', 'also', 'with', 'it', 'should', 'be', 'fine', 'so', 'let', 'me', 'check']
+SENTENCE_ENDINGS = ['.', '.', '?', '!']
+
+def parse_size(text):
+    """Parse a size such as 512, 100k or 10m into bytes"""
+    text = text.strip().lower()
+    factor = {'k': 1024, 'm': 1024 * 1024}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * factor)
+
+def generate_transcript(size, kind='tech', speakers=4, keyword_density=0.1, seed=0):
+    """Return a synthetic "Speaker: text" transcript of roughly size characters"""
+    rng = random.Random(seed)
+    keywords = TECH_WORDS if kind == 'tech' else GENERAL_WORDS
+    names = SPEAKERS[:max(1, speakers)] + [f"Speaker {i}" for i in range(len(SPEAKERS), speakers)]
+    lines = []
+    length = 0
+    while length < size:
+        words = [rng.choice(keywords) if rng.random() < keyword_density else rng.choice(FILLER_WORDS)
+                 for _ in range(rng.randint(6, 30))]
+        if rng.random() < 0.05:
+            words += [str(rng.randint(2, 12)), rng.choice(['weeks', 'months'])]
+        line = f"{rng.choice(names)}: {' '.join(words).capitalize()}{rng.choice(SENTENCE_ENDINGS)}"
+        lines.append(line)
+        length += len(line) + 2
+    return "\n\n".join(lines)[:max(size, 1)]
+
+def generate_noisy_transcript(size, seed=0):
+    """Return a transcript of roughly size characters in which nearly every token is distinct (ids, hashes)"""
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size:
+        words = [f"{rng.choice(FILLER_WORDS)}-{rng.getrandbits(40):x}" for _ in range(rng.randint(6, 30))]
+        line = f"{rng.choice(SPEAKERS)}: {' '.join(words)}."
+        lines.append(line)
+        length += len(line) + 2
+    return "\n\n".join(lines)[:max(size, 1)]
+
+def generate_nested_json(size, depth=12, seed=0):
+    """Return a JSON document of roughly size characters whose text sits up to depth levels deep"""
+    rng = random.Random(seed)
+    lines = iter(generate_transcript(size, 'general', seed=seed).split("\n\n"))
+    documents = []
+    for line in lines:
+        document = current = {"text": line, "tags": ["bench", "nested"]}
+        for level in range(1, rng.randint(2, depth)):
+            line = next(lines, None)
+            if line is None:
+                break
+            child = {"level": level, "text": line}
+            current["child"] = child
+            current = child
+        documents.append(document)
+    return json.dumps({"meta": {"source": "bench"}, "data": documents})
+
+def generate_vcon(size, speakers=4, media_bytes=0, seed=0):
+    """Return a vCon document with text dialogs of roughly size characters and optional embedded media"""
+    rng = random.Random(seed)
+    names = (SPEAKERS * (speakers // len(SPEAKERS) + 1))[:speakers]
+    dialog = []
+    for line in generate_transcript(size, 'tech', speakers, seed=seed).split("\n\n"):
+        name, _, text = line.partition(': ')
+        dialog.append({"type": "text", "originator": names.index(name) if name in names else 0,
+                       "mimetype": "text/plain", "encoding": "none", "body": text})
+    if media_bytes:
+        media = base64.urlsafe_b64encode(rng.randbytes(media_bytes)).decode('ascii')
+        dialog.append({"type": "recording", "parties": list(range(speakers)), "mimetype": "audio/x-wav",
+                       "encoding": "base64url", "body": media})
+    return json.dumps({"vcon": "0.0.1", "uuid": "00000000-0000-0000-0000-000000000000",
+                       "parties": [{"name": name} for name in names], "dialog": dialog,
+                       "analysis": [], "attachments": []})
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def measure(func, payload_size, repeat, min_time):
+    """Time func() repeatedly and measure its peak traced memory once"""
+    func()  # warm up
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or (time.perf_counter() - started < min_time and len(timings) < 1000):
+        gc.collect()
+        begin = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - begin)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    mean = sum(timings) / len(timings)
+    return {
+        "runs": len(timings),
+        "bytes": payload_size,
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "mean_ms": mean * 1000,
+        "mb_per_s": payload_size / mean / 1e6 if mean else 0.0,
+        "docs_per_s": 1 / mean if mean else 0.0,
+        "peak_mb": peak / 1e6,
+    }
+
+def benchmark_cases(app_module, size, args):
+    """Yield (name, payload size, callable) for one corpus size"""
+    seed = args.seed
+    tech = generate_transcript(size, 'tech', args.speakers, args.keyword_density, seed)
+    general = generate_transcript(size, 'general', args.speakers, args.keyword_density, seed + 1)
+    noisy = generate_noisy_transcript(size, seed + 4)
+    nested = generate_nested_json(size, seed=seed + 2)
+    nested_data = json.loads(nested)
+    vcon_doc = generate_vcon(size, args.speakers, args.media_bytes, seed + 3)
+    client = app_module.app.test_client()
+
+    def post_analyze(transcript, cached):
+        if not cached:
+            app_module.analysis_cache.clear()
+        response = client.post('/analyze', data={'transcript': transcript})
+        assert response.status_code == 200, response.status_code
+
+    def post_upload(document, name):
+        data = {'file': (io.BytesIO(document.encode('utf-8')), name, 'application/json')}
+        response = client.post('/upload-file', data=data, content_type='multipart/form-data')
+        assert response.status_code == 200, response.status_code
+
+    # Keyword scanning must stay in bounded memory, also when few tokens repeat
+    pack = app_module.rule_packs.get()
+    tech_lower = tech.lower()
+    yield 'pack.scan', len(tech), lambda: pack.scan(tech_lower)
+    yield 'pack.scan[noisy]', len(noisy), lambda: pack.scan(noisy)
+    yield 'detect_tech_conversation', len(tech), lambda: app_module.detect_tech_conversation(tech)
+    yield 'generate_tech_analysis', len(tech), lambda: app_module.generate_tech_analysis(tech)
+    yield 'generate_general_analysis', len(general), lambda: app_module.generate_general_analysis(general)
+    yield 'generate_analysis_from_transcript', len(tech), lambda: app_module.generate_analysis_from_transcript(tech)
+    tech_bytes = tech.encode('utf-8')
+    yield 'analyze_transcript_stream', len(tech), lambda: app_module.analyze_transcript_stream(io.BytesIO(tech_bytes))
+    yield 'process_json_file[nested]', len(nested), lambda: app_module.process_json_file(nested)
+    yield 'process_json_file[vcon]', len(vcon_doc), lambda: app_module.process_json_file(vcon_doc)
+    yield 'extract_text_from_object', len(nested), lambda: app_module.extract_text_from_object(nested_data)
+    yield 'POST /analyze', len(tech), lambda: post_analyze(tech, cached=False)
+    yield 'POST /analyze (cached)', len(tech), lambda: post_analyze(tech, cached=True)
+    yield 'POST /analyze[noisy]', len(noisy), lambda: post_analyze(noisy, cached=False)
+    yield 'POST /upload-file[nested]', len(nested), lambda: post_upload(nested, 'nested.json')
+    yield 'POST /upload-file[vcon]', len(vcon_doc), lambda: post_upload(vcon_doc, 'call.vcon.json')
+
+def compare(current, baseline):
+    """Print p50 and peak memory changes against a previous results file"""
+    previous = {(result['name'], result['size']): result for result in baseline['results']}
+    print(f"\n{'benchmark':<40} {'size':>8} {'p50 before':>11} {'p50 now':>10} {'change':>8} "
+          f"{'peak before':>12} {'peak now':>10}")
+    for result in current['results']:
+        before = previous.get((result['name'], result['size']))
+        if before is None:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        print(f"{result['name']:<40} {result['size']:>8} {before['p50_ms']:>9.2f}ms "
+              f"{result['p50_ms']:>8.2f}ms {change:>+8.1%} {before['peak_mb']:>9.2f} MB {result['peak_mb']:>7.2f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transcript analysis engine.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"corpus sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument('--repeat', type=int, default=5, help="minimum timed runs per case")
+    parser.add_argument('--min-time', type=float, default=0.5, help="minimum seconds spent per case")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--speakers', type=int, default=4)
+    parser.add_argument('--keyword-density', type=float, default=0.1)
+    parser.add_argument('--media-bytes', type=int, default=0, help="embedded recording size in vCon payloads")
+    parser.add_argument('--only', default='', help="run only benchmarks whose name contains this text")
+    parser.add_argument('-o', '--output', help="write JSON results to this file")
+    parser.add_argument('--compare', help="compare against a previous JSON results file")
+    args = parser.parse_args(argv)
+
+    import app as app_module
+
+    results = []
+    for size_text in args.sizes.split(','):
+        size = parse_size(size_text)
+        for name, payload_size, func in benchmark_cases(app_module, size, args):
+            if args.only not in name:
+                continue
+            result = measure(func, payload_size, args.repeat, args.min_time)
+            result.update(name=name, size=size_text)
+            results.append(result)
+            print(f"{name:<40} {size_text:>6} p50 {result['p50_ms']:9.2f}ms  p99 {result['p99_ms']:9.2f}ms  "
+                  f"{result['mb_per_s']:8.2f} MB/s  {result['docs_per_s']:9.1f} docs/s  "
+                  f"peak {result['peak_mb']:8.2f} MB", flush=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Content-addressed cache for analysis results
+
+Results are keyed by a hash of the normalized transcript plus the analyzer
+version and a namespace (the rule pack fingerprint), so a changed analyzer
+or rule pack never serves stale results. An in-memory LRU tier with a TTL
+sits in front of an optional sqlite tier that survives restarts.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+def normalize_transcript(text):
+    """Normalize a transcript in ways that cannot change its analysis"""
+    return text.replace('\r\n', '\n').strip()
+
+class AnalysisCache:
+    """LRU/TTL cache of analysis results with an optional on-disk tier"""
+
+    def __init__(self, version, max_entries=1024, ttl=3600, path=None):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        if path:
+            with self._connect() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS analysis "
+                           "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def key(self, transcript, namespace=''):
+        """Return the cache key (also used as ETag) of a transcript analyzed under namespace"""
+        digest = hashlib.sha256(self.version.encode('utf-8'))
+        digest.update(b'\0')
+        if namespace:
+            digest.update(namespace.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(normalize_transcript(transcript).encode('utf-8', errors='surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached analysis for key, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+                self.evictions += 1
+
+        value = self._disk_get(key, now)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, value, now)
+        return value
+
+    def put(self, key, value):
+        """Store an analysis under key in every tier"""
+        now = time.time()
+        self._remember(key, value, now)
+        if self.path:
+            with self._connect() as db:
+                db.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?)",
+                           (key, json.dumps(value), now + self.ttl))
+
+    def get_or_compute(self, transcript, compute, namespace=''):
+        """Return (key, analysis), computing and caching the analysis on a miss"""
+        key = self.key(transcript, namespace)
+        value = self.get(key)
+        if value is None:
+            value = compute(transcript)
+            self.put(key, value)
+        return key, value
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size"""
+        with self.lock:
+            return {
+                "version": self.version,
+                "entries": len(self.entries),
+                "maxEntries": self.max_entries,
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        """Drop every cached result"""
+        with self.lock:
+            self.entries.clear()
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM analysis")
+
+    def _remember(self, key, value, now):
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_get(self, key, now):
+        if not self.path:
+            return None
+        with self._connect() as db:
+            row = db.execute("SELECT value, expires FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute("DELETE FROM analysis WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0])
+
+    def _connect(self):
+        # sqlite connections are cheap; one per operation keeps this thread-safe
+        import sqlite3
+
+        db = sqlite3.connect(self.path, timeout=10)
+        return _closing(db)
+
+class _closing:
+    """Commit and close a sqlite connection on exit"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.db.commit()
+        finally:
+            self.db.close()
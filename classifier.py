@@ -0,0 +1,335 @@
+"""Hashed bag-of-words classifier for routing tech and general conversations
+
+Transcripts are turned into whole-word unigram and bigram features hashed
+into a fixed number of buckets (so "app" no longer matches inside "happy"),
+weighted by log(1 + count) and L2-normalized. A logistic regression over
+those features gives the probability that a conversation is tech/SDLC
+related. Scoring a batch is one sparse matrix-vector product, done with
+NumPy when it is installed and in plain Python otherwise.
+
+A rule pack uses a model with `"classifier": {"model": "path.json"}` in its
+`tech` section. Models are trained and evaluated on a labeled JSONL corpus
+(`{"transcript": ..., "label": "tech" | "general"}` per line):
+
+    python classifier.py train corpus.jsonl -o rulepacks/models/tech.json --holdout 0.2
+    python classifier.py eval heldout.jsonl --model rulepacks/models/tech.json
+    python classifier.py classify archive.jsonl --model rulepacks/models/tech.json -o labels.ndjson
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import time
+import zlib
+from array import array
+from collections import Counter
+from itertools import islice
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MODEL_TYPE = 'hashed-linear'
+DEFAULT_DIM = 2 ** 18
+DEFAULT_BATCH_SIZE = 1024
+
+# Words (keeping "real-time", "node.js", "don't") and line breaks, which n-grams never cross
+TOKEN_REGEX = re.compile(r"[a-z0-9]+(?:['.\-][a-z0-9]+)*|\n")
+
+NEWLINE = 1 << 32  # outside the crc32 range
+BIGRAM_MULTIPLIER = 0x9E3779B1
+MAX_CACHED_TOKENS = 1 << 18
+
+class _TokenHashes(dict):
+    """crc32 of each token seen so far, computed on first lookup"""
+
+    def __missing__(self, token):
+        if len(self) >= MAX_CACHED_TOKENS:
+            self.clear()
+            self['\n'] = NEWLINE
+        value = self[token] = zlib.crc32(token.encode('utf-8'))
+        return value
+
+_token_hashes = _TokenHashes({'\n': NEWLINE})
+
+def _bigram_hash(first, second):
+    return (first * BIGRAM_MULTIPLIER + second) & 0xFFFFFFFF
+
+def count_features(text_lower, dim=DEFAULT_DIM, ngrams=2, counts=None):
+    """Add the hashed n-gram counts of a lowercased text to counts (a dict) and return it"""
+    if counts is None:
+        counts = {}
+    hashes = list(map(_token_hashes.__getitem__, TOKEN_REGEX.findall(text_lower)))
+    grams = Counter(hashes)
+    grams.pop(NEWLINE, None)
+    for gram, n in grams.items():
+        bucket = gram % dim
+        counts[bucket] = counts.get(bucket, 0) + n
+    if ngrams >= 2:
+        for (first, second), n in Counter(zip(hashes, islice(hashes, 1, None))).items():
+            if first != NEWLINE and second != NEWLINE:
+                bucket = _bigram_hash(first, second) % dim
+                counts[bucket] = counts.get(bucket, 0) + n
+    return counts
+
+def _batch_features(texts_lower, dim, ngrams):
+    """Return (rows, buckets, counts) arrays of the hashed n-gram counts of a batch of texts"""
+    keys = []
+    for row, text in enumerate(texts_lower):
+        tokens = TOKEN_REGEX.findall(text)
+        hashes = numpy.fromiter(map(_token_hashes.__getitem__, tokens), dtype=numpy.uint64, count=len(tokens))
+        words = hashes != NEWLINE
+        grams = [hashes[words]]
+        if ngrams >= 2 and len(hashes) > 1:
+            pairs = words[:-1] & words[1:]
+            first, second = hashes[:-1][pairs], hashes[1:][pairs]
+            grams.append((first * numpy.uint64(BIGRAM_MULTIPLIER) + second) & numpy.uint64(0xFFFFFFFF))
+        # One key space for the whole batch: row * dim + bucket
+        keys.append(numpy.concatenate(grams) % numpy.uint64(dim) + numpy.uint64(row * dim))
+    keys, counts = numpy.unique(numpy.concatenate(keys) if keys else numpy.zeros(0, numpy.uint64),
+                                return_counts=True)
+    return (keys // numpy.uint64(dim)).astype(numpy.int64), (keys % numpy.uint64(dim)).astype(numpy.int64), counts
+
+def _vector(counts):
+    """Return (buckets, values) of the log-scaled, L2-normalized feature vector"""
+    values = [math.log1p(n) for n in counts.values()]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return list(counts), [value / norm for value in values]
+
+def _sigmoid(z):
+    if z < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+class HashedLinearModel:
+    """Logistic regression over hashed n-gram features"""
+
+    def __init__(self, dim=DEFAULT_DIM, ngrams=2, weights=None, bias=0.0, metadata=None):
+        self.dim = dim
+        self.ngrams = ngrams
+        self.weights = array('d', weights) if weights is not None else array('d', bytes(8 * dim))
+        self.bias = bias
+        self.metadata = metadata or {}
+        self._dense = numpy.frombuffer(self.weights, dtype=numpy.float64) if numpy is not None else None
+
+    def count_features(self, text_lower, counts=None):
+        """Add the hashed n-gram counts of a lowercased text to counts and return it"""
+        return count_features(text_lower, self.dim, self.ngrams, counts)
+
+    def score_counts(self, counts):
+        """Return the tech probability of a conversation from its feature counts"""
+        buckets, values = _vector(counts)
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights[bucket] * value for bucket, value in zip(buckets, values)))
+
+    def score(self, text_lower):
+        """Return the tech probability of a lowercased transcript"""
+        return self.score_batch([text_lower])[0]
+
+    def score_batch(self, texts_lower):
+        """Return the tech probabilities of many lowercased transcripts in one pass"""
+        if self._dense is None:
+            return [self.score_counts(self.count_features(text)) for text in texts_lower]
+        n = len(texts_lower)
+        rows, buckets, counts = _batch_features(texts_lower, self.dim, self.ngrams)
+        values = numpy.log1p(counts)
+        norms = numpy.sqrt(numpy.bincount(rows, weights=values * values, minlength=n))
+        norms[norms == 0] = 1.0
+        z = numpy.bincount(rows, weights=self._dense[buckets] * values, minlength=n) / norms + self.bias
+        return (1.0 / (1.0 + numpy.exp(-numpy.clip(z, -30, 30)))).tolist()
+
+    def digest(self):
+        """Return a short hash of the model parameters"""
+        digest = hashlib.sha256(f"{self.dim}:{self.ngrams}:{self.bias!r}".encode('ascii'))
+        digest.update(self.weights.tobytes())
+        return digest.hexdigest()[:16]
+
+    def to_dict(self):
+        weights = {str(bucket): round(weight, 6) for bucket, weight in enumerate(self.weights)
+                   if round(weight, 6)}
+        return {"type": MODEL_TYPE, "dim": self.dim, "ngrams": self.ngrams, "bias": self.bias,
+                "metadata": self.metadata, "weights": weights}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('type') != MODEL_TYPE:
+            raise ValueError(f"Not a {MODEL_TYPE} model")
+        model = cls(data['dim'], data.get('ngrams', 2), bias=data.get('bias', 0.0), metadata=data.get('metadata'))
+        for bucket, weight in data['weights'].items():
+            model.weights[int(bucket)] = weight
+        return model
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+def load_model(path):
+    """Load a model saved by HashedLinearModel.save"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return HashedLinearModel.from_dict(json.load(f))
+
+def train(texts, labels, dim=DEFAULT_DIM, ngrams=2, epochs=10, learning_rate=0.5, l2=1e-6, seed=0):
+    """Fit a model to transcripts and 0/1 labels (1 = tech) with stochastic gradient descent"""
+    model = HashedLinearModel(dim, ngrams)
+    vectors = [_vector(model.count_features(text.lower())) for text in texts]
+    order = list(range(len(vectors)))
+    rng = random.Random(seed)
+    weights = model.weights
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        rate = learning_rate / (1 + epoch)
+        for i in order:
+            buckets, values = vectors[i]
+            p = _sigmoid(model.bias + sum(weights[bucket] * value for bucket, value in zip(buckets, values)))
+            error = p - labels[i]
+            for bucket, value in zip(buckets, values):
+                weights[bucket] -= rate * (error * value + l2 * weights[bucket])
+            model.bias -= rate * error
+    model.metadata = {"trainedOn": len(texts), "epochs": epochs, "trainedAt": int(time.time())}
+    return model
+
+def evaluate(labels, probabilities, threshold=0.5):
+    """Return accuracy, precision, recall, F1 and log loss of tech probabilities against 0/1 labels"""
+    tp = fp = fn = tn = 0
+    loss = 0.0
+    for label, p in zip(labels, probabilities):
+        predicted = p >= threshold
+        tp += predicted and label
+        fp += predicted and not label
+        fn += label and not predicted
+        tn += not label and not predicted
+        p = min(max(p, 1e-12), 1 - 1e-12)
+        loss -= math.log(p if label else 1 - p)
+    total = tp + fp + fn + tn
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "count": total,
+        "accuracy": (tp + tn) / total if total else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "logLoss": loss / total if total else 0.0,
+    }
+
+def read_labeled(path):
+    """Return (texts, labels) of a JSONL corpus with "transcript" and "label" ("tech"/"general") fields"""
+    from batch import read_items
+
+    texts, labels = [], []
+    for number, item in enumerate(read_items(path), 1):
+        if isinstance(item, Exception):
+            raise item
+        label = item.get('label', item.get('type'))
+        if label not in ('tech', 'general', True, False, 1, 0):
+            raise ValueError(f"Item {number} has no tech/general label")
+        texts.append(item['transcript'])
+        labels.append(1 if label in ('tech', True, 1) else 0)
+    return texts, labels
+
+def keyword_baseline(texts, pack_name=None):
+    """Return 0/1 tech decisions of a rule pack's keyword rules"""
+    from app import rule_packs
+
+    pack = rule_packs.get(pack_name)
+    return [1 if pack.is_tech(pack.scan(text.lower())) else 0 for text in texts]
+
+def report(name, metrics):
+    print(f"{name:<10} accuracy {metrics['accuracy']:.3f}  precision {metrics['precision']:.3f}  "
+          f"recall {metrics['recall']:.3f}  F1 {metrics['f1']:.3f}  ({metrics['count']} transcripts)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train, evaluate and run the conversation classifier.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    train_parser = commands.add_parser('train', help="fit a model to a labeled corpus")
+    train_parser.add_argument('corpus')
+    train_parser.add_argument('-o', '--output', required=True, help="model file to write")
+    train_parser.add_argument('--holdout', type=float, default=0.0, help="fraction held out for evaluation")
+    train_parser.add_argument('--dim', type=int, default=DEFAULT_DIM, help="hash buckets")
+    train_parser.add_argument('--ngrams', type=int, choices=(1, 2), default=2)
+    train_parser.add_argument('--epochs', type=int, default=10)
+    train_parser.add_argument('--learning-rate', type=float, default=0.5)
+    train_parser.add_argument('--seed', type=int, default=0)
+    eval_parser = commands.add_parser('eval', help="compare a model with the keyword rules on a labeled corpus")
+    eval_parser.add_argument('corpus')
+    eval_parser.add_argument('--model', required=True)
+    eval_parser.add_argument('--threshold', type=float, default=0.5)
+    eval_parser.add_argument('--pack', help="rule pack for the keyword baseline (default: the default pack)")
+    classify_parser = commands.add_parser('classify', help="label a corpus, writing NDJSON")
+    classify_parser.add_argument('input', help="JSON list or NDJSON/JSONL file of transcripts ('-' for stdin)")
+    classify_parser.add_argument('--model', required=True)
+    classify_parser.add_argument('--threshold', type=float, default=0.5)
+    classify_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    classify_parser.add_argument('-o', '--output', default='-', help="NDJSON output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        texts, labels = read_labeled(args.corpus)
+        order = list(range(len(texts)))
+        random.Random(args.seed).shuffle(order)
+        held = order[:int(len(order) * args.holdout)]
+        kept = order[len(held):]
+        model = train([texts[i] for i in kept], [labels[i] for i in kept], args.dim, args.ngrams,
+                      args.epochs, args.learning_rate, seed=args.seed)
+        if held:
+            metrics = evaluate([labels[i] for i in held], model.score_batch([texts[i].lower() for i in held]))
+            model.metadata['holdout'] = metrics
+            report('holdout', metrics)
+        model.save(args.output)
+        print(f"Trained on {len(kept)} transcripts, wrote {args.output}", file=sys.stderr)
+        return 0
+
+    model = load_model(args.model)
+    if args.command == 'eval':
+        texts, labels = read_labeled(args.corpus)
+        lowered = [text.lower() for text in texts]
+        started = time.perf_counter()
+        probabilities = model.score_batch(lowered)
+        model_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        baseline = keyword_baseline(texts, args.pack)
+        keyword_seconds = time.perf_counter() - started
+        report('model', evaluate(labels, probabilities, args.threshold))
+        report('keywords', evaluate(labels, baseline))
+        print(f"model {len(texts) / model_seconds:.0f} docs/s, keywords {len(texts) / keyword_seconds:.0f} docs/s "
+              f"({'numpy' if numpy is not None else 'pure Python'} scoring)")
+        return 0
+
+    from batch import read_items
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    count = 0
+    try:
+        items = enumerate(read_items(args.input))
+        while True:
+            chunk = list(islice(items, args.batch_size))
+            if not chunk:
+                break
+            texts = []
+            for index, item in chunk:
+                if isinstance(item, dict):
+                    item = item.get('transcript')
+                texts.append(item.lower() if isinstance(item, str) else None)
+            probabilities = iter(model.score_batch([text for text in texts if text is not None]))
+            for (index, item), text in zip(chunk, texts):
+                result = {"index": index, "id": item.get('id') if isinstance(item, dict) else None}
+                if text is None:
+                    result['error'] = str(item) if isinstance(item, Exception) else 'No transcript provided'
+                else:
+                    p = next(probabilities)
+                    tech = p >= args.threshold
+                    result.update(type="tech" if tech else "general", confidence=round(p if tech else 1 - p, 4))
+                out.write(json.dumps(result) + '\n')
+            count += len(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Classified {count} transcripts", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
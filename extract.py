@@ -0,0 +1,215 @@
+"""Bounded extraction of transcript text from decoded JSON
+
+Uploads that are not a known conversation format are searched for text
+iteratively, with an explicit stack instead of recursion, under three
+budgets: nesting depth, nodes visited and characters of output. Each
+extraction reports what the budgets cut (containers too deep to enter,
+whether the node budget ran out, whether the text was truncated).
+
+Known transcript locations are tried first with JSONPath-style selectors
+such as `$.results.utterances[*]` or `$..segments[*]`; a selected item is
+formatted as a `Speaker: text` line.
+"""
+import re
+from itertools import repeat
+
+MAX_DEPTH = 64
+MAX_NODES = 1000000
+MAX_CHARS = 16 * 1024 * 1024
+MIN_TEXT_LENGTH = 10
+
+SPEAKER_KEYS = ('speaker', 'name', 'sender', 'user', 'author', 'role', 'speaker_label')
+TEXT_KEYS = ('text', 'transcript', 'message', 'content', 'body', 'utterance')
+
+# Transcript locations of common speech-to-text and chat exports, most specific first
+TRANSCRIPT_SELECTORS = [
+    '$.results.utterances[*]',                          # Deepgram with utterances
+    '$.utterances[*]',                                  # AssemblyAI
+    '$.results.channels[*].alternatives[0]',            # Deepgram
+    '$.results.transcripts[*]',                         # AWS Transcribe
+    '$.results[*].alternatives[0]',                     # Google Speech-to-Text
+    '$.segments[*]',                                    # Whisper
+    '$..messages[*]',
+]
+
+_SELECTOR_STEP = re.compile(r"""\.\.(?P<descend>\w+|\*)|\.(?P<key>\w+|\*)|\[(?:(?P<index>-?\d+)|\*|'(?P<quoted>[^']*)'|"(?P<dquoted>[^"]*)")\]""")
+
+_END = object()
+
+class Budget:
+    """Node and character allowance shared by the steps of one extraction, and what they skipped"""
+
+    def __init__(self, max_depth=MAX_DEPTH, max_nodes=MAX_NODES, max_chars=MAX_CHARS):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_chars = max_chars
+        self.nodes = 0
+        self.chars = 0
+        self.deep_containers = 0
+        self.out_of_nodes = False
+        self.truncated = False
+
+    def visit(self):
+        """Count one node; return False once the node budget is spent"""
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            self.out_of_nodes = True
+            return False
+        return True
+
+    def take(self, text):
+        """Return as much of text as the character budget allows"""
+        room = self.max_chars - self.chars
+        if len(text) > room:
+            self.truncated = True
+            text = text[:max(room, 0)]
+        self.chars += len(text)
+        return text
+
+    @property
+    def exhausted(self):
+        return self.out_of_nodes or self.truncated
+
+    def report(self):
+        """Return what the budgets cut, as a JSON-serializable dict"""
+        return {"nodes": min(self.nodes, self.max_nodes), "deepContainersSkipped": self.deep_containers,
+                "nodeLimitReached": self.out_of_nodes, "truncated": self.truncated}
+
+def _children(value):
+    """Return an iterator of (key, child) pairs of a container; list items have key None"""
+    if isinstance(value, dict):
+        return iter(value.items())
+    return zip(repeat(None), value)
+
+def walk(obj, budget):
+    """Yield (key, value, depth) for every node below obj, depth first, within the depth and node budgets"""
+    if not isinstance(obj, (dict, list)):
+        return
+    stack = [(_children(obj), 0)]
+    while stack:
+        pairs, depth = stack[-1]
+        pair = next(pairs, _END)
+        if pair is _END:
+            stack.pop()
+            continue
+        if not budget.visit():
+            return
+        key, value = pair
+        yield key, value, depth
+        if isinstance(value, (dict, list)):
+            if depth + 1 > budget.max_depth:
+                budget.deep_containers += 1
+            else:
+                stack.append((_children(value), depth + 1))
+
+def extract_text(obj, budget=None, keys=None, min_length=MIN_TEXT_LENGTH):
+    """Return "key: value" paragraphs of every object string longer than min_length, in document order
+
+    keys, when given, is an allow-list of the keys whose strings are kept.
+    """
+    budget = budget or Budget()
+    parts = []
+    for key, value, _ in walk(obj, budget):
+        if isinstance(value, str) and key is not None and len(value) > min_length and (keys is None or key in keys):
+            parts.append(budget.take(f"{key}: {value}\n\n"))
+            if budget.truncated:
+                break
+    return "".join(parts)
+
+def parse_selector(selector):
+    """Compile a JSONPath-style selector ($.a.b, $['a'], [0], [*], .*, ..name) into steps"""
+    if not selector.startswith('$'):
+        raise ValueError(f"Selector must start with '$': {selector}")
+    steps = []
+    position = 1
+    while position < len(selector):
+        match = _SELECTOR_STEP.match(selector, position)
+        if match is None:
+            raise ValueError(f"Invalid selector at {selector[position:]!r}: {selector}")
+        if match.group('descend'):
+            steps.append(('descend', match.group('descend')))
+        elif match.group('key') not in (None, '*'):
+            steps.append(('key', match.group('key')))
+        elif match.group('index') is not None:
+            steps.append(('index', int(match.group('index'))))
+        elif match.group('quoted') is not None or match.group('dquoted') is not None:
+            steps.append(('key', match.group('quoted') if match.group('quoted') is not None
+                          else match.group('dquoted')))
+        else:
+            steps.append(('all', None))
+        position = match.end()
+    return steps
+
+def select(obj, selector, budget=None):
+    """Return the values a selector matches in obj, in document order"""
+    budget = budget or Budget()
+    current = [obj]
+    for kind, arg in parse_selector(selector) if isinstance(selector, str) else selector:
+        matched = []
+        for value in current:
+            if kind == 'key':
+                if isinstance(value, dict) and arg in value:
+                    matched.append(value[arg])
+            elif kind == 'index':
+                if isinstance(value, list) and -len(value) <= arg < len(value):
+                    matched.append(value[arg])
+            elif kind == 'all':
+                if isinstance(value, (dict, list)):
+                    for _, child in _children(value):
+                        if not budget.visit():
+                            return matched
+                        matched.append(child)
+            else:
+                if arg == '*':
+                    matched.extend(child for _, child, _ in walk(value, budget))
+                else:
+                    matched.extend(child for key, child, _ in walk(value, budget) if key == arg)
+            if budget.out_of_nodes:
+                return matched
+        current = matched
+    return current
+
+def item_text(item, index=0):
+    """Return an item of a conversation list as a "Speaker: text" line, or None"""
+    if isinstance(item, str):
+        return f"Speaker {index + 1}: {item}"
+    if not isinstance(item, dict):
+        return None
+    text = next((item[key] for key in TEXT_KEYS if isinstance(item.get(key), str)), None)
+    if text is None:
+        return None
+    speaker = next((item[key] for key in SPEAKER_KEYS if item.get(key) not in (None, '')), None)
+    if speaker is None:
+        return text
+    if isinstance(speaker, int):
+        speaker = f"Speaker {speaker + 1}"
+    return f"{speaker}: {text}"
+
+def join_lines(lines, budget=None, separator="\n\n"):
+    """Join lines until the character budget runs out"""
+    budget = budget or Budget()
+    parts = []
+    for line in lines:
+        if line is None:
+            continue
+        if parts:
+            line = separator + line
+        parts.append(budget.take(line))
+        if budget.truncated:
+            break
+    return "".join(parts)
+
+def selected_transcript(obj, selectors=None, budget=None):
+    """Return the transcript at the first selector matching any text, or None"""
+    budget = budget or Budget()
+    for selector in TRANSCRIPT_SELECTORS if selectors is None else selectors:
+        # Each search gets its own node allowance, so a `..` selector scanning a
+        # large document leaves the whole budget to the fallback extraction
+        search = Budget(budget.max_depth, budget.max_nodes, budget.max_chars)
+        items = select(obj, selector, search)
+        text = join_lines((item_text(item, index) for index, item in enumerate(items)), budget)
+        if text.strip():
+            return text
+        budget.chars = 0
+        budget.truncated = False
+    return None
@@ -0,0 +1,469 @@
+"""Bulk analysis of vCon files in a directory or a tar/zip archive
+
+Walks the input lazily, hands members to a process pool (via
+batch.run_batch, so at most two chunks per worker are in flight) and
+writes one result per member as NDJSON, or as Parquet / Arrow IPC part
+files when pyarrow is installed:
+
+    python ingest.py /data/vcons -o results.ndjson --workers 8
+    python ingest.py vcons.tar.gz -o results/ --format parquet --pack-from-path
+
+Workers open directory files, zip members and members of uncompressed
+tars themselves, so a member is read once, by the process that parses it,
+and embedded recordings are skipped by the streaming vCon reader. Members
+of compressed tars can only be read in order; they are passed inline
+while the members held in memory and not yet analyzed stay within
+INLINE_BUDGET_BYTES (each at most INLINE_MEMBER_BYTES), and through a
+temporary file otherwise, so memory is bounded in bytes whatever the
+number of workers.
+
+Progress is checkpointed next to the output. An interrupted run started
+again with the same arguments resumes: output written after the last
+checkpoint is discarded and only unfinished members are analyzed again.
+"""
+import argparse
+import fnmatch
+import glob
+import io
+import json
+import os
+import posixpath
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from functools import partial
+
+import batch
+import vcon
+
+DEFAULT_PATTERNS = ('*.json',)
+DEFAULT_CHUNK_SIZE = 16
+INLINE_MEMBER_BYTES = 1024 * 1024
+INLINE_BUDGET_BYTES = 64 * 1024 * 1024
+CHECKPOINT_EVERY = 1000
+CHECKPOINT_SECONDS = 30
+FORMATS = ('ndjson', 'parquet', 'arrow')
+
+# Column layout of the Parquet / Arrow output; "analysis" holds the full analysis as JSON
+COLUMNS = (('index', 'int64'), ('source', 'string'), ('id', 'string'), ('pack', 'string'), ('type', 'string'),
+           ('title', 'string'), ('confidence', 'float64'), ('analysis', 'string'), ('error', 'string'))
+
+_COMPRESSED_MAGIC = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')
+
+def _wanted(name, patterns):
+    base = name.rsplit('/', 1)[-1]
+    return not base.startswith('.') and any(fnmatch.fnmatch(base, pattern) for pattern in patterns)
+
+def _member_name(name):
+    """Return an archive member path without a leading './' or '/'"""
+    return posixpath.normpath(name).lstrip('/')
+
+def _tenant(name):
+    """Return the first directory of a member path, or None"""
+    head, sep, _ = name.partition('/')
+    return head if sep else None
+
+def iter_members(path, patterns=DEFAULT_PATTERNS, skip=None, inline=None):
+    """Yield (index, name, ref) for every matching file of a directory, archive or single file
+
+    Members are numbered in a stable order; those for which skip(index) is
+    true are passed over without being read. A ref is a small picklable
+    tuple that open_member turns into a binary file object in any process.
+    inline(size) tells whether a compressed tar member may be passed in
+    memory rather than spilled (default: up to INLINE_MEMBER_BYTES).
+    """
+    for index, (name, ref) in enumerate(_list_members(path, patterns)):
+        if skip is not None and skip(index):
+            continue
+        if callable(ref):
+            ref = ref(inline or (lambda size: size <= INLINE_MEMBER_BYTES))
+        yield index, name, ref
+
+def _list_members(path, patterns):
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                full = os.path.join(root, filename)
+                name = os.path.relpath(full, path).replace(os.sep, '/')
+                if _wanted(name, patterns):
+                    yield name, ('file', full)
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _wanted(info.filename, patterns):
+                    yield _member_name(info.filename), ('zip', path, info.filename)
+    elif tarfile.is_tarfile(path):
+        with open(path, 'rb') as f:
+            compressed = f.read(6).startswith(_COMPRESSED_MAGIC)
+        if not compressed:
+            with tarfile.open(path, 'r:') as archive:
+                for member in archive:
+                    if member.isfile() and _wanted(member.name, patterns):
+                        yield _member_name(member.name), ('tar', path, member.offset_data, member.size)
+            return
+        with tarfile.open(path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and _wanted(member.name, patterns):
+                    # Read only if the member is not skipped, before the stream moves on
+                    yield _member_name(member.name), partial(_read_streamed_member, archive, member)
+    else:
+        yield os.path.basename(path), ('file', path)
+
+def _read_streamed_member(archive, member, inline):
+    source = archive.extractfile(member)
+    if inline(member.size):
+        return ('bytes', source.read())
+    with tempfile.NamedTemporaryFile(prefix='vcon-ingest-', suffix='.json', delete=False) as spill:
+        try:
+            while True:
+                block = source.read(vcon.BLOCK_SIZE)
+                if not block:
+                    break
+                spill.write(block)
+        except BaseException:
+            spill.close()
+            os.remove(spill.name)
+            raise
+    return ('spill', spill.name)
+
+def _remove_spill(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class _Slice(io.RawIOBase):
+    """Read-only view of size bytes of a file starting at offset"""
+
+    def __init__(self, path, offset, size):
+        self.f = open(path, 'rb')
+        self.f.seek(offset)
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self.remaining:
+            n = self.remaining
+        data = self.f.read(n)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+_zip_archives = {}
+
+def open_member(ref):
+    """Return a binary file object reading the member a ref points at"""
+    kind = ref[0]
+    if kind in ('file', 'spill'):
+        return open(ref[1], 'rb')
+    if kind == 'zip':
+        archive = _zip_archives.get(ref[1])
+        if archive is None:
+            # Kept open for the life of the worker process
+            archive = _zip_archives[ref[1]] = zipfile.ZipFile(ref[1])
+        return archive.open(ref[2])
+    if kind == 'tar':
+        return _Slice(*ref[1:])
+    if kind == 'bytes':
+        return io.BytesIO(ref[1])
+    raise ValueError(f"Unknown member kind {kind!r}")
+
+def member_size(ref):
+    """Return the size in bytes of the member a ref points at"""
+    kind = ref[0]
+    if kind in ('file', 'spill'):
+        return os.path.getsize(ref[1])
+    if kind == 'zip':
+        open_member(ref).close()
+        return _zip_archives[ref[1]].getinfo(ref[2]).file_size
+    if kind == 'tar':
+        return ref[3]
+    return len(ref[1])
+
+def load_member(ref):
+    """Decode the JSON document of a member, streaming it only when it may embed large media"""
+    with open_member(ref) as f:
+        if member_size(ref) <= vcon.MAX_STRING:
+            # Small enough that no string in it needs skipping: use the C parser
+            return json.loads(f.read().decode('utf-8-sig', errors='replace'))
+        return vcon.load(f)
+
+def analyze_member(analyze, index, item):
+    """Parse and analyze one (name, ref, pack) member in a worker process and return its result line"""
+    name, ref, pack = item
+    result = {"index": index, "source": name, "id": None, "pack": pack}
+    try:
+        data = load_member(ref)
+        if isinstance(data, dict) and isinstance(data.get('uuid'), str):
+            result['id'] = data['uuid']
+        from app import transcript_from_json
+
+        result['analysis'] = analyze(pack, transcript_from_json(data))
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if ref[0] == 'spill':
+            _remove_spill(ref[1])
+    return result
+
+def analyze_path(path, analyze, patterns=DEFAULT_PATTERNS, pack=None, pack_from_path=False, packs=(),
+                 workers=None, chunksize=DEFAULT_CHUNK_SIZE, skip=None):
+    """Analyze every member of a directory or archive, yielding result lines in completion order
+
+    analyze(pack_name, transcript) runs in the workers. With pack_from_path
+    the first directory of each member path names its rule pack when it is
+    one of packs. skip(index) tells which members are already done.
+    """
+    # Spilled members not analyzed yet, removed here if the run stops early
+    spilled = {}
+    # Sizes of the members passed inline that are not analyzed yet
+    inlined = {}
+    held = [0]
+
+    def inline(size):
+        return size <= INLINE_MEMBER_BYTES and held[0] + size <= INLINE_BUDGET_BYTES
+
+    def items():
+        for index, name, ref in iter_members(path, patterns, skip, inline):
+            if ref[0] == 'spill':
+                spilled[index] = ref[1]
+            elif ref[0] == 'bytes':
+                inlined[index] = len(ref[1])
+                held[0] += len(ref[1])
+            tenant = _tenant(name) if pack_from_path else None
+            yield index, (name, ref, tenant if tenant in packs else pack)
+
+    # run_batch numbers the items again; results keep the member index
+    results = batch.run_batch(items(), analyze, workers=workers, chunksize=chunksize, process_item=_analyze_indexed)
+    try:
+        for result in results:
+            spilled.pop(result['index'], None)
+            held[0] -= inlined.pop(result['index'], 0)
+            yield result
+    finally:
+        # Shut the pool down first, so no worker is still reading a spill
+        results.close()
+        for spill in spilled.values():
+            _remove_spill(spill)
+
+def _analyze_indexed(analyze, position, pair):
+    index, item = pair
+    return analyze_member(analyze, index, item)
+
+class Progress:
+    """Which member indexes are done: all below next, plus those in done"""
+
+    def __init__(self, next=0, done=()):
+        self.next = next
+        self.done = set(done)
+
+    def add(self, index):
+        self.done.add(index)
+        while self.next in self.done:
+            self.done.remove(self.next)
+            self.next += 1
+
+    def __contains__(self, index):
+        return index < self.next or index in self.done
+
+def result_row(result):
+    """Flatten a result line into the columns of the Parquet / Arrow output"""
+    analysis = result.get('analysis')
+    return {
+        "index": result['index'],
+        "source": result['source'],
+        "id": result.get('id'),
+        "pack": result.get('pack'),
+        "type": analysis.get('type') if analysis else None,
+        "title": (analysis.get('projectTitle') or analysis.get('conversationTitle')) if analysis else None,
+        "confidence": analysis.get('confidence') if analysis else None,
+        "analysis": json.dumps(analysis) if analysis else None,
+        "error": result.get('error'),
+    }
+
+class NdjsonWriter:
+    """Append result lines to an NDJSON file; commit() makes them durable"""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        if path == '-':
+            self.f = sys.stdout.buffer
+            return
+        if state is None:
+            self.f = open(path, 'wb')
+        else:
+            # Drop lines written after the last checkpoint
+            self.f = open(path, 'r+b')
+            self.f.truncate(state['outputBytes'])
+            self.f.seek(0, os.SEEK_END)
+
+    def write(self, result):
+        self.f.write(json.dumps(result).encode('utf-8') + b'\n')
+
+    def commit(self):
+        self.f.flush()
+        if self.path == '-':
+            return {}
+        os.fsync(self.f.fileno())
+        return {"outputBytes": self.f.tell()}
+
+    def close(self):
+        if self.path != '-':
+            self.f.close()
+
+class PartsWriter:
+    """Write results as numbered Parquet or Arrow IPC part files in a directory, one per commit"""
+
+    def __init__(self, directory, fmt, state=None):
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError(f"{fmt} output needs pyarrow: pip install pyarrow") from None
+        self.pyarrow = pyarrow
+        # Fixed so that every part has the same schema, whatever its values
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in COLUMNS])
+        self.directory = directory
+        self.fmt = fmt
+        self.extension = '.parquet' if fmt == 'parquet' else '.arrow'
+        self.parts = state['parts'] if state else 0
+        self.rows = []
+        os.makedirs(directory, exist_ok=True)
+        # Parts written after the last checkpoint are redone
+        for path in glob.glob(os.path.join(directory, 'part-*' + self.extension + '*')):
+            number = os.path.basename(path)[len('part-'):].split('.')[0]
+            if path.endswith('.tmp') or not number.isdigit() or int(number) >= self.parts:
+                os.remove(path)
+
+    def write(self, result):
+        self.rows.append(result_row(result))
+
+    def commit(self):
+        if self.rows:
+            table = self.pyarrow.Table.from_pylist(self.rows, schema=self.schema)
+            path = os.path.join(self.directory, f"part-{self.parts:06d}{self.extension}")
+            temporary = path + '.tmp'
+            if self.fmt == 'parquet':
+                import pyarrow.parquet
+                pyarrow.parquet.write_table(table, temporary)
+            else:
+                import pyarrow.ipc
+                with pyarrow.ipc.new_file(temporary, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, path)
+            self.parts += 1
+            self.rows = []
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+def load_checkpoint(path, source):
+    """Return the saved state of an interrupted run over source, or None"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if state.get('input') != source:
+        raise ValueError(f"Checkpoint {path} belongs to a run over {state.get('input')}")
+    return state
+
+def save_checkpoint(path, state):
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+def ingest(path, output, fmt='ndjson', analyze=None, checkpoint=None, restart=False, patterns=DEFAULT_PATTERNS,
+           pack=None, pack_from_path=False, workers=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Analyze a directory or archive into output, resuming from checkpoint; return the run's counters"""
+    if analyze is None:
+        from app import analyze_with_rule_pack as analyze
+    from app import rule_packs
+
+    source = os.path.abspath(path)
+    if restart and checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    state = load_checkpoint(checkpoint, source)
+    if state is not None and state.get('format') != fmt:
+        raise ValueError(f"Checkpoint {checkpoint} was written for {state.get('format')} output")
+    progress = Progress(state['next'], state['done']) if state else Progress()
+    writer = NdjsonWriter(output, state) if fmt == 'ndjson' else PartsWriter(output, fmt, state)
+    counts = {"analyzed": state['analyzed'] if state else 0, "errors": state['errors'] if state else 0}
+    if state:
+        print(f"Resuming after {counts['analyzed']} members", file=sys.stderr)
+
+    def commit():
+        written = writer.commit()
+        if checkpoint:
+            save_checkpoint(checkpoint, dict(written, input=source, format=fmt, next=progress.next,
+                                             done=sorted(progress.done), **counts))
+
+    pending = 0
+    last_commit = time.monotonic()
+    try:
+        packs = {rule_pack.name for rule_pack in rule_packs.all()} if pack_from_path else ()
+        for result in analyze_path(path, analyze, patterns, pack or rule_packs.default, pack_from_path, packs,
+                                   workers, chunksize, skip=progress.__contains__):
+            writer.write(result)
+            progress.add(result['index'])
+            counts['analyzed'] += 1
+            counts['errors'] += 'error' in result
+            pending += 1
+            if pending >= CHECKPOINT_EVERY or time.monotonic() - last_commit > CHECKPOINT_SECONDS:
+                commit()
+                pending = 0
+                last_commit = time.monotonic()
+        commit()
+    finally:
+        writer.close()
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory or tar/zip archive of vCon files.")
+    parser.add_argument('input', help="directory, .tar[.gz|.bz2|.xz] or .zip archive, or a single file")
+    parser.add_argument('-o', '--output', default='-',
+                        help="NDJSON file (default: stdout), or a directory of part files for parquet/arrow")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="members per task")
+    parser.add_argument('--pattern', action='append', help="file name pattern to analyze (default: *.json)")
+    parser.add_argument('--pack', help="rule pack to analyze with (default: the default pack)")
+    parser.add_argument('--pack-from-path', action='store_true',
+                        help="use the member's top-level directory as its rule pack when one has that name")
+    parser.add_argument('--checkpoint', help="progress file (default: next to the output)")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    if args.format != 'ndjson' and args.output == '-':
+        parser.error(f"{args.format} output needs -o DIRECTORY")
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.output != '-':
+        checkpoint = (os.path.join(args.output, '_checkpoint.json') if args.format != 'ndjson'
+                      else args.output + '.checkpoint')
+
+    from app import rule_packs
+
+    if args.pack and rule_packs.get(args.pack) is None:
+        parser.error(f"unknown rule pack {args.pack!r}")
+    try:
+        counts = ingest(args.input, args.output, args.format, checkpoint=checkpoint, restart=args.restart,
+                        patterns=tuple(args.pattern or DEFAULT_PATTERNS), pack=args.pack,
+                        pack_from_path=args.pack_from_path, workers=args.workers, chunksize=args.chunk_size)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Analyzed {counts['analyzed']} vCons ({counts['errors']} errors)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Background job queue for slow work such as media transcription
+
+A job runs on a small worker pool and reports its status, progress and
+result so clients can poll for it instead of holding a request open.
+"""
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class Job:
+    """State of one background job"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.stage = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+
+    def update(self, progress=None, stage=None):
+        """Record progress (0..1) and/or the current stage; safe to call from the job"""
+        if progress is not None:
+            self.progress = max(self.progress, min(1.0, float(progress)))
+        if stage is not None:
+            self.stage = stage
+        self.updated = time.time()
+
+    def to_dict(self):
+        """Return the job as a JSON-serializable dict"""
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+        }
+        if self.status == DONE:
+            data["result"] = self.result
+        elif self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+class JobQueue:
+    """Run jobs on a bounded worker pool and keep their state for polling"""
+
+    def __init__(self, workers=2, ttl=3600):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.ttl = ttl
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, kind='job'):
+        """Queue func(job, *args); its return value becomes the job result"""
+        job = Job(kind)
+        with self.lock:
+            self._expire()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        """Return the job with this id, or None"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        """Return the number of known jobs per status"""
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def _run(self, job, func, args):
+        job.status = RUNNING
+        job.update()
+        try:
+            job.result = func(job, *args)
+            job.progress = 1.0
+            job.status = DONE
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = FAILED
+        job.update()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self.jobs.items()):
+            if job.status in (DONE, FAILED) and job.updated < cutoff:
+                del self.jobs[job_id]
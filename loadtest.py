@@ -0,0 +1,212 @@
+"""Load test for the analysis server
+
+Runs concurrent clients against a server for a fixed time and reports
+requests/sec and latency. --spawn starts the servers itself, so the
+production server can be compared with the development server:
+
+    python loadtest.py --spawn dev,prod --duration 20 --concurrency 16 --slow-clients 4
+    python loadtest.py --url http://127.0.0.1:8000 --mix analyze=1
+
+--slow-clients adds uploads that trickle their body in for the whole run,
+the case that makes one slow user stall everybody else.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from bench import generate_transcript, percentile
+
+DEFAULT_MIX = 'analyze=6,upload=3,sample=1'
+
+SERVERS = {
+    'dev': lambda port: [sys.executable, '-c',
+                         f"import app; app.app.run(use_reloader=False, port={port})"],
+    'prod': lambda port: [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}'],
+}
+
+def multipart(field, filename, content_type, data):
+    """Return (body, content type) of a multipart form with one file"""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def form(fields):
+    """Return (body, content type) of a urlencoded form"""
+    return urlencode(fields).encode('utf-8'), 'application/x-www-form-urlencoded'
+
+class Client:
+    """One simulated user issuing requests back to back on a keep-alive connection"""
+
+    def __init__(self, url, mix, transcript_size, cached, seed):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.mix = mix
+        self.cached = cached
+        self.transcript = generate_transcript(transcript_size, 'tech', seed=seed)
+        self.connection = None
+        self.latencies = []
+        self.errors = 0
+        self.count = 0
+
+    def request(self, method, path, body=None, content_type=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {'Content-Type': content_type} if content_type else {}
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return None
+
+    def next_request(self):
+        kind = self.mix[self.count % len(self.mix)]
+        # Unique transcripts keep the analysis cache from answering
+        transcript = self.transcript if self.cached else f"{self.transcript}\n\nQA: Ticket {self.count}-{id(self)}."
+        if kind == 'analyze':
+            return ('POST', '/analyze') + form({'transcript': transcript})
+        if kind == 'upload':
+            data = json.dumps({'transcript': transcript}).encode('utf-8')
+            return ('POST', '/upload-file') + multipart('file', 'call.json', 'application/json', data)
+        return 'GET', '/sample-transcript', None, None
+
+    def run(self, deadline):
+        while time.monotonic() < deadline:
+            method, path, body, content_type = self.next_request()
+            started = time.perf_counter()
+            status = self.request(method, path, body, content_type)
+            self.count += 1
+            if status != 200:
+                self.errors += 1
+            else:
+                self.latencies.append(time.perf_counter() - started)
+        if self.connection is not None:
+            self.connection.close()
+
+def slow_upload(url, deadline, rate=1024):
+    """Send a large upload at rate bytes/s until deadline, then hang up"""
+    parts = urlsplit(url)
+    size = 64 * 1024 * 1024
+    try:
+        with socket.create_connection((parts.hostname, parts.port or 80), timeout=10) as sock:
+            sock.sendall((f"POST /upload-file HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+                          f"Content-Type: multipart/form-data; boundary=x\r\nContent-Length: {size}\r\n\r\n"
+                          "--x\r\nContent-Disposition: form-data; name=\"file\"; filename=\"slow.json\"\r\n"
+                          "Content-Type: application/json\r\n\r\n").encode('ascii'))
+            chunk = b' ' * (rate // 10)
+            while time.monotonic() < deadline:
+                sock.sendall(chunk)
+                time.sleep(0.1)
+    except OSError:
+        pass
+
+def run_load(url, args):
+    """Run the configured load against url and return a summary dict"""
+    mix = []
+    for entry in args.mix.split(','):
+        name, _, weight = entry.partition('=')
+        mix.extend([name.strip()] * int(weight or 1))
+    clients = [Client(url, mix, args.transcript_size, args.cached, seed=index) for index in range(args.concurrency)]
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=slow_upload, args=(url, deadline), daemon=True)
+               for _ in range(args.slow_clients)]
+    threads += [threading.Thread(target=client.run, args=(deadline,)) for client in clients]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads[args.slow_clients:]:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    return {
+        "url": url,
+        "requests": len(latencies),
+        "errors": sum(client.errors for client in clients),
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+    }
+
+def wait_until_ready(url, process, timeout=60):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            connection.request('GET', '/sample-transcript')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the analysis server.")
+    parser.add_argument('--url', action='append', default=[], help="server to test (repeatable)")
+    parser.add_argument('--spawn', default='', help=f"start and test these servers: {', '.join(SERVERS)}")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per server")
+    parser.add_argument('--concurrency', type=int, default=8, help="simultaneous clients")
+    parser.add_argument('--slow-clients', type=int, default=0, help="clients trickling a large upload")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"request mix (default: {DEFAULT_MIX})")
+    parser.add_argument('--transcript-size', type=int, default=4096)
+    parser.add_argument('--cached', action='store_true', help="repeat one transcript so analyses are cached")
+    args = parser.parse_args(argv)
+
+    targets = [(url, url) for url in args.url]
+    for name in filter(None, args.spawn.split(',')):
+        targets.append((name, None))
+    if not targets:
+        parser.error("give --url or --spawn")
+
+    results = []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for label, url in targets:
+        process = None
+        if url is None:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process = subprocess.Popen(SERVERS[label](port), cwd=here,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if process is not None:
+                wait_until_ready(url, process)
+            result = run_load(url, args)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+        result['label'] = label
+        results.append(result)
+        print(f"{label:<28} {result['requests_per_s']:8.1f} req/s  p50 {result['p50_ms'] or 0:8.1f}ms  "
+              f"p99 {result['p99_ms'] or 0:8.1f}ms  {result['requests']} ok  {result['errors']} errors", flush=True)
+
+    if len(results) > 1 and results[0]['requests_per_s']:
+        baseline = results[0]
+        for result in results[1:]:
+            print(f"{result['label']}: {result['requests_per_s'] / baseline['requests_per_s']:.2f}x "
+                  f"the requests/sec of {baseline['label']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Request metrics and per-stage timing spans
+
+Counters and histograms are kept in process and rendered in the
+Prometheus text format. Code marks the stages of a request with
+`with span('name'):`; each span feeds the stage histogram and, when the
+current request asked for it, the request's `Server-Timing` header.
+
+When metrics are disabled `span()` returns a shared no-op object, so
+instrumented code costs one function call per stage.
+"""
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+
+enabled = True
+
+_local = threading.local()
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Bucketed histogram with optional labels"""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} "
+                                 f"{cumulative}")
+                label_text = _format_labels(self.labelnames, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+class Callback:
+    """Metric whose value is read from func() at scrape time
+
+    func returns a number, or a dict mapping label value tuples to numbers.
+    """
+
+    def __init__(self, name, help, func, kind='gauge', labelnames=()):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+stage_seconds = registry.add(Histogram(
+    'vcon_sdlc_stage_duration_seconds', 'Time spent in each named processing stage.', labelnames=('stage',)))
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe(elapsed, self.name)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    """Return a context manager that times one stage under name"""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+def start_request(collect_timings=False):
+    """Begin timing a request on this thread; spans are collected if asked to"""
+    _local.started = time.perf_counter()
+    _local.timings = {} if collect_timings else None
+
+def finish_request():
+    """End the request on this thread and return (elapsed seconds, stage timings or None)"""
+    started = getattr(_local, 'started', None)
+    timings = getattr(_local, 'timings', None)
+    _local.started = None
+    _local.timings = None
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    return elapsed, timings
+
+def server_timing(timings, total=None):
+    """Format stage timings (seconds) as a Server-Timing header value"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(entries)
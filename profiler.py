@@ -0,0 +1,147 @@
+"""On-demand profiling of a running worker
+
+Two ways of looking at where time goes in production, both reporting
+the functions with the most self time and stacks in the collapsed
+format flame graph tools read (`frame;frame;frame value` per line):
+
+- sample() polls the stacks of every thread of the process at a fixed
+  interval for a few seconds. It works on whatever the worker happens
+  to be doing, and costs the traced threads nothing beyond the GIL
+  slices the sampler itself takes.
+- Tracer records every Python and builtin call of one thread, with its
+  exact self time. It slows the traced code down several times and is
+  meant for a single flagged request. Calls of compiled regular
+  expressions are named by their pattern, so a regex that blows up on
+  one transcript stands out.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf frames of threads waiting for work, left out of samples unless asked for
+IDLE_FRAMES = {
+    'threading:Condition.wait', 'threading:Event.wait', 'threading:Thread._wait_for_tstate_lock', 'queue:Queue.get',
+    'selectors:PollSelector.select', 'selectors:EpollSelector.select', 'selectors:SelectSelector.select',
+    'socket:socket.accept', 'socket:SocketIO.readinto', 'concurrent.futures.thread:_worker',
+}
+
+PATTERN_CHARS = 60
+
+def frame_name(frame):
+    """Return the module:qualified name of the function a frame runs"""
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def builtin_name(function):
+    """Return the name of a builtin function or method; regex methods include their pattern"""
+    owner = getattr(function, '__self__', None)
+    if isinstance(owner, re.Pattern):
+        pattern = owner.pattern if isinstance(owner.pattern, str) else repr(owner.pattern)
+        if len(pattern) > PATTERN_CHARS:
+            pattern = pattern[:PATTERN_CHARS] + '...'
+        return f"re:{function.__name__}({pattern!r})"
+    module = getattr(function, '__module__', None) or type(owner).__module__
+    return f"{module}:{function.__qualname__}"
+
+def collapsed(stacks):
+    """Render {stack tuple: value} in the collapsed stack format, largest first"""
+    lines = []
+    for stack, value in sorted(stacks.items(), key=lambda item: -item[1]):
+        # ';' separates frames and the value follows the last space
+        lines.append(';'.join(frame.replace(';', ',') for frame in stack).replace('\n', ' ') + f' {value}')
+    return '\n'.join(lines) + ('\n' if lines else '')
+
+def sample(seconds, interval=0.005, idle=False, exclude=()):
+    """Sample the stacks of all threads but the calling ones; return (stack counts, samples taken)"""
+    skip = set(exclude) | {threading.get_ident()}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if not idle and stack[0] in IDLE_FRAMES:
+                continue
+            stacks[tuple(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+def top_functions(stacks, limit=30):
+    """Return [(function, self value, total value)] from stack values, by self value"""
+    self_values = Counter()
+    total_values = Counter()
+    for stack, value in stacks.items():
+        self_values[stack[-1]] += value
+        # A recursive function counts once per stack
+        for name in set(stack):
+            total_values[name] += value
+    return [(name, value, total_values[name]) for name, value in self_values.most_common(limit)]
+
+class Tracer:
+    """Deterministic profile of the calls made on one thread between start() and stop()"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.calls = Counter()
+        self.started = None
+        self.seconds = 0.0
+        # (stack tuple, entered, time spent in callees) of the calls in progress
+        self._frames = []
+
+    def start(self):
+        self.started = time.perf_counter()
+        sys.setprofile(self._event)
+
+    def stop(self):
+        sys.setprofile(None)
+        self.seconds = time.perf_counter() - self.started
+        self._frames.clear()
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            name = frame_name(frame) if event == 'call' else builtin_name(arg)
+            parent = self._frames[-1][0] if self._frames else ()
+            self._frames.append([parent + (name,), now, 0.0])
+            self.calls[name] += 1
+        elif self._frames:
+            # Returns of calls made before start() find nothing to pop
+            stack, entered, children = self._frames.pop()
+            elapsed = now - entered
+            self.stacks[stack] += elapsed - children
+            if self._frames:
+                self._frames[-1][2] += elapsed
+
+    def report(self, limit=30):
+        """Return the wall time, top functions by self time and collapsed stacks (in microseconds)"""
+        micros = Counter({stack: round(value * 1e6) for stack, value in self.stacks.items()})
+        return {
+            "seconds": round(self.seconds, 6),
+            "top": [{"function": name, "calls": self.calls[name], "selfSeconds": round(value / 1e6, 6),
+                     "totalSeconds": round(total / 1e6, 6)}
+                    for name, value, total in top_functions(micros, limit)],
+            "collapsed": collapsed(micros),
+        }
+
+def sample_report(stacks, samples, seconds, interval, limit=30):
+    """Return the top functions by self samples and the collapsed stacks of a sampling run"""
+    count = sum(stacks.values())
+    return {
+        "seconds": seconds,
+        "interval": interval,
+        "samples": samples,
+        "top": [{"function": name, "self": value, "total": total,
+                 "selfPercent": round(100 * value / count, 1) if count else 0.0}
+                for name, value, total in top_functions(stacks, limit)],
+        "collapsed": collapsed(stacks),
+    }
@@ -0,0 +1,84 @@
+"""Fast encoding of HTTP responses
+
+OrjsonProvider replaces Flask's JSON encoder with orjson when it is
+installed; the output is the same compact, key-sorted JSON. compress()
+negotiates gzip (or brotli, when the brotli package is installed) with
+the client's Accept-Encoding and compresses a finished response body.
+"""
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 3
+BROTLI_QUALITY = 4
+MIN_SIZE = 1024
+
+# Preferred first; the client's q-values decide between them
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/html', 'text/plain', 'text/css',
+                      'application/javascript')
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson"""
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Options orjson has no equivalent for (cls=, indent=, ...) use the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
+
+def json_provider_class():
+    """Return the fastest available JSON provider class"""
+    return OrjsonProvider if orjson is not None else DefaultJSONProvider
+
+def encode(data, encoding):
+    """Compress bytes with a content coding from ENCODINGS"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def compress(response, accept_encodings, min_size=MIN_SIZE):
+    """Compress a buffered response body in place with the best encoding the client accepts"""
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+    response.set_data(encode(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ, but the representation is equivalent
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
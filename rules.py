@@ -0,0 +1,284 @@
+"""Declarative rule packs for the transcript analyzers
+
+A rule pack is a JSON document (or YAML, when PyYAML is installed) with
+every table the analyzers use: tech keywords and their weights, title
+rules, requirement mappings, risk rules, phase templates, categories,
+priorities and action keywords. See rulepacks/default.json for the full
+format. A pack may start from another with `"extends": "default"`; each
+of its `tech` and `general` settings then replaces the inherited one.
+
+Packs are compiled once when loaded: all of a pack's keywords go into a
+single KeywordMatcher and the rules into tuples the analyzers only read.
+Every pack has a fingerprint (its version plus a hash of its content)
+that is part of the analysis cache key, so editing a pack invalidates the
+results it produced. RulePacks serves the packs of a directory and
+reloads a file when it changes on disk.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+PACK_EXTENSIONS = ('.json', '.yaml', '.yml')
+
+logger = logging.getLogger(__name__)
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+# Characters of text tokenized at a time, and distinct tokens remembered across blocks
+SCAN_BLOCK = 64 * 1024
+MAX_SEEN_TOKENS = 65536
+_WHITESPACE = re.compile(r'\s')
+
+def _blocks(text, size=SCAN_BLOCK):
+    """Yield consecutive slices of text of about size characters, cut at whitespace"""
+    start = 0
+    while start < len(text):
+        match = _WHITESPACE.search(text, start + size) if start + size < len(text) else None
+        end = match.end() if match else len(text)
+        yield text[start:end]
+        start = end
+
+class KeywordMatcher:
+    """Find every keyword of a fixed table in a lowercased text in one pass"""
+
+    def __init__(self, keywords):
+        keywords = set(keywords)
+        words = sorted((k for k in keywords if len(k.split()) == 1 and k == k.strip()),
+                       key=lambda k: (-len(k), k))
+        self.phrases = [(k, k.split()) for k in sorted(keywords - set(words))]
+        # Longest alternative first, so each position reports the widest keyword;
+        # the shorter keywords inside it are implied hits.
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(k) for k in words) + '))')
+        self.implied = {k: [w for w in words if w in k] for k in words}
+
+    def scan(self, text_lower):
+        """Return a dict mapping each keyword present in text_lower to its first offset"""
+        # A keyword without whitespace can only occur inside a single
+        # whitespace-delimited token, so the alternation runs over the
+        # distinct tokens of each block rather than the whole transcript.
+        # Tokens are gathered a block at a time and the set of tokens already
+        # searched is capped, so memory stays bounded on noisy transcripts.
+        found = set()
+        seen = set()
+        for block in _blocks(text_lower):
+            tokens = set(block.split())
+            tokens -= seen
+            if not tokens:
+                continue
+            for match in self.pattern.finditer('\n'.join(tokens)):
+                found.update(self.implied[match.group(1)])
+            if len(seen) + len(tokens) > MAX_SEEN_TOKENS:
+                seen.clear()
+            seen |= tokens
+
+        # find() stops at the first occurrence of a keyword that is present
+        hits = {keyword: text_lower.find(keyword) for keyword in found}
+        for phrase, _ in self.phrases:
+            offset = text_lower.find(phrase)
+            if offset >= 0:
+                hits[phrase] = offset
+        return hits
+
+def _keyword_rules(rules, label_key):
+    return tuple((tuple(rule['keywords']), rule[label_key]) for rule in rules)
+
+def _steps(steps, value_key):
+    """Return (threshold, value) pairs, highest threshold first"""
+    return tuple(sorted(((step['over'], step[value_key]) for step in steps), reverse=True))
+
+class RulePack:
+    """A rule pack compiled into a keyword matcher and decision tables"""
+
+    def __init__(self, data, source=None, name=None):
+        self.data = data
+        self.source = source
+        self.name = name or data.get('name') or os.path.splitext(os.path.basename(source or 'pack'))[0]
+        self.version = str(data.get('version', '0'))
+        content = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(content)
+
+        tech = data['tech']
+        keywords = tech['keywords']
+        self.tech_weights = dict(keywords) if isinstance(keywords, dict) else dict.fromkeys(keywords, 1)
+        self.tech_threshold = tech.get('threshold', 3)
+        # An optional trained classifier replaces the keyword threshold for routing
+        self.classifier = None
+        self.classifier_threshold = 0.5
+        self.dependencies = ()
+        if tech.get('classifier'):
+            from classifier import load_model
+
+            path = os.path.join(os.path.dirname(source or '.'), tech['classifier']['model'])
+            self.classifier = load_model(path)
+            self.classifier_threshold = tech['classifier'].get('threshold', 0.5)
+            self.dependencies = (path,)
+            digest.update(self.classifier.digest().encode('ascii'))
+        self.project_title_rules = _keyword_rules(tech.get('projectTitles', []), 'title')
+        self.default_project_title = tech.get('defaultProjectTitle', "Digital Project")
+        self.requirements = tuple(tech.get('requirements', {}).items())
+        self.default_requirements = tuple(tech.get('defaultRequirements', []))
+        weeks = tech.get('weeks', {})
+        self.default_weeks = weeks.get('default', 8)
+        self.week_steps = _steps(weeks.get('byRequirementCount', []), 'weeks')
+        self.phases = tuple(tech.get('phases', []))
+        self.risk_rules = tuple((tuple(tuple(group) for group in rule['all']), rule['risk'])
+                                for rule in tech.get('risks', []))
+        stakeholder_risk = tech.get('stakeholderRisk')
+        self.stakeholder_risk = (stakeholder_risk['over'], stakeholder_risk['risk']) if stakeholder_risk else None
+        self.default_risks = tuple(tech.get('defaultRisks', []))
+        self.default_stakeholders = tuple(tech.get('defaultStakeholders', []))
+
+        general = data['general']
+        self.conversation_title_rules = _keyword_rules(general.get('conversationTitles', []), 'title')
+        self.default_conversation_title = general.get('defaultConversationTitle', "General Discussion")
+        self.action_keywords = tuple(general.get('actionKeywords', []))
+        # Matches nothing when a pack has no action keywords
+        self.action_regex = re.compile('|'.join(re.escape(keyword) for keyword in self.action_keywords) or '(?!)')
+        self.default_action_items = tuple(general.get('defaultActionItems', []))
+        self.category_rules = _keyword_rules(general.get('categories', []), 'label')
+        self.default_categories = tuple(general.get('defaultCategories', []))
+        self.priority_rules = _keyword_rules(general.get('priorities', []), 'label')
+        self.default_priorities = tuple(general.get('defaultPriorities', []))
+        self.next_steps = tuple(general.get('nextSteps', []))
+        timeline = general.get('timeline', {})
+        self.default_timeline = timeline.get('default', "1-2 weeks")
+        self.timeline_steps = _steps(timeline.get('byActionCount', []), 'timeline')
+        self.default_participants = tuple(general.get('defaultParticipants', []))
+
+        self.matcher = KeywordMatcher(self.keywords())
+        self.fingerprint = f"{self.name}@{self.version}:{digest.hexdigest()[:16]}"
+
+    def keywords(self):
+        """Return every keyword referenced by the pack's rules"""
+        keywords = set(self.tech_weights) | {keyword for keyword, _ in self.requirements}
+        for rules in (self.project_title_rules, self.conversation_title_rules,
+                      self.category_rules, self.priority_rules):
+            for rule_keywords, _ in rules:
+                keywords.update(rule_keywords)
+        for groups, _ in self.risk_rules:
+            for group in groups:
+                keywords.update(group)
+        return keywords
+
+    def scan(self, text_lower):
+        """Return the keyword hits of a lowercased text"""
+        return self.matcher.scan(text_lower)
+
+    def is_tech(self, hits):
+        """Decide from the keyword hits whether a conversation is tech/SDLC related"""
+        return sum(weight for keyword, weight in self.tech_weights.items() if keyword in hits) >= self.tech_threshold
+
+    def describe(self):
+        """Return the pack's identity as a JSON-serializable dict"""
+        return {"name": self.name, "version": self.version, "fingerprint": self.fingerprint,
+                "source": self.source, "keywords": len(self.keywords()),
+                "classifier": self.dependencies[0] if self.classifier else None}
+
+def read_pack_file(path):
+    """Return the decoded document of a JSON or YAML rule pack file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        # Imported here: PyYAML is optional and slow to import
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"PyYAML is required to read {os.path.basename(path)}") from None
+        return yaml.safe_load(f)
+
+def is_pack_document(data):
+    """Return True if a decoded file is a rule pack: it has analyzer rules or extends a pack"""
+    return isinstance(data, dict) and any(key in data for key in ('tech', 'general', 'extends'))
+
+def merge_pack(base, data):
+    """Return data laid over the pack it extends"""
+    merged = dict(base, **{key: value for key, value in data.items() if key not in ('tech', 'general')})
+    merged.pop('extends', None)
+    for section in ('tech', 'general'):
+        merged[section] = dict(base.get(section, {}), **data.get(section, {}))
+    return merged
+
+class RulePacks:
+    """Compiled rule packs of a directory, reloaded when their files change"""
+
+    def __init__(self, directory, default='default', check_interval=1.0):
+        self.directory = directory
+        self.default = default
+        self.check_interval = check_interval
+        self.packs = {}
+        self.mtimes = {}
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        self.reload()
+
+    def get(self, name=None):
+        """Return the compiled pack called name (default pack if None), or None if unknown"""
+        if time.monotonic() - self.checked > self.check_interval:
+            self.reload()
+        return self.packs.get(name or self.default)
+
+    def all(self):
+        """Return the loaded packs, sorted by name"""
+        if time.monotonic() - self.checked > self.check_interval:
+            self.reload()
+        packs = dict(self.packs)
+        return [packs[name] for name in sorted(packs)]
+
+    def reload(self):
+        """Recompile packs whose files changed; a pack that fails to compile keeps its last version"""
+        with self.lock:
+            self.checked = time.monotonic()
+            files = {}
+            for filename in os.listdir(self.directory):
+                name, extension = os.path.splitext(filename)
+                if extension in PACK_EXTENSIONS:
+                    path = os.path.join(self.directory, filename)
+                    # A pack also changes when a file it loads (a classifier model) does
+                    previous = self.packs.get(name)
+                    dependencies = previous.dependencies if previous is not None else ()
+                    files[name] = (path, tuple(_mtime(p) for p in (path,) + dependencies))
+            if {name: mtime for name, (_, mtime) in files.items()} == self.mtimes:
+                return
+
+            # A pack is rebuilt when it or the pack it extends changed
+            documents = {}
+            for name, (path, mtime) in files.items():
+                try:
+                    data = read_pack_file(path)
+                except (OSError, ValueError) as e:
+                    logger.error("Could not read rule pack %s: %s", path, e)
+                    continue
+                # Other files kept with the packs, such as classifier models, are not packs
+                if is_pack_document(data):
+                    documents[name] = data
+            packs = {}
+            for name in documents:
+                try:
+                    packs[name] = RulePack(self._resolve(name, documents), files[name][0], name)
+                except Exception as e:
+                    logger.error("Could not load rule pack %s: %s: %s", files[name][0], type(e).__name__, e)
+            for name, pack in packs.items():
+                previous = self.packs.get(name)
+                if previous is None or previous.fingerprint != pack.fingerprint:
+                    self.packs[name] = pack
+            for name in list(self.packs):
+                if name not in files:
+                    del self.packs[name]
+            self.mtimes = {name: mtime for name, (_, mtime) in files.items()}
+
+    def _resolve(self, name, documents, seen=()):
+        data = documents[name]
+        parent = data.get('extends')
+        if not parent:
+            return data
+        if parent in seen or parent not in documents:
+            raise ValueError(f"Rule pack {name} extends unknown or circular pack {parent}")
+        return merge_pack(self._resolve(parent, documents, seen + (name,)), data)
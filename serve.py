@@ -0,0 +1,193 @@
+"""Production server for the analysis app
+
+Runs `app:create_app()` under gunicorn with preforked worker processes,
+each handling requests on a pool of threads, so one slow upload only
+holds one thread. The app is imported and warmed up once in the master
+and shared with the workers by fork.
+
+    python serve.py --workers 2 --threads 16 --bind 0.0.0.0:8000
+
+Background jobs (/jobs/<id>) and live sessions (/sessions/<id>) are kept
+in the worker process that created them, and a proxy's sticky sessions
+cannot pin a client to one worker behind the shared socket: use them
+with WEB_WORKERS=1 and scale with threads. More workers suit stateless
+analysis traffic only; serve.py warns when started that way.
+
+`python serve.py --measure-startup` reports what a cold start costs, in
+fresh interpreters with and without the warm-up: interpreter start, the
+import of the app broken down by module, create_app() and the first
+requests, which load the subsystems imported on first use.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+APP_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter; prints the stage timings as JSON on the last line
+STARTUP_PROBE = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+# The test client's own imports are not part of serving
+client = app.app.test_client()
+client.get('/not-a-page')
+import sys
+ready = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+sys.stderr.write('startup probe: requests\\n')
+client.post('/analyze', data={'transcript': app.TECH_SAMPLE})
+analyzed = time.perf_counter()
+client.post('/upload-file', data={'file': (__import__('io').BytesIO(b'{"transcript": "A: hello"}'), 'probe.json',
+                                           'application/json')})
+uploaded = time.perf_counter()
+client.post('/analyze', data={'transcript': app.GENERAL_SAMPLE})
+steady = time.perf_counter()
+import json
+print(json.dumps({'import app': imported - started, 'create_app()': created - ready,
+                  'first POST /analyze': analyzed - created, 'first JSON upload': uploaded - analyzed,
+                  'next POST /analyze': steady - uploaded}))
+"""
+
+def options_from_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the analysis app with gunicorn.")
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:8000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 1)),
+                        help="worker processes (default: WEB_WORKERS or 1)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 16)),
+                        help="request threads per worker (default: WEB_THREADS or 16)")
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WEB_TIMEOUT', 120)),
+                        help="seconds before a silent worker is restarted")
+    parser.add_argument('--measure-startup', action='store_true',
+                        help="report the cold start cost of the app instead of serving it")
+    args = parser.parse_args(argv)
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        'preload_app': True,
+        'accesslog': '-',
+    }
+
+def parse_importtime(lines):
+    """Return (depth, name, self seconds, cumulative seconds) per line of `python -X importtime` output"""
+    entries = []
+    for line in lines:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    return entries
+
+def probe_startup(warm_up):
+    """Start the app in a fresh interpreter; return its stage timings and the imports before and after create_app()"""
+    env = dict(os.environ, WARM_UP='1' if warm_up else '0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_PROBE], cwd=APP_DIRECTORY, env=env,
+                            capture_output=True, text=True, check=True)
+    stages = json.loads(result.stdout.strip().splitlines()[-1])
+    lines = result.stderr.splitlines()
+    marker = lines.index('startup probe: requests')
+    return stages, parse_importtime(lines[:marker]), parse_importtime(lines[marker:])
+
+def measure_startup(top=8):
+    """Print the cold start breakdown with and without the warm-up"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    interpreter = time.perf_counter() - started
+
+    def row(label, seconds, indent=2):
+        print(f"{' ' * indent}{label:<{40 - indent}}{seconds * 1000:9.1f} ms")
+
+    imported = set()
+    for warm_up in (True, False):
+        stages, startup, later = probe_startup(warm_up)
+        print(f"Cold start with WARM_UP={int(warm_up)}")
+        row('interpreter start', interpreter)
+        row('import app', stages['import app'])
+        # What `import app` pulled in: the depth-1 entries between the previous depth-0 entry and it
+        app_index = next(i for i, (depth, name, _, _) in enumerate(startup) if depth == 0 and name == 'app')
+        first = max((i for i in range(app_index) if startup[i][0] == 0), default=-1) + 1
+        children = [entry for entry in startup[first:app_index] if entry[0] == 1]
+        for _, name, _, cumulative in sorted(children, key=lambda entry: -entry[3])[:top]:
+            row(name, cumulative, 4)
+        row('app module body', startup[app_index][2], 4)
+        for stage in ('create_app()', 'first POST /analyze', 'first JSON upload', 'next POST /analyze'):
+            row(stage, stages[stage])
+        row('time to first analysis', interpreter + stages['import app'] + stages['create_app()']
+            + stages['first POST /analyze'])
+        lazy = [(name, cumulative) for depth, name, _, cumulative in later if depth == 0]
+        if lazy:
+            print('  imported on first use: ' + ', '.join(f"{name} ({seconds * 1000:.1f} ms)"
+                                                          for name, seconds in lazy))
+        print()
+        imported.update(name for _, name, _, _ in startup + later)
+
+    stale = stale_bytecode(imported)
+    if stale:
+        print("No up-to-date bytecode for " + ', '.join(stale) + "; every cold start compiles them from source.")
+        print("Precompile them when building the image: python -m compileall -q .")
+
+def stale_bytecode(modules):
+    """Return the app's source files among modules whose cached bytecode is missing or older than the source"""
+    import importlib.util
+
+    stale = []
+    for module in sorted(modules):
+        source = os.path.join(APP_DIRECTORY, f'{module}.py')
+        if os.path.exists(source):
+            cached = importlib.util.cache_from_source(source)
+            if not os.path.exists(cached) or os.stat(cached).st_mtime < os.stat(source).st_mtime:
+                stale.append(os.path.basename(source))
+    return stale
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if '--measure-startup' in argv:
+        measure_startup()
+        return 0
+    options = options_from_args(argv)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("serve.py needs gunicorn: pip install gunicorn", file=sys.stderr)
+        return 1
+    if options['workers'] > 1:
+        print(f"Running {options['workers']} workers: background jobs and live sessions stay in the worker "
+              "that created them, so /jobs/<id> and /sessions/<id> may answer 404; use --workers 1 for them",
+              file=sys.stderr)
+    if options['workers'] > 1 and not os.environ.get('TRANSCRIPT_HANDLE_DIR'):
+        # Any worker may get the /analyze that follows an upload, so handles go where all of them see them
+        import atexit
+        import shutil
+        import tempfile
+
+        directory = os.environ['TRANSCRIPT_HANDLE_DIR'] = tempfile.mkdtemp(prefix='vcon-transcripts-')
+        master = os.getpid()
+        # Workers exit through the same handlers; only the master's exit removes the directory
+        atexit.register(lambda: os.getpid() == master and shutil.rmtree(directory, ignore_errors=True))
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import create_app
+            return create_app()
+
+    Server().run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,568 @@
+"""Similar conversations and recurring action items with MinHash and LSH
+
+Comparing a transcript with every stored one is O(n) per lookup and
+O(n^2) for an archive. Instead each text is reduced to a MinHash
+signature (NUM_PERM 32-bit minima of its hashed word shingles), whose
+agreement with another signature estimates the Jaccard similarity of the
+two shingle sets. Signatures are split into BANDS bands; texts sharing a
+band are candidates, so a lookup only scores the few documents that
+collide with it (texts at a Jaccard similarity of 0.5 share a band with
+~64% probability, at 0.8 with >99.9%, at 0.2 with ~3%).
+
+SimilarityIndex is incremental and compact: signatures live in one
+`array('I')`, band keys in a sorted `array('Q')` with a parallel doc
+array (searched by bisection) plus a small dict of recent additions that
+is merged in as it grows. On disk, signatures and document records are
+appended as they are added, and the merged band table is snapshotted,
+so reopening an index only re-bands the documents added since.
+
+ConversationIndex keeps two of them, one of transcripts and one of
+action items, and adds to them from a background thread. Near-duplicate
+action items are merged into the first one seen, with a count.
+
+Archives are indexed from the command line (items as for batch.py, with
+optional "id", "title", "pack" and "actionItems" fields):
+
+    python similarity.py index transcripts.jsonl --index similarity/
+    python similarity.py query transcript.txt --index similarity/ -k 5
+"""
+import argparse
+import bisect
+import heapq
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FORMAT_VERSION = 1
+NUM_PERM = 64
+BANDS = 16
+SEED = 1
+
+# Word n-grams hashed for transcripts and for action items
+CONVERSATION_SHINGLE = 3
+ACTION_SHINGLE = 1
+# Estimated similarity above which an action item is merged into an earlier one
+ACTION_SIMILARITY = 0.7
+# Transcripts this similar are counted as another occurrence of the same conversation
+DUPLICATE_SIMILARITY = 0.95
+
+# Band table entries added before they are merged into the sorted arrays
+MERGE_MIN = 4096
+# Most recent documents considered per band bucket, and candidates scored per lookup
+MAX_BUCKET = 256
+MAX_CANDIDATES = 1000
+# Shingles hashed per numpy pass, bounding the temporary (chunk x NUM_PERM) matrix
+NUMPY_CHUNK = 8192
+# Most shingles hashed per text: a longer text is represented by its numerically
+# smallest shingle hashes (a bottom-k sample, the same for every text), which
+# bounds the hashing time of a long transcript without numpy
+MAX_SHINGLES = 2048
+
+MASK64 = (1 << 64) - 1
+FNV_PRIME = 0x100000001B3
+WORD_REGEX = re.compile(r"\w+(?:'\w+)*")
+
+logger = logging.getLogger(__name__)
+
+def shingles(text, size=CONVERSATION_SHINGLE):
+    """Return the set of 32-bit hashes of the lowercased word n-grams of text"""
+    words = WORD_REGEX.findall(text.lower())
+    if len(words) < size:
+        words = [' '.join(words)] if words else []
+        size = 1
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+class MinHasher:
+    """NUM_PERM universal hash functions ((a * x + b) mod 2^64) >> 32 and their minima over a set"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED, max_shingles=MAX_SHINGLES):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.max_shingles = max_shingles
+        self.a = [rng.getrandbits(64) | 1 for _ in range(num_perm)]
+        self.b = [rng.getrandbits(64) for _ in range(num_perm)]
+
+    def signature(self, hashes):
+        """Return the signature of a set of 32-bit hashes as array('I'), or None for an empty set"""
+        if not hashes:
+            return None
+        if self.max_shingles and len(hashes) > self.max_shingles:
+            hashes = heapq.nsmallest(self.max_shingles, hashes)
+        if numpy is not None:
+            return self._numpy_signature(hashes)
+        # x >> 32 is monotonic, so the shift can follow the minimum
+        return array('I', [min([(a * x + b) & MASK64 for x in hashes]) >> 32 for a, b in zip(self.a, self.b)])
+
+    def _numpy_signature(self, hashes):
+        values = numpy.fromiter(hashes, dtype=numpy.uint64, count=len(hashes))
+        a = numpy.array(self.a, dtype=numpy.uint64)
+        b = numpy.array(self.b, dtype=numpy.uint64)
+        minima = numpy.full(self.num_perm, MASK64, dtype=numpy.uint64)
+        # uint64 arithmetic wraps around, which is the mod 2^64
+        for start in range(0, len(values), NUMPY_CHUNK):
+            chunk = values[start:start + NUMPY_CHUNK, None]
+            numpy.minimum(minima, (chunk * a + b).min(axis=0), out=minima)
+        return array('I', (minima >> numpy.uint64(32)).astype(numpy.uint32).tobytes())
+
+def similarity(first, second):
+    """Estimate the Jaccard similarity of two sets from their signatures"""
+    return sum(map(int.__eq__, first, second)) / len(first)
+
+def band_keys(signature, bands=BANDS):
+    """Return the 64-bit key of each band of a signature; the band number is part of the key"""
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        key = band + 1
+        for value in signature[band * rows:(band + 1) * rows]:
+            key = ((key ^ value) * FNV_PRIME) & MASK64
+        keys.append(key)
+    return keys
+
+class IndexLocked(RuntimeError):
+    """Another process has the index open for writing"""
+
+class SimilarityIndex:
+    """Incremental MinHash LSH index of documents, in memory or persisted in a directory
+
+    Each document has a signature, a JSON-serializable record (what a
+    lookup returns about it) and a count of the times it was added again
+    as a near-duplicate.
+    """
+
+    def __init__(self, path=None, num_perm=NUM_PERM, bands=BANDS, seed=SEED):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        self.hasher = MinHasher(num_perm, seed)
+        self.signatures = array('I')
+        self.records = []
+        self.counts = array('I')
+        # Sorted band table of the documents up to `banded`, and the band keys added since
+        self.band_keys = array('Q')
+        self.band_docs = array('I')
+        self.banded = 0
+        self.recent = {}
+        self.recent_size = 0
+        self.merging = {}
+        self.merging_size = 0
+        self.lock = threading.Lock()
+        self.merge_lock = threading.Lock()
+        self._files = None
+        self.pid = None
+        if path is not None:
+            self._open(path)
+
+    def __len__(self):
+        return len(self.records)
+
+    def signature(self, hashes):
+        """Return the signature of a set of shingle hashes under this index's hash functions"""
+        return self.hasher.signature(hashes)
+
+    def add(self, signature, record, merge_above=None, where=None):
+        """Add a document and return (doc, False)
+
+        With merge_above, a document at least that similar to an existing one
+        (whose record where accepts, if given) is counted as another
+        occurrence of that one instead, and (that doc, True) is returned.
+        """
+        if self._files is not None and os.getpid() != self.pid:
+            # A forked child shares the parent's lock and files but not its document numbers
+            raise IndexLocked(f"Similarity index {self.path} was opened by process {self.pid}; open it after forking")
+        if merge_above is not None:
+            found = self.query(signature, 1, merge_above, where)
+            if found:
+                doc = found[0][1]
+                with self.lock:
+                    self.counts[doc] += 1
+                    if self._files is not None:
+                        self._files['hits'].write(array('I', [doc]).tobytes())
+                        self._files['hits'].flush()
+                return doc, True
+        line = json.dumps(record, separators=(',', ':'))
+        with self.lock:
+            doc = len(self.records)
+            self.signatures.extend(signature)
+            self.records.append(line)
+            self.counts.append(1)
+            if self._files is not None:
+                # The signature goes first: a record never exists without one
+                self._files['signatures'].write(signature.tobytes())
+                self._files['signatures'].flush()
+                self._files['records'].write(line.encode('utf-8') + b'\n')
+                self._files['records'].flush()
+            self._band(doc)
+            merge = self._merge_due()
+        if merge:
+            self._merge()
+        return doc, False
+
+    def query(self, signature, k=5, min_similarity=0.0, where=None):
+        """Return up to k (similarity, doc) of the most similar documents, best first
+
+        where, if given, is a predicate on a document's record.
+        """
+        with self.lock:
+            candidates = Counter()
+            for key in band_keys(signature, self.bands):
+                candidates.update(self._bucket(key))
+            scored = []
+            for doc, _ in candidates.most_common(MAX_CANDIDATES):
+                start = doc * self.num_perm
+                score = similarity(signature, self.signatures[start:start + self.num_perm])
+                if score >= min_similarity:
+                    scored.append((score, doc))
+        results = []
+        for score, doc in sorted(scored, key=lambda item: (-item[0], -item[1])):
+            if where is None or where(self.record(doc)):
+                results.append((score, doc))
+                if len(results) == k:
+                    break
+        return results
+
+    def record(self, doc):
+        """Return the record of a document"""
+        return json.loads(self.records[doc])
+
+    def stats(self):
+        """Return the number of documents, the occurrences they stand for and the band table size"""
+        with self.lock:
+            return {"documents": len(self.records), "occurrences": sum(self.counts),
+                    "bandEntries": len(self.band_keys) + self.merging_size + self.recent_size}
+
+    def close(self):
+        """Close the index files"""
+        with self.lock:
+            files, self._files = self._files, None
+        for f in (files or {}).values():
+            f.close()
+
+    def _bucket(self, key):
+        """Yield the most recent documents of a band bucket"""
+        room = MAX_BUCKET
+        for table in (self.recent, self.merging):
+            found = table.get(key, ())
+            if isinstance(found, int):
+                found = (found,)
+            yield from found[::-1][:room]
+            room -= len(found)
+            if room <= 0:
+                return
+        position = bisect.bisect_right(self.band_keys, key)
+        while position > 0 and room > 0 and self.band_keys[position - 1] == key:
+            position -= 1
+            room -= 1
+            yield self.band_docs[position]
+
+    def _band(self, doc):
+        start = doc * self.num_perm
+        for key in band_keys(self.signatures[start:start + self.num_perm], self.bands):
+            # Most keys hold one document, which is kept without a list
+            found = self.recent.get(key)
+            if found is None:
+                self.recent[key] = doc
+            elif isinstance(found, int):
+                self.recent[key] = [found, doc]
+            else:
+                found.append(doc)
+        self.recent_size += self.bands
+
+    def _merge_due(self):
+        # Geometric growth keeps the cost of merging linear in the number of documents
+        return self.recent_size >= max(MERGE_MIN, len(self.band_keys) // 4)
+
+    def _merge(self):
+        """Merge the recent band keys into the sorted table, without blocking lookups meanwhile"""
+        if not self.merge_lock.acquire(blocking=False):
+            return
+        try:
+            with self.lock:
+                if not self._merge_due():
+                    return
+                self.merging, self.recent = self.recent, {}
+                self.merging_size, self.recent_size = self.recent_size, 0
+                banded = len(self.records)
+            # Lookups keep using the old table and the keys being merged until the swap
+            keys, docs = self._merged(self.band_keys, self.band_docs, self.merging)
+            with self.lock:
+                self.band_keys, self.band_docs, self.banded = keys, docs, banded
+                self.merging, self.merging_size = {}, 0
+            if self._files is not None:
+                self._save_bands(keys, docs, banded)
+        finally:
+            self.merge_lock.release()
+
+    @staticmethod
+    def _merged(keys, docs, added):
+        pairs = [(key, doc) for key, found in added.items()
+                 for doc in ((found,) if isinstance(found, int) else found)]
+        if numpy is not None:
+            all_keys = numpy.concatenate([numpy.frombuffer(keys, dtype=numpy.uint64),
+                                          numpy.fromiter((key for key, _ in pairs), numpy.uint64, len(pairs))])
+            all_docs = numpy.concatenate([numpy.frombuffer(docs, dtype=numpy.uint32),
+                                          numpy.fromiter((doc for _, doc in pairs), numpy.uint32, len(pairs))])
+            order = numpy.lexsort((all_docs, all_keys))
+            return array('Q', all_keys[order].tobytes()), array('I', all_docs[order].tobytes())
+        merged_keys, merged_docs = array('Q'), array('I')
+        for key, doc in heapq.merge(zip(keys, docs), sorted(pairs)):
+            merged_keys.append(key)
+            merged_docs.append(doc)
+        return merged_keys, merged_docs
+
+    def _save_bands(self, keys, docs, banded):
+        path = os.path.join(self.path, 'bands.bin')
+        with open(path + '.tmp', 'wb') as f:
+            array('Q', [banded, len(keys)]).tofile(f)
+            keys.tofile(f)
+            docs.tofile(f)
+        os.replace(path + '.tmp', path)
+
+    def _open(self, path):
+        os.makedirs(path, exist_ok=True)
+        lock = open(os.path.join(path, 'lock'), 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                raise IndexLocked(f"Similarity index {path} is open in another process") from None
+
+        meta_path = os.path.join(path, 'index.json')
+        meta = {"version": FORMAT_VERSION, "numPerm": self.num_perm, "bands": self.bands, "seed": self.seed,
+                "maxShingles": self.hasher.max_shingles, "byteorder": sys.byteorder}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored != meta:
+                lock.close()
+                raise ValueError(f"Similarity index {path} was built with different settings: {stored}")
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+        signatures_path = os.path.join(path, 'signatures.bin')
+        records_path = os.path.join(path, 'records.jsonl')
+        hits_path = os.path.join(path, 'hits.bin')
+        signatures = array('I')
+        if os.path.exists(signatures_path):
+            with open(signatures_path, 'rb') as f:
+                data = f.read()
+            signatures.frombytes(data[:len(data) - len(data) % signatures.itemsize])
+        lines = []
+        if os.path.exists(records_path):
+            with open(records_path, 'rb') as f:
+                # A line cut short by a crash has no newline
+                lines = [line for line in f if line.endswith(b'\n')]
+        # Keep the documents written completely, and drop the rest from the files
+        count = min(len(signatures) // self.num_perm, len(lines))
+        del signatures[count * self.num_perm:]
+        del lines[count:]
+        records = [line[:-1].decode('utf-8') for line in lines]
+        records_size = sum(map(len, lines))
+        self.pid = os.getpid()
+        self._files = {
+            'lock': lock,
+            'signatures': open(signatures_path, 'ab'),
+            'records': open(records_path, 'ab'),
+            'hits': open(hits_path, 'ab'),
+        }
+        self._files['signatures'].truncate(count * self.num_perm * signatures.itemsize)
+        self._files['records'].truncate(records_size)
+        self.signatures = signatures
+        self.records = records
+        self.counts = array('I', [1]) * count
+
+        hits = array('I')
+        if os.path.exists(hits_path):
+            with open(hits_path, 'rb') as f:
+                data = f.read()
+            hits.frombytes(data[:len(data) - len(data) % hits.itemsize])
+        for doc in hits:
+            if doc < count:
+                self.counts[doc] += 1
+
+        bands_path = os.path.join(path, 'bands.bin')
+        if os.path.exists(bands_path):
+            header = array('Q')
+            with open(bands_path, 'rb') as f:
+                header.fromfile(f, 2)
+                banded, entries = header
+                if banded <= count:
+                    self.band_keys.fromfile(f, entries)
+                    self.band_docs.fromfile(f, entries)
+                    self.banded = banded
+        with self.lock:
+            for doc in range(self.banded, count):
+                self._band(doc)
+        self._merge()
+
+class ConversationIndex:
+    """Similar past conversations and recurring action items, indexed by a background thread"""
+
+    def __init__(self, path=None, max_pending=1000, num_perm=NUM_PERM, bands=BANDS):
+        self.conversations = SimilarityIndex(path and os.path.join(path, 'conversations'), num_perm, bands)
+        self.actions = SimilarityIndex(path and os.path.join(path, 'actions'), num_perm, bands)
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.indexed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.writer = None
+
+    def add(self, key, transcript, action_items=(), title=None, pack=None, created=None):
+        """Queue a conversation (and its extracted action items) to be indexed
+
+        Never blocks: when the queue is full the conversation is dropped,
+        counted and False is returned.
+        """
+        self._start_writer()
+        try:
+            self.pending.put_nowait((key, transcript, list(action_items), title, pack, created or time.time()))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Wait until every queued conversation is indexed"""
+        self.pending.join()
+
+    def similar(self, transcript, k=5, pack=None, exclude_key=None, min_similarity=0.1):
+        """Return the k indexed conversations most similar to a transcript, most similar first"""
+        signature = self.conversations.signature(shingles(transcript, CONVERSATION_SHINGLE))
+        if signature is None:
+            return []
+        found = self.conversations.query(
+            signature, k, min_similarity,
+            lambda record: record.get('pack') == pack and (exclude_key is None or record.get('key') != exclude_key))
+        return [dict(self.conversations.record(doc), similarity=round(score, 3),
+                     occurrences=self.conversations.counts[doc]) for score, doc in found]
+
+    def recurring_actions(self, action_items, pack=None, min_similarity=ACTION_SIMILARITY):
+        """Return the action items that were seen in indexed conversations, with the first wording seen"""
+        results = []
+        for item in action_items:
+            signature = self.actions.signature(shingles(item, ACTION_SHINGLE))
+            if signature is None:
+                continue
+            found = self.actions.query(signature, 1, min_similarity, lambda record: record.get('pack') == pack)
+            if found:
+                score, doc = found[0]
+                record = self.actions.record(doc)
+                results.append({"actionItem": item, "firstSeen": record['text'], "key": record.get('key'),
+                                "occurrences": self.actions.counts[doc], "similarity": round(score, 3)})
+        return results
+
+    def stats(self):
+        """Return the size of both indexes and indexing counters"""
+        return {"conversations": self.conversations.stats(), "actionItems": self.actions.stats(),
+                "pending": self.pending.qsize(), "indexed": self.indexed, "failed": self.failed,
+                "dropped": self.dropped}
+
+    def index(self, key, transcript, action_items=(), title=None, pack=None, created=None):
+        """Index a conversation and its action items now, in the calling thread"""
+        created = round(created or time.time(), 3)
+        signature = self.conversations.signature(shingles(transcript or '', CONVERSATION_SHINGLE))
+        if signature is not None:
+            self.conversations.add(signature, {"key": key, "title": title, "pack": pack, "created": created},
+                                   DUPLICATE_SIMILARITY, lambda record: record.get('pack') == pack)
+        for item in dict.fromkeys(action_items):
+            signature = self.actions.signature(shingles(item, ACTION_SHINGLE))
+            if signature is not None:
+                # Merged into the closest earlier wording of the same tenant's action item
+                self.actions.add(signature, {"text": item, "key": key, "pack": pack}, ACTION_SIMILARITY,
+                                 lambda record: record.get('pack') == pack)
+        self.indexed += 1
+
+    def close(self):
+        """Close both indexes"""
+        self.conversations.close()
+        self.actions.close()
+
+    def _start_writer(self):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_loop, name='similarity-index', daemon=True)
+                    self.writer.start()
+
+    def _write_loop(self):
+        while True:
+            entry = self.pending.get()
+            try:
+                self.index(*entry)
+            except Exception:
+                # Any error costs the conversation, never the writer thread
+                self.failed += 1
+                logger.exception("Could not index conversation %s", entry[0])
+            finally:
+                self.pending.task_done()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query a similar-conversation index.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help="add the transcripts of a JSON list or NDJSON/JSONL file")
+    index_parser.add_argument('input', help="JSON list or NDJSON/JSONL file of transcripts ('-' for stdin)")
+    index_parser.add_argument('--index', required=True, help="index directory")
+    index_parser.add_argument('--pack', help="tenant (rule pack) of transcripts that name none")
+    query_parser = commands.add_parser('query', help="find the conversations most similar to a transcript")
+    query_parser.add_argument('transcript', help="text file ('-' for stdin)")
+    query_parser.add_argument('--index', required=True, help="index directory")
+    query_parser.add_argument('--pack')
+    query_parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    index = ConversationIndex(args.index)
+    try:
+        if args.command == 'query':
+            text = sys.stdin.read() if args.transcript == '-' else open(args.transcript, encoding='utf-8').read()
+            for result in index.similar(text, args.k, args.pack):
+                print(json.dumps(result))
+            return 0
+
+        from batch import read_items
+
+        started = time.perf_counter()
+        count = 0
+        for number, item in enumerate(read_items(args.input)):
+            if not isinstance(item, dict):
+                item = {"transcript": item}
+            if not isinstance(item.get('transcript'), str):
+                continue
+            index.index(str(item.get('id', number)), item['transcript'], item.get('actionItems') or (),
+                        item.get('title'), item.get('pack', args.pack))
+            count += 1
+        elapsed = time.perf_counter() - started
+        print(f"Indexed {count} transcripts in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s, "
+              f"{'numpy' if numpy is not None else 'pure Python'} hashing): {json.dumps(index.stats())}",
+              file=sys.stderr)
+        return 0
+    finally:
+        index.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""Persistent store of analyses with indexed and full-text search
+
+Each analyzed conversation becomes a row of `conversations` (type, title,
+timeline in weeks, rule pack, time of analysis and the analysis itself),
+one row per requirement, stakeholder, risk, action item, category and
+priority in `facets` (indexed by kind and value), and an FTS5 document
+with its title, facts and transcript. Searches combine those indexes and
+page through results newest first with a keyset cursor, so a query costs
+milliseconds however many conversations are stored.
+
+Writes are queued and committed by a background thread in batches, so
+storing an analysis adds no database work to the request that made it.
+"""
+import base64
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from cache import _closing
+
+SCHEMA_VERSION = 1
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+WRITE_BATCH = 256
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    created REAL NOT NULL,
+    pack TEXT,
+    type TEXT NOT NULL,
+    title TEXT,
+    timeline_weeks INTEGER,
+    analysis TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_created ON conversations (created, id);
+CREATE INDEX IF NOT EXISTS conversations_type ON conversations (type, created, id);
+CREATE INDEX IF NOT EXISTS conversations_weeks ON conversations (timeline_weeks, created);
+CREATE TABLE IF NOT EXISTS facets (
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS facets_value ON facets (kind, value, conversation_id);
+CREATE INDEX IF NOT EXISTS facets_conversation ON facets (conversation_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS conversation_text USING fts5 (title, facts, transcript);
+"""
+
+# Analysis fields stored as facets, by facet kind
+FACETS = {
+    'requirement': 'requirements',
+    'stakeholder': ('stakeholders', 'participants'),
+    'risk': 'riskFactors',
+    'action': 'actionItems',
+    'category': 'categories',
+    'priority': 'priorities',
+}
+
+WEEKS_REGEX = re.compile(r'(\d+)(?:\s*-\s*(\d+))?\s*(week|month|day)', re.IGNORECASE)
+WORD_REGEX = re.compile(r'\w+')
+
+def timeline_weeks(timeline):
+    """Return the longest duration a timeline such as "12 weeks total" or "2-3 weeks" allows, in whole weeks"""
+    match = WEEKS_REGEX.search(timeline or '')
+    if match is None:
+        return None
+    value = int(match.group(2) or match.group(1))
+    unit = match.group(3).lower()
+    if unit == 'month':
+        return value * 4
+    if unit == 'day':
+        return -(-value // 7)
+    return value
+
+def facet_values(analysis):
+    """Yield (kind, value) for every stored fact of an analysis"""
+    for kind, fields in FACETS.items():
+        for field in (fields,) if isinstance(fields, str) else fields:
+            for value in analysis.get(field) or ():
+                if isinstance(value, str):
+                    yield kind, value
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching documents with every word"""
+    return ' '.join(f'"{word}"' for word in WORD_REGEX.findall(text))
+
+def encode_cursor(created, conversation_id):
+    return base64.urlsafe_b64encode(json.dumps([created, conversation_id]).encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        created, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(created), int(conversation_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+
+class AnalysisStore:
+    """SQLite store of analyses, written by a background thread"""
+
+    def __init__(self, path, max_pending=1000):
+        self.path = path
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.writer = None
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                db.executescript(SCHEMA)
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def add(self, analysis, transcript=None, key=None, pack=None, created=None):
+        """Queue an analysis (and its transcript, for full-text search) to be stored
+
+        Never blocks: when the queue is full the analysis is dropped, counted
+        and False is returned.
+        """
+        self._start_writer()
+        try:
+            self.pending.put_nowait((key, created or time.time(), pack, analysis, transcript))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Wait until every queued analysis is stored"""
+        self.pending.join()
+
+    def search(self, q=None, type=None, pack=None, since=None, until=None, min_weeks=None, max_weeks=None,
+               facets=(), limit=DEFAULT_LIMIT, cursor=None):
+        """Return a page of stored conversations matching every given filter, newest first
+
+        facets is a list of (kind, value) pairs that must all be present. The
+        result carries the matching conversations and the cursor of the next
+        page (None on the last page).
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        clauses, params = [], []
+        columns = "c.id, c.created, c.pack, c.type, c.title, c.timeline_weeks, c.analysis"
+        tables = "conversations c"
+        if q and fts_query(q):
+            columns += ", snippet(conversation_text, -1, '[', ']', '...', 12)"
+            tables += " JOIN conversation_text ON conversation_text.rowid = c.id"
+            clauses.append("conversation_text MATCH ?")
+            params.append(fts_query(q))
+        else:
+            columns += ", NULL"
+        for column, operator, value in (("c.type", "=", type), ("c.pack", "=", pack),
+                                        ("c.created", ">=", since), ("c.created", "<", until),
+                                        ("c.timeline_weeks", ">=", min_weeks),
+                                        ("c.timeline_weeks", "<=", max_weeks)):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        for kind, value in facets:
+            clauses.append("c.id IN (SELECT conversation_id FROM facets WHERE kind = ? AND value = ?)")
+            params.extend((kind, value))
+        if cursor:
+            clauses.append("(c.created, c.id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT {columns} FROM {tables} {where} ORDER BY c.created DESC, c.id DESC LIMIT ?"
+        with self._connect() as db:
+            rows = db.execute(sql, params + [limit + 1]).fetchall()
+
+        results = []
+        for conversation_id, created, pack_name, kind, title, weeks, analysis, snippet in rows[:limit]:
+            result = {"id": conversation_id, "created": created, "pack": pack_name, "type": kind, "title": title,
+                      "timelineWeeks": weeks, "analysis": json.loads(analysis)}
+            if snippet is not None:
+                result['snippet'] = snippet
+            results.append(result)
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return {"results": results, "next": next_cursor}
+
+    def get(self, conversation_id):
+        """Return a stored conversation by id, or None"""
+        with self._connect() as db:
+            row = db.execute("SELECT id, created, pack, type, title, timeline_weeks, analysis "
+                             "FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "created": row[1], "pack": row[2], "type": row[3], "title": row[4],
+                "timelineWeeks": row[5], "analysis": json.loads(row[6])}
+
+    def stats(self):
+        """Return the number of stored conversations and write counters"""
+        with self._connect() as db:
+            count = db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {"conversations": count, "pending": self.pending.qsize(), "written": self.written,
+                "failed": self.failed, "dropped": self.dropped}
+
+    def _start_writer(self):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_loop, name='analysis-store', daemon=True)
+                    self.writer.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._connect() as db:
+                    for entry in batch:
+                        self._insert(db, *entry)
+                self.written += len(batch)
+            except Exception:
+                # Any error costs the batch, never the writer thread
+                self.failed += len(batch)
+                logger.exception("Could not store %d analyses", len(batch))
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+
+    def _insert(self, db, key, created, pack, analysis, transcript):
+        title = analysis.get('projectTitle') or analysis.get('conversationTitle')
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO conversations (key, created, pack, type, title, timeline_weeks, analysis) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, created, pack, analysis.get('type', ''), title, timeline_weeks(analysis.get('timeline')),
+             json.dumps(analysis)))
+        if not cursor.rowcount:
+            return
+        conversation_id = cursor.lastrowid
+        facets = list(dict.fromkeys(facet_values(analysis)))
+        db.executemany("INSERT INTO facets (conversation_id, kind, value) VALUES (?, ?, ?)",
+                       [(conversation_id, kind, value) for kind, value in facets])
+        db.execute("INSERT INTO conversation_text (rowid, title, facts, transcript) VALUES (?, ?, ?, ?)",
+                   (conversation_id, title, '\n'.join(value for _, value in facets), transcript or ''))
+
+    def _connect(self):
+        # One connection per operation keeps this thread-safe; WAL lets searches run during writes
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute("PRAGMA journal_mode = WAL")
+        return _closing(db)
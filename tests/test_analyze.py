@@ -0,0 +1,48 @@
+import pytest
+
+import app as app_module
+
+TRANSCRIPT = ("Client: We need a mobile app with a dashboard and an API for payments.\n\n"
+              "Developer: The backend will use a database in the cloud, with authentication.")
+
+@pytest.fixture
+def client():
+    app_module.analysis_cache.clear()
+    return app_module.app.test_client()
+
+def test_analyze_sets_a_weak_etag(client):
+    response = client.post('/analyze', data={'transcript': TRANSCRIPT})
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert weak and etag == app_module.analysis_cache.key(TRANSCRIPT, app_module.rule_packs.get().fingerprint)
+
+def test_analyze_answers_304_to_a_matching_etag(client):
+    first = client.post('/analyze', data={'transcript': TRANSCRIPT})
+    response = client.post('/analyze', data={'transcript': TRANSCRIPT},
+                           headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_analyze_ignores_the_etag_of_another_transcript(client):
+    first = client.post('/analyze', data={'transcript': TRANSCRIPT})
+    response = client.post('/analyze', data={'transcript': TRANSCRIPT + "\n\nQA: And tests."},
+                           headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
+
+def test_analyze_serves_the_cached_analysis(client):
+    first = client.post('/analyze', data={'transcript': TRANSCRIPT})
+    hits = app_module.analysis_cache.stats()['hits']
+    # Line endings and surrounding whitespace do not change the key
+    second = client.post('/analyze', data={'transcript': "  " + TRANSCRIPT.replace("\n", "\r\n") + "\n"})
+    assert second.get_json() == first.get_json()
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert app_module.analysis_cache.stats()['hits'] == hits + 1
+
+def test_analyze_with_similar_has_no_etag(client):
+    first = client.post('/analyze', data={'transcript': TRANSCRIPT})
+    response = client.post('/analyze?similar=3', data={'transcript': TRANSCRIPT},
+                           headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert 'similarConversations' in response.get_json()
@@ -0,0 +1,75 @@
+import extract
+
+def nested(depth, text="a message that is long enough"):
+    """Return depth levels of {"child": ...} around {"note": text}"""
+    obj = {"note": text}
+    for _ in range(depth):
+        obj = {"child": obj}
+    return obj
+
+def test_extract_text_in_document_order():
+    obj = {"title": "Kickoff call with the client", "short": "skip me",
+           "items": [{"text": "First we talk about the budget"}, {"text": "Then about the schedule"}]}
+    assert extract.extract_text(obj) == ("title: Kickoff call with the client\n\n"
+                                         "text: First we talk about the budget\n\ntext: Then about the schedule\n\n")
+
+def test_depth_budget_skips_deep_containers():
+    budget = extract.Budget(max_depth=3)
+    assert extract.extract_text(nested(10), budget) == ""
+    assert budget.deep_containers == 1
+    assert budget.report()["deepContainersSkipped"] == 1
+
+    budget = extract.Budget(max_depth=10)
+    assert extract.extract_text(nested(10), budget) == "note: a message that is long enough\n\n"
+    assert budget.deep_containers == 0
+
+def test_depth_budget_does_not_recurse():
+    # Far deeper than the interpreter's recursion limit
+    obj = nested(100000)
+    budget = extract.Budget(max_depth=200000)
+    assert extract.extract_text(obj, budget) == "note: a message that is long enough\n\n"
+
+def test_node_budget():
+    obj = {"entries": [{"text": f"entry number {i} of the list"} for i in range(1000)]}
+    budget = extract.Budget(max_nodes=50)
+    text = extract.extract_text(obj, budget)
+    assert budget.out_of_nodes and budget.exhausted
+    assert budget.report() == {"nodes": 50, "deepContainersSkipped": 0, "nodeLimitReached": True,
+                               "truncated": False}
+    assert 0 < text.count("text: ") < 50
+
+def test_char_budget_truncates_output():
+    obj = [{"text": "x" * 100} for _ in range(100)]
+    budget = extract.Budget(max_chars=250)
+    text = extract.extract_text(obj, budget)
+    assert len(text) == 250
+    assert budget.truncated and budget.report()["truncated"]
+
+def test_join_lines_stops_at_char_budget():
+    consumed = []
+
+    def lines():
+        for i in range(1000):
+            consumed.append(i)
+            yield f"Speaker: line {i}"
+
+    budget = extract.Budget(max_chars=100)
+    text = extract.join_lines(lines(), budget)
+    assert len(text) == 100
+    assert len(consumed) < 10
+
+def test_selected_transcript_gets_a_fresh_node_budget_per_selector():
+    obj = {"results": {"utterances": [{"speaker": 0, "transcript": "Hello there"},
+                                      {"speaker": 1, "transcript": "Hi, how are you"}]}}
+    budget = extract.Budget(max_nodes=1000)
+    assert extract.selected_transcript(obj, budget=budget) == "Speaker 1: Hello there\n\nSpeaker 2: Hi, how are you"
+
+def test_upload_reports_what_the_budgets_cut(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'JSON_MAX_TEXT_CHARS', 40)
+    report = {}
+    transcript = app.transcript_from_json({"transcript": "word " * 100}, report)
+    assert len(transcript) == 40
+    assert report["truncated"]
+    assert app.json_upload_result(transcript, report)["extraction"] == report
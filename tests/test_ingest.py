@@ -0,0 +1,83 @@
+import json
+import os
+import tarfile
+
+import pytest
+
+import ingest
+
+def first_run(pack, transcript):
+    return {"run": 1, "transcript": transcript}
+
+def second_run(pack, transcript):
+    return {"run": 2, "transcript": transcript}
+
+def write_corpus(directory, count=6):
+    os.makedirs(directory)
+    for index in range(count):
+        document = {"vcon": "0.0.1", "uuid": f"call-{index}", "parties": [{"name": "Alice"}],
+                    "dialog": [{"type": "text", "originator": 0, "body": f"Call number {index}"}]}
+        with open(os.path.join(directory, f"call-{index}.json"), 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.fixture(params=['directory', 'tar.gz'])
+def corpus(request, tmp_path):
+    directory = str(tmp_path / 'corpus')
+    write_corpus(directory)
+    if request.param == 'directory':
+        return directory
+    archive = str(tmp_path / 'corpus.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(directory, arcname='corpus')
+    return archive
+
+def test_ingest_analyzes_every_member(corpus, tmp_path):
+    output = str(tmp_path / 'out.ndjson')
+    counts = ingest.ingest(corpus, output, analyze=first_run, checkpoint=output + '.checkpoint', workers=2,
+                           chunksize=2)
+    assert counts == {"analyzed": 6, "errors": 0}
+    lines = sorted(read_lines(output), key=lambda line: line['index'])
+    assert [line['id'] for line in lines] == [f"call-{index}" for index in range(6)]
+    assert lines[3]['analysis']['transcript'] == "Alice: Call number 3"
+    assert not os.path.exists(output + '.checkpoint')
+
+def test_ingest_resumes_from_checkpoint(corpus, tmp_path):
+    output = str(tmp_path / 'out.ndjson')
+    checkpoint = output + '.checkpoint'
+    ingest.ingest(corpus, output, analyze=first_run, workers=1)
+    committed = [line for line in read_lines(output) if line['index'] in (0, 1, 2, 4)]
+
+    # An interrupted run: members 0-2 and 4 committed, then a line written after the last checkpoint
+    with open(output, 'wb') as f:
+        for line in committed:
+            f.write(json.dumps(line).encode('utf-8') + b'\n')
+        output_bytes = f.tell()
+        f.write(b'{"index": 3, "partial')
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        json.dump({"input": os.path.abspath(corpus), "format": "ndjson", "next": 3, "done": [4],
+                   "outputBytes": output_bytes, "analyzed": 4, "errors": 0}, f)
+
+    counts = ingest.ingest(corpus, output, analyze=second_run, checkpoint=checkpoint, workers=2, chunksize=1)
+    assert counts == {"analyzed": 6, "errors": 0}
+    lines = {line['index']: line for line in read_lines(output)}
+    assert sorted(lines) == list(range(6))
+    assert {index for index, line in lines.items() if line['analysis']['run'] == 2} == {3, 5}
+    assert not os.path.exists(checkpoint)
+
+def test_checkpoint_of_another_input_is_refused(corpus, tmp_path):
+    checkpoint = str(tmp_path / 'out.ndjson.checkpoint')
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        json.dump({"input": "/elsewhere", "format": "ndjson", "next": 0, "done": []}, f)
+    with pytest.raises(ValueError):
+        ingest.ingest(corpus, str(tmp_path / 'out.ndjson'), analyze=first_run, checkpoint=checkpoint, workers=1)
+
+def test_progress_tracks_out_of_order_completion():
+    progress = ingest.Progress()
+    for index in (1, 3, 0):
+        progress.add(index)
+    assert progress.next == 2 and progress.done == {3}
+    assert 1 in progress and 3 in progress and 2 not in progress
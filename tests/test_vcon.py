@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+import vcon
+
+class Trickle(io.RawIOBase):
+    """A binary file that returns at most size bytes per read, so tokens straddle reads"""
+
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        chunk = self.data[self.pos:self.pos + self.size]
+        self.pos += len(chunk)
+        return chunk
+
+DOCUMENT = {
+    "vcon": "0.0.1",
+    "uuid": "018e0d6a-0000-8000-8000-000000000000",
+    "parties": [{"name": "Alice"}, {"tel": "+15551234"}],
+    "dialog": [
+        {"type": "text", "originator": 0, "mimetype": "text/plain", "body": "Café at 9 — \"quoted\" \\ ok"},
+        {"type": "text", "originator": 1, "mimetype": "text/plain", "body": "Numbers 12345.678e-2 and \U0001f600"},
+    ],
+    "analysis": [],
+    "attachments": [],
+    "meta": {"flag": True, "none": None, "nested": [1, [2, [3]], {"k": -0.5}]},
+}
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64])
+def test_load_across_read_boundaries(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    assert vcon.load(Trickle(data, size)) == DOCUMENT
+
+def test_load_across_block_boundaries_with_bom():
+    data = b'\xef\xbb\xbf' + json.dumps(DOCUMENT).encode('utf-8')
+    stream = vcon.JsonStream(io.BytesIO(data), block_size=5)
+    assert stream.read_value() == DOCUMENT
+
+def test_load_text_file():
+    assert vcon.load(io.StringIO(json.dumps(DOCUMENT))) == DOCUMENT
+
+def test_load_skips_large_media():
+    recording = {"type": "recording", "mimetype": "audio/x-wav", "encoding": "base64url", "body": "A" * 5000}
+    document = dict(DOCUMENT, dialog=DOCUMENT['dialog'] + [recording], note="N" * 5000)
+    data = json.dumps(document).encode('utf-8')
+    loaded = vcon.load(Trickle(data, 100), max_string=1000)
+    body = loaded['dialog'][2]['body']
+    assert isinstance(body, vcon.Skipped) and body.length == 5000
+    # Only strings below dialog and attachments are skipped
+    assert loaded['note'] == "N" * 5000
+    assert loaded['dialog'][0] == DOCUMENT['dialog'][0]
+
+def test_transcript_ignores_skipped_media():
+    recording = {"type": "recording", "mimetype": "audio/x-wav", "encoding": "base64url", "body": "A" * 5000}
+    data = json.dumps(dict(DOCUMENT, dialog=DOCUMENT['dialog'] + [recording])).encode('utf-8')
+    transcript = vcon.transcript_from_vcon(vcon.load(io.BytesIO(data), max_string=1000))
+    assert transcript.splitlines()[0].startswith("Alice: Café")
+    assert "+15551234: Numbers" in transcript
+    assert "AAAA" not in transcript
+
+@pytest.mark.parametrize('text', [
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{"a": [1 2]}',
+    '{"a": {"b" 1}}',
+    '{"a": 1,}',
+    '{"a": 1',
+    '{"a": "open',
+    '{"a": 1} 2',
+])
+def test_load_rejects_malformed_json(text):
+    with pytest.raises(ValueError):
+        vcon.load(io.BytesIO(text.encode('utf-8')))
@@ -0,0 +1,143 @@
+"""Server-side handles for extracted transcripts
+
+An upload keeps the transcript it extracted here and answers with an id
+and a preview instead of the whole text; /analyze accepts the id, so a
+large transcript does not travel back and forth through the browser.
+Transcripts are held gzip-compressed (and served as-is to clients that
+accept gzip), evicted oldest first once their total size passes a
+budget, and expire after a TTL.
+
+Handles live in the process's memory by default. Given a directory they
+are kept there as one file per id instead, so every worker process of a
+server sees the handles the others made.
+"""
+import gzip
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+GZIP_LEVEL = 3
+HANDLE_REGEX = re.compile(r'[0-9a-f]{32}')
+
+class TranscriptHandles:
+    """Compressed transcripts by id, bounded in total size and age"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600, directory=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, transcript):
+        """Store a transcript and return its id, or None if it alone exceeds the size budget"""
+        data = gzip.compress(transcript.encode('utf-8', errors='surrogatepass'), compresslevel=GZIP_LEVEL, mtime=0)
+        if len(data) > self.max_bytes:
+            return None
+        handle = uuid.uuid4().hex
+        now = time.time()
+        if self.directory is not None:
+            path = self._path(handle)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            # Renamed into place, so other processes never read a partial file
+            os.replace(path + '.tmp', path)
+            self._sweep(now)
+            return handle
+        with self.lock:
+            self._expire(now)
+            self.entries[handle] = (now + self.ttl, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+        return handle
+
+    def get_compressed(self, handle):
+        """Return the gzip-compressed UTF-8 transcript with this id, or None"""
+        now = time.time()
+        if self.directory is not None:
+            if not HANDLE_REGEX.fullmatch(handle):
+                return None
+            path = self._path(handle)
+            try:
+                with open(path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_mtime + self.ttl > now:
+                        return f.read()
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        with self.lock:
+            entry = self.entries.get(handle)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= now:
+                del self.entries[handle]
+                self.size -= len(data)
+                return None
+            return data
+
+    def get(self, handle):
+        """Return the transcript with this id, or None if it is unknown or expired"""
+        data = self.get_compressed(handle)
+        if data is None:
+            return None
+        return gzip.decompress(data).decode('utf-8', errors='surrogatepass')
+
+    def stats(self):
+        """Return the number and compressed size of the held transcripts"""
+        if self.directory is not None:
+            files = self._files()
+            return {"transcripts": len(files), "bytes": sum(size for _, size, _ in files),
+                    "evictions": self.evictions}
+        with self.lock:
+            return {"transcripts": len(self.entries), "bytes": self.size, "evictions": self.evictions}
+
+    def _path(self, handle):
+        return os.path.join(self.directory, handle + '.gz')
+
+    def _files(self):
+        """Return (modified, size, path) of the handle files in the directory, oldest first"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.gz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(files)
+
+    def _sweep(self, now):
+        """Remove expired handle files, then the oldest until the directory fits the size budget"""
+        files = self._files()
+        size = sum(size for _, size, _ in files)
+        for modified, file_size, path in files:
+            if modified + self.ttl > now and size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+            if modified + self.ttl > now:
+                self.evictions += 1
+
+    def _expire(self, now):
+        # Entries are in insertion order, so the expired ones come first
+        while self.entries:
+            handle, (expires, data) = next(iter(self.entries.items()))
+            if expires > now:
+                break
+            del self.entries[handle]
+            self.size -= len(data)
@@ -0,0 +1,303 @@
+"""Streaming reader for vCon documents
+
+A vCon (IETF draft) carries `parties`, `dialog`, `analysis` and
+`attachments`. Recordings are embedded as base64 `body` strings that can
+run to hundreds of MB, so documents are read with a small pull tokenizer
+over the file object: strings under `dialog` and `attachments` longer than
+`max_string` are skipped in place and never materialized.
+"""
+import base64
+import binascii
+import codecs
+import json
+import re
+
+BLOCK_SIZE = 64 * 1024
+MAX_STRING = 1024 * 1024
+
+# Top-level keys whose large strings (media bodies) are skipped
+MEDIA_KEYS = ('dialog', 'attachments')
+
+TRANSCRIPT_ANALYSIS_TYPES = ('transcript', 'transcription')
+
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_STRING_CHARS = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+# Loose on purpose: json.loads validates the token once it is complete
+_SCALAR = re.compile(r'[-+.0-9eE]+|[a-z]+')
+
+class Skipped:
+    """Placeholder for a string that was too large to materialize"""
+
+    def __init__(self, length):
+        self.length = length
+
+    def __repr__(self):
+        return f"Skipped({self.length})"
+
+class JsonStream:
+    """Pull tokenizer over a (text or binary) JSON file object"""
+
+    def __init__(self, f, block_size=BLOCK_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self.decoder = None
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        raw = self.f.read(self.block_size)
+        if not raw:
+            self.eof = True
+        if isinstance(raw, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+            data = self.decoder.decode(raw, final=self.eof)
+        else:
+            data = raw[1:] if raw.startswith('\ufeff') and not self.buf and self.pos == 0 else raw
+        if self.eof and not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def next_token(self, limit=None):
+        """Return the next (kind, value) token; kind is a punctuation char, 'value' or ''"""
+        char = self.peek()
+        if char == '':
+            return '', None
+        if char in '{}[]:,':
+            self.pos += 1
+            return char, None
+        if char == '"':
+            return 'value', self._string(limit)
+
+        match = _SCALAR.match(self.buf, self.pos)
+        # A number or literal may continue in the next block
+        while match is not None and match.end() == len(self.buf) and self._fill():
+            match = _SCALAR.match(self.buf, self.pos)
+        if match is None:
+            raise ValueError(f"Invalid JSON near {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos = match.end()
+        return 'value', json.loads(match.group())
+
+    def _string(self, limit):
+        self.pos += 1
+        parts = []
+        size = 0
+        while True:
+            end = _STRING_CHARS.match(self.buf, self.pos).end()
+            closed = end < len(self.buf) and self.buf[end] == '"'
+            piece = self.buf[self.pos:end]
+            size += len(piece)
+            if limit is None or size <= limit:
+                parts.append(piece)
+            self.pos = end + 1 if closed else end
+            if closed:
+                break
+            if not self._fill():
+                raise ValueError("Unterminated string in JSON")
+        if limit is not None and size > limit:
+            return Skipped(size)
+        return json.loads('"' + ''.join(parts) + '"')
+
+    def read_value(self, limit=None):
+        """Read the next complete value; strings longer than limit become Skipped"""
+        stack = []
+        # The next token must be a 'value', a 'key', ':' or ',' (or the end
+        # of the container where closable, i.e. when empty or after a member)
+        expect = 'value'
+        closable = False
+        while True:
+            kind, value = self.next_token(None if expect == 'key' else limit)
+            if kind == '':
+                raise ValueError("Unexpected end of JSON")
+            if kind in '}]':
+                if not stack or not closable or (kind == '}') != isinstance(stack[-1][0], dict):
+                    raise ValueError(f"Unexpected '{kind}' in JSON")
+                value = stack.pop()[0]
+                if not stack:
+                    return value
+                expect, closable = ',', True
+                continue
+            if kind in ',:':
+                if expect != kind:
+                    raise ValueError(f"Unexpected '{kind}' in JSON")
+                expect = 'key' if kind == ',' and isinstance(stack[-1][0], dict) else 'value'
+                closable = False
+                continue
+            if expect in ',:':
+                raise ValueError(f"Expected '{expect}' in JSON")
+            if expect == 'key':
+                if kind != 'value' or not isinstance(value, str):
+                    raise ValueError("Expected an object key in JSON")
+                stack[-1][1] = value
+                expect, closable = ':', False
+                continue
+
+            if kind == '{':
+                value = {}
+            elif kind == '[':
+                value = []
+            if stack:
+                container, key = stack[-1]
+                if isinstance(container, dict):
+                    container[key] = value
+                else:
+                    container.append(value)
+            if kind in '{[':
+                stack.append([value, None])
+                expect, closable = 'key' if kind == '{' else 'value', True
+            elif not stack:
+                return value
+            else:
+                expect, closable = ',', True
+
+def load(f, max_string=MAX_STRING):
+    """Load a JSON document from a file object, skipping oversized media strings
+
+    Only strings below the top-level `dialog` and `attachments` keys are
+    subject to max_string; everything else is materialized as usual.
+    """
+    stream = JsonStream(f)
+    if stream.peek() != '{':
+        value = stream.read_value()
+    else:
+        stream.next_token()
+        value = {}
+        kind = stream.next_token()[0] if stream.peek() == '}' else ','
+        while kind != '}':
+            if kind != ',':
+                raise ValueError("Expected ',' or '}' in JSON")
+            kind, key = stream.next_token()
+            if kind != 'value' or not isinstance(key, str):
+                raise ValueError("Expected an object key in JSON")
+            if stream.next_token()[0] != ':':
+                raise ValueError("Expected ':' in JSON")
+            value[key] = stream.read_value(max_string if key in MEDIA_KEYS else None)
+            kind = stream.next_token()[0]
+    if stream.peek() != '':
+        raise ValueError("Extra data after JSON document")
+    return value
+
+def is_vcon(data):
+    """Return True if the decoded JSON looks like a vCon document"""
+    return isinstance(data, dict) and ('vcon' in data or isinstance(data.get('dialog'), list))
+
+def party_names(parties):
+    """Return a display name for every party, in party index order"""
+    names = []
+    for index, party in enumerate(parties if isinstance(parties, list) else []):
+        name = None
+        if isinstance(party, dict):
+            name = party.get('name') or party.get('tel') or party.get('mailto') or party.get('role')
+        names.append(str(name) if name else f"Speaker {index + 1}")
+    return names
+
+def _party_index(value):
+    while isinstance(value, list) and value:
+        value = value[0]
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+def _speaker_name(names, value, default="Speaker"):
+    if isinstance(value, str) and value:
+        return value
+    index = _party_index(value)
+    if index is not None:
+        return names[index] if 0 <= index < len(names) else f"Speaker {index + 1}"
+    return default
+
+def _decode_body(body, encoding):
+    if not isinstance(body, str):
+        return body
+    if encoding in ('base64url', 'base64'):
+        try:
+            padded = body + '=' * (-len(body) % 4)
+            raw = base64.urlsafe_b64decode(padded) if encoding == 'base64url' else base64.b64decode(padded)
+            return raw.decode('utf-8')
+        except (binascii.Error, ValueError):
+            return None
+    if encoding == 'json':
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body
+    return body
+
+def _dialog_text(dialog):
+    mimetype = dialog.get('mimetype') or 'text/plain'
+    if not mimetype.startswith('text/'):
+        return None
+    body = _decode_body(dialog.get('body'), dialog.get('encoding'))
+    return body.strip() if isinstance(body, str) else None
+
+def _transcript_lines(body, names, default_speaker):
+    """Turn a transcript analysis body (text or vendor JSON) into speaker lines"""
+    if isinstance(body, str):
+        return [body.strip()] if body.strip() else []
+    if isinstance(body, dict):
+        for key in ('utterances', 'segments', 'paragraphs', 'turns', 'results'):
+            if isinstance(body.get(key), list):
+                return _transcript_lines(body[key], names, default_speaker)
+        for key in ('transcript', 'text'):
+            if isinstance(body.get(key), str):
+                return _transcript_lines(body[key], names, default_speaker)
+        return []
+    lines = []
+    if isinstance(body, list):
+        for segment in body:
+            if isinstance(segment, str):
+                text = segment
+                speaker = default_speaker
+            elif isinstance(segment, dict):
+                text = segment.get('text') or segment.get('transcript')
+                speaker = _speaker_name(names, segment.get('speaker', segment.get('party')), default_speaker)
+            else:
+                continue
+            if isinstance(text, str) and text.strip():
+                lines.append(f"{speaker}: {text.strip()}" if speaker else text.strip())
+    return lines
+
+def transcript_from_vcon(data):
+    """Build a "Speaker: text" transcript from a decoded vCon document"""
+    names = party_names(data.get('parties'))
+    dialogs = data.get('dialog') if isinstance(data.get('dialog'), list) else []
+
+    # Transcripts of recordings live in analysis entries that point at a dialog
+    analysis_lines = {}
+    for entry in data.get('analysis') if isinstance(data.get('analysis'), list) else []:
+        if not isinstance(entry, dict) or entry.get('type') not in TRANSCRIPT_ANALYSIS_TYPES:
+            continue
+        dialog_index = _party_index(entry.get('dialog'))
+        dialog = dialogs[dialog_index] if dialog_index is not None and 0 <= dialog_index < len(dialogs) else None
+        parties = dialog.get('parties') if isinstance(dialog, dict) else None
+        # Only a single-party dialog tells us who is speaking
+        speaker = _speaker_name(names, parties, None) if isinstance(parties, int) else None
+        body = _decode_body(entry.get('body'), entry.get('encoding'))
+        analysis_lines.setdefault(dialog_index, []).extend(_transcript_lines(body, names, speaker))
+
+    lines = []
+    for index, dialog in enumerate(dialogs):
+        if not isinstance(dialog, dict):
+            continue
+        if dialog.get('type', 'text') == 'text':
+            text = _dialog_text(dialog)
+            if text:
+                speaker = _speaker_name(names, dialog.get('originator', dialog.get('parties')))
+                lines.append(f"{speaker}: {text}")
+        lines.extend(analysis_lines.pop(index, []))
+    for remaining in analysis_lines.values():
+        lines.extend(remaining)
+
+    return "\n\n".join(lines)
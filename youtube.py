@@ -0,0 +1,238 @@
+"""YouTube transcript ingestion with one fetch per video
+
+Every form of video link (watch?v=, youtu.be/, embed/, shorts/, ...) is
+reduced to the 11-character video id, which keys a transcript cache, so
+a recording pasted again is served without fetching it. Concurrent
+requests for a video that is not cached yet wait on a single in-flight
+fetch, and lists of videos (a playlist) are fetched on a bounded pool.
+
+A fetcher has a `name` (part of the cache key) and one method,
+`fetch(video_id)`, that returns the transcript text. HttpFetcher asks a
+transcript service (anything answering `GET <url with the video id>`
+with text or JSON) over pooled keep-alive connections; pointed at a
+local fake server it stands in for the real thing in tests.
+PlaceholderFetcher returns a demonstration transcript; it sets
+`placeholder`, so its transcripts are never cached and are flagged as
+placeholders in responses.
+"""
+import http.client
+import json
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, quote, urlsplit
+
+import extract
+
+VIDEO_ID_REGEX = re.compile(r'[A-Za-z0-9_-]{11}')
+YOUTUBE_HOSTS = ('youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com')
+# Path prefixes followed by the video id
+ID_PATHS = ('embed', 'v', 'e', 'shorts', 'live')
+
+class FetchError(Exception):
+    """A transcript could not be fetched"""
+
+def video_id(url):
+    """Return the video id of a YouTube URL (or of a bare id), or None"""
+    url = url.strip()
+    if VIDEO_ID_REGEX.fullmatch(url):
+        return url
+    parts = urlsplit(url if '//' in url else '//' + url)
+    host = (parts.hostname or '').removeprefix('www.')
+    segments = [segment for segment in parts.path.split('/') if segment]
+    candidate = None
+    if host == 'youtu.be' and segments:
+        candidate = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments[:1] == ['watch'] or not segments:
+            candidate = parse_qs(parts.query).get('v', [None])[0]
+        elif len(segments) >= 2 and segments[0] in ID_PATHS:
+            candidate = segments[1]
+    return candidate if candidate and VIDEO_ID_REGEX.fullmatch(candidate) else None
+
+class PlaceholderFetcher:
+    """Return a demonstration transcript for any video"""
+
+    name = 'placeholder'
+    placeholder = True
+
+    def fetch(self, video_id):
+        return f"""[Processed from YouTube Video: {video_id}]
+
+Meeting Transcript - {datetime.now().strftime('%Y-%m-%d')}
+
+Note: This is a demonstration of YouTube processing. In production, this would:
+1. Use YouTube Data API to fetch video metadata
+2. Extract audio using youtube-dl or similar
+3. Process audio through speech-to-text service (Google Cloud Speech, AWS Transcribe, etc.)
+4. Return the actual transcript
+
+For now, here's a sample of what the processed content might look like:
+
+Project Manager: Welcome to our project discussion. We're reviewing the requirements for the new system.
+
+Client: Thank you for having us. We need a comprehensive solution that can handle our growing business needs.
+
+Developer: What are the main challenges you're facing with your current setup?
+
+Client: Our current system is outdated and doesn't scale well. We need something modern and efficient.
+
+Project Manager: What's your target timeline for this project?
+
+Client: We're hoping to have everything ready within 6 months.
+
+[End of processed transcript]"""
+
+class HttpFetcher:
+    """Fetch transcripts from an HTTP service over a bounded pool of keep-alive connections
+
+    url_template holds `{video_id}`, e.g. `http://transcripts.internal/youtube/{video_id}`.
+    The service answers with the transcript as text, or as JSON in one of the
+    layouts extract.py knows (a `transcript` field, Whisper segments, ...).
+    """
+
+    name = 'http'
+    placeholder = False
+
+    def __init__(self, url_template, max_connections=8, timeout=60):
+        parts = urlsplit(url_template)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url_template}")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.target = parts.path + (f'?{parts.query}' if parts.query else '')
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def fetch(self, video_id):
+        target = self.target.format(video_id=quote(video_id))
+        with self.slots:
+            with self.lock:
+                connection = self.idle.pop() if self.idle else None
+            try:
+                if connection is not None:
+                    try:
+                        return self._get(connection, target)
+                    except (http.client.HTTPException, ConnectionError):
+                        # The server closed an idle keep-alive connection; retry on a fresh one
+                        connection.close()
+                return self._get(self.connection_class(self.netloc, timeout=self.timeout), target)
+            except (http.client.HTTPException, OSError) as e:
+                raise FetchError(f"Could not fetch the transcript of {video_id}: {e}") from e
+
+    def close(self):
+        """Close the idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def _get(self, connection, target):
+        try:
+            connection.request('GET', target, headers={'Accept': 'application/json, text/plain'})
+            response = connection.getresponse()
+            body = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                self.idle.append(connection)
+        if response.status != 200:
+            raise FetchError(f"Transcript service answered {response.status} for {target}")
+        return self._transcript(body, response.getheader('Content-Type', ''))
+
+    def _transcript(self, body, content_type):
+        text = body.decode('utf-8', errors='replace')
+        if 'json' not in content_type:
+            return text
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise FetchError(f"The transcript service sent invalid JSON: {e}") from e
+        if isinstance(data, dict) and isinstance(data.get('transcript'), str):
+            return data['transcript']
+        transcript = extract.selected_transcript(data)
+        if transcript is None:
+            raise FetchError("The transcript service response holds no transcript")
+        return transcript
+
+class YouTubeTranscripts:
+    """Transcripts of YouTube videos, cached by video id and fetched once however many ask at a time"""
+
+    def __init__(self, fetcher, cache, workers=8):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.workers = workers
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.counts = {'hit': 0, 'shared': 0, 'fetch': 0, 'error': 0}
+
+    @property
+    def placeholder(self):
+        """True if the fetcher only makes up demonstration transcripts"""
+        return self.fetcher.placeholder
+
+    def get(self, url):
+        """Return (video id, transcript) of a video URL; raises ValueError for other URLs and FetchError"""
+        vid = video_id(url)
+        if vid is None:
+            raise ValueError(f"Not a YouTube video URL: {url}")
+        key = f"{self.fetcher.name}:{vid}"
+        # Demonstration transcripts are not worth keeping, nor mistaking for real ones later
+        transcript = None if self.placeholder else self.cache.get(key)
+        if transcript is not None:
+            self._count('hit')
+            return vid, transcript
+
+        with self.lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if not owner:
+            self._count('shared')
+            return vid, future.result()
+
+        try:
+            # A fetch that finished after the lookup above has already cached it
+            transcript = None if self.placeholder else self.cache.get(key)
+            if transcript is None:
+                self._count('fetch')
+                transcript = self.fetcher.fetch(vid)
+                if not self.placeholder:
+                    self.cache.put(key, transcript)
+            future.set_result(transcript)
+        except BaseException as e:
+            self._count('error')
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+        return vid, transcript
+
+    def get_many(self, urls):
+        """Fetch the transcripts of many URLs on the bounded pool; return a (video id, transcript, error) per URL"""
+        def fetch(url):
+            try:
+                return self.get(url) + (None,)
+            except (ValueError, FetchError) as e:
+                return video_id(url), None, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='youtube') as executor:
+            return list(executor.map(fetch, urls))
+
+    def stats(self):
+        """Return lookups by outcome: cache hit, shared in-flight fetch, fetch, failed fetch"""
+        with self.lock:
+            return dict(self.counts, inflight=len(self.inflight))
+
+    def _count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1